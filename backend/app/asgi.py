@@ -0,0 +1,385 @@
+"""
+Point d'entrée ASGI (asyncio) de l'API HealthGuard.
+
+Expose les mêmes routes que l'application Flask (``/health``, ``/health/live``,
+``/health/ready``, ``/api/predict``, ``/api/predict/batch``, ``/api/screen``,
+``/api/models``, ``/api/results``, ``/api/admin/reload``, ``/``) et partage les
+mêmes services (``services.py``). Les uploads sont reçus sans bloquer la boucle
+d'événements ; le décodage et l'inférence tournent sur un pool de threads borné.
+Un seul processus peut ainsi garder des milliers de connexions mobiles lentes ouvertes.
+
+``/api/predict/batch`` réutilise le pipeline synchrone de la route Flask dans un
+thread du pool : le corps lui est transmis morceau par morceau depuis la boucle,
+et chaque ligne NDJSON est renvoyée au client dès qu'elle est produite.
+
+Lancement :
+    uvicorn app.asgi:app --host 0.0.0.0 --port 5000 --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 4 app.asgi:app
+"""
+import json
+import time
+import asyncio
+import logging
+import threading
+import weakref
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_options_header
+
+from .config import settings
+from .history import HistoryUnavailable
+from .metrics import record_request, render_metrics
+from .services import (
+    check_rate_limit,
+    history,
+    is_admin,
+    predict_batch_lines,
+    predict_bytes,
+    registry,
+    reject_upload,
+    request_deadline,
+    request_reload,
+    retry_headers,
+    screen_bytes,
+    startup,
+    tracer,
+)
+from .tracing import span
+from .uploads import BoundedStream, SingleUploadReader, batch_uploads, check_batch_size, check_request_size
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.ASGI_EXECUTOR_WORKERS, thread_name_prefix='asgi-inference')
+
+# asyncio primitives are bound to one event loop: one semaphore per loop
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+class ClientDisconnected(Exception):
+    """Le client a fermé la connexion avant la fin du corps de la requête."""
+
+
+def _pending_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _slots.get(loop)
+    if slots is None:
+        slots = _slots[loop] = asyncio.Semaphore(settings.ASGI_MAX_PENDING)
+    return slots
+
+
+async def run_blocking(func, *args):
+    """Exécute ``func`` sur le pool borné ; au plus ASGI_MAX_PENDING appels en attente."""
+    # run_in_executor does not carry contextvars over: the request's trace would be lost
+    call = functools.partial(contextvars.copy_context().run, func, *args)
+    async with _pending_slots():
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+async def send_json(send, payload, status: int = 200, headers: dict = None) -> None:
+    body = json.dumps(payload).encode('utf-8')
+    await send_body(send, body, status, b'application/json', headers)
+
+
+async def send_body(send, body: bytes, status: int, content_type: bytes, headers: dict = None) -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())] +
+                   [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in (headers or {}).items()],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def iter_body(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        yield message.get('body', b'')
+        if not message.get('more_body', False):
+            return
+
+
+class BlockingBody:
+    """Corps de la requête vu comme un flux ``read()`` synchrone, pour un thread du pool.
+
+    Chaque lecture attend le message suivant de ``receive`` sur la boucle
+    d'événements ; ne jamais l'appeler depuis la boucle elle-même.
+    """
+
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop):
+        self._receive = receive
+        self._loop = loop
+        self._buf = b''
+        self._done = False
+
+    def _next(self) -> None:
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        self._buf += message.get('body', b'')
+        self._done = not message.get('more_body', False)
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._done and (size is None or size < 0 or len(self._buf) < size):
+            self._next()
+            if self._buf and size is not None and size >= 0:
+                break  # short reads are fine for every reader here
+        if size is None or size < 0:
+            size = len(self._buf)
+        chunk, self._buf = self._buf[:size], self._buf[size:]
+        return chunk
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return ''
+
+
+async def health_check(scope, receive, send):
+    await send_json(send, {"status": "healthy"})
+
+
+async def liveness(scope, receive, send):
+    await send_json(send, {"status": "alive"})
+
+
+async def readiness(scope, receive, send):
+    await send_json(send, startup.status(), 200 if startup.ready else 503)
+
+
+def _client_key(scope) -> str:
+    """Clé de limitation de débit : en-tête RATE_LIMIT_KEY_HEADER, sinon IP du client."""
+    address = (scope.get('client') or ('',))[0]
+    if settings.RATE_LIMIT_KEY_HEADER:
+        return _header(scope, settings.RATE_LIMIT_KEY_HEADER.lower().encode('latin-1')) or address
+    return address
+
+
+def _query(scope) -> dict:
+    return parse_qs(scope.get('query_string', b'').decode('latin-1'))
+
+
+async def read_upload(scope, receive):
+    """Lit le champ 'file' du corps multipart ; retourne (upload, None) ou (None, (corps, code HTTP)).
+
+    Même borne que la route Flask : 413 d'après Content-Length sans lire le corps,
+    et la lecture s'arrête dès que le fichier est complet ou la limite dépassée.
+    """
+    length = _header(scope, b'content-length')
+    error = check_request_size(int(length) if length.isdigit() else None)
+    if error is not None:
+        return None, reject_upload(*error)
+
+    mimetype, params = parse_options_header(_header(scope, b'content-type'))
+    if mimetype != 'multipart/form-data' or not params.get('boundary'):
+        return None, reject_upload("No file part", 400)
+
+    reader = SingleUploadReader(params['boundary'].encode('latin-1'))
+    async for chunk in iter_body(receive):
+        if reader.feed(chunk):
+            break
+    if not reader.done:
+        reader.feed(None)
+
+    upload = reader.upload
+    if upload is None:
+        return None, reject_upload("No file part", 400)
+    if upload.error is not None:
+        # Same content-type / size rules as the Flask route (uploads.validate_upload)
+        return None, reject_upload(upload.error, upload.status)
+    return upload, None
+
+
+async def predict(scope, receive, send):
+    """Même contrat que la route Flask : champ 'file' en multipart/form-data,
+    400 si invalide, 413 si fichier trop volumineux, 429 / 503 (Retry-After) sous charge."""
+    deadline = request_deadline(time.perf_counter())
+    limited = check_rate_limit(_client_key(scope))
+    if limited is not None:
+        return await send_json(send, *limited, retry_headers(limited[0]))
+
+    with span("upload_read"):
+        upload, rejected = await read_upload(scope, receive)
+    if rejected is not None:
+        return await send_json(send, *rejected)
+    model = _query(scope).get('model', [None])[0]
+    payload, status = await run_blocking(predict_bytes, upload.data, model, deadline)
+    await send_json(send, payload, status, retry_headers(payload))
+
+
+async def predict_batch(scope, receive, send):
+    """Même contrat que la route Flask : fichiers multipart ou archive zip/tar, flux NDJSON."""
+    model = _query(scope).get('model', [None])[0]
+    if model not in registry:
+        return await send_json(send, {"success": False, "error": "Unknown model"}, 404)
+
+    length = _header(scope, b'content-length')
+    error = check_batch_size(int(length) if length.isdigit() else None, settings.PREDICT_BATCH_MAX_BYTES)
+    if error is not None:
+        return await send_json(send, *reject_upload(*error))
+
+    loop = asyncio.get_running_loop()
+    stream = BoundedStream(BlockingBody(receive, loop), settings.PREDICT_BATCH_MAX_BYTES)
+    mimetype, params = parse_options_header(_header(scope, b'content-type'))
+    uploads, error = batch_uploads(mimetype, params.get('boundary'), stream)
+    if error is not None:
+        return await send_json(send, {"success": False, "error": error[0]}, error[1])
+
+    # Bounded: a slow client slows down the pipeline instead of piling up lines
+    lines: "asyncio.Queue" = asyncio.Queue(maxsize=settings.PREDICT_BATCH_MAX_IN_FLIGHT)
+    stopped = threading.Event()
+
+    def produce():
+        records = predict_batch_lines(uploads, model)
+        try:
+            for line in records:
+                if stopped.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(lines.put(line.encode('utf-8')), loop).result()
+        finally:
+            records.close()
+            if not stopped.is_set():
+                asyncio.run_coroutine_threadsafe(lines.put(None), loop).result()
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/x-ndjson')]})
+    producer = asyncio.ensure_future(run_blocking(produce))
+    try:
+        while True:
+            line = await lines.get()
+            if line is None:
+                break
+            await send({'type': 'http.response.body', 'body': line, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        await producer
+    finally:
+        # Client gone: unblock the producer thread so it can stop
+        stopped.set()
+        while not lines.empty():
+            lines.get_nowait()
+
+
+async def screen(scope, receive, send):
+    deadline = request_deadline(time.perf_counter())
+    limited = check_rate_limit(_client_key(scope))
+    if limited is not None:
+        return await send_json(send, *limited, retry_headers(limited[0]))
+
+    upload, rejected = await read_upload(scope, receive)
+    if rejected is not None:
+        return await send_json(send, *rejected)
+    models = [m for m in _query(scope).get('models', [''])[0].split(',') if m]
+    payload, status = await run_blocking(screen_bytes, upload.data, models, deadline)
+    await send_json(send, payload, status, retry_headers(payload))
+
+
+async def metrics(scope, receive, send):
+    body, content_type = await run_blocking(render_metrics)
+    await send_body(send, body, 200, content_type.encode('latin-1'))
+
+
+async def list_models(scope, receive, send):
+    await send_json(send, registry.stats())
+
+
+async def reload_model(scope, receive, send):
+    if not is_admin(_header(scope, b'authorization')):
+        return await send_json(send, {"success": False, "error": "Forbidden"}, 403)
+    payload, status = request_reload(_query(scope).get('model', [registry.default])[0])
+    await send_json(send, payload, status)
+
+
+async def get_results(scope, receive, send):
+    query = _query(scope)
+    try:
+        limit = int(query.get('limit', ['50'])[0])
+    except ValueError:
+        limit = 50
+    try:
+        # May hit MongoDB: keep it off the event loop
+        page = await run_blocking(history.page, limit, query.get('cursor', [None])[0])
+    except ValueError as e:
+        return await send_json(send, {"success": False, "error": str(e)}, 400)
+    except HistoryUnavailable as e:
+        return await send_json(send, {"success": False, "error": str(e)}, 503)
+    await send_json(send, page)
+
+
+async def serve_frontend(scope, receive, send):
+    try:
+        with open('/app/frontend/index.html', 'rb') as f:
+            body = f.read()
+    except Exception:
+        return await send_json(send, {"message": "Frontend not available"}, 404)
+    await send_body(send, body, 200, b'text/html')
+
+
+ROUTES = {
+    ('GET', '/health'): health_check,
+    ('GET', '/health/live'): liveness,
+    ('GET', '/health/ready'): readiness,
+    ('POST', '/api/predict'): predict,
+    ('POST', '/api/predict/batch'): predict_batch,
+    ('POST', '/api/screen'): screen,
+    ('GET', '/api/models'): list_models,
+    ('GET', '/api/results'): get_results,
+    ('POST', '/api/admin/reload'): reload_model,
+    ('GET', '/metrics'): metrics,
+    ('GET', '/'): serve_frontend,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        allowed = any(path == scope['path'] for _, path in ROUTES)
+        status = 405 if allowed else 404
+        return await send_json(send, {"error": "Method Not Allowed" if allowed else "Not Found"}, status)
+
+    start = time.perf_counter()
+    status = 500
+    trace = None
+    if scope['path'].startswith('/api/'):
+        model = _query(scope).get('model', [None])[0]
+        trace = tracer.begin(f"{scope['method']} {scope['path']}", _header(scope, b'traceparent'), model=model)
+
+    async def send_with_status(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            if trace is not None:
+                message = {**message, 'headers': [*message.get('headers', []),
+                                                  (b'x-trace-id', trace.trace_id.encode('latin-1'))]}
+        await send(message)
+
+    try:
+        await handler(scope, receive, send_with_status)
+    except ClientDisconnected:
+        logger.info("Client disconnected during %s %s", scope['method'], scope['path'])
+        status = 499
+    finally:
+        if scope['path'] != '/metrics':
+            record_request(scope['path'], scope['method'], status, time.perf_counter() - start)
+        tracer.finish(trace, **{"http.status_code": status})
@@ -0,0 +1,216 @@
+"""
+Micro-batching dynamique devant MLService.
+
+Les requêtes concurrentes sont regroupées jusqu'à ``max_batch_size`` images ou
+``max_wait_ms`` millisecondes, puis exécutées en un seul ``invoke()`` sur un
+tenseur (N, H, W, C). La sortie (N, C) est redistribuée à chaque appelant.
+
+N est complété jusqu'à l'une des tailles fixes de ``batch_buckets`` (allouées
+au préchauffage) : l'interpréteur ne réalloue pas ses tenseurs à chaque lot.
+"""
+import time
+import queue
+import threading
+import logging
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .admission import DeadlineExceeded, current_deadline, expired
+from .metrics import BATCH_SIZE, QUEUE_WAIT_SECONDS
+from .tracing import activate, current_traces, record_span
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Without BATCH_MAX_SIZE nor a tuned batch size (tuning.json)
+DEFAULT_MAX_BATCH_SIZE = 8
+
+
+def batch_buckets(max_batch_size: int) -> Tuple[int, ...]:
+    """Tailles de lot exécutées : puissances de deux inférieures à ``max_batch_size``, plus celle-ci."""
+    sizes = {max_batch_size}
+    n = 1
+    while n < max_batch_size:
+        sizes.add(n)
+        n *= 2
+    return tuple(sorted(sizes))
+
+
+class _Pending:
+    __slots__ = ("array", "future", "enqueued_at", "traces", "deadline")
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        # The dispatch thread does not inherit the request's context
+        self.traces = current_traces()
+        self.deadline = current_deadline()
+
+
+class BatchScheduler:
+    """Regroupe les requêtes concurrentes en lots pour MLService.
+
+    Expose la même méthode ``analyze_bytes`` que MLService : le décodage reste
+    dans le thread de la requête, seule l'inférence est mise en lot.
+    """
+
+    def __init__(self, service, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: float = 5.0,
+                 workers: Optional[int] = None, timeout: Optional[float] = None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size doit être >= 1")
+
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.buckets = batch_buckets(max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+
+        self._queue: "queue.Queue" = queue.Queue()
+
+        # Batch metrics
+        self._stats_lock = threading.Lock()
+        self.batch_sizes: Counter = Counter()
+        self.items = 0
+        self.padded = 0
+        self.cancelled = 0
+        self.queue_wait_ms_total = 0.0
+
+        # One dispatcher per pooled interpreter so batches can run in parallel
+        workers = workers or getattr(getattr(service, "pool", None), "size", 1)
+        self._threads = [
+            threading.Thread(target=self._dispatch_loop, name=f"batch-dispatch-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+        logger.info(
+            "BatchScheduler started (max_batch_size=%d, max_wait_ms=%.1f, workers=%d)",
+            max_batch_size, max_wait_ms, workers
+        )
+
+    def submit(self, array: np.ndarray) -> Future:
+        """Met en file une entrée prétraitée (H, W, C) ; le Future reçoit (probs, idx, confidence, risk)."""
+        pending = _Pending(array)
+        self._queue.put(pending)
+        return pending.future
+
+    def analyze_bytes(self, image_bytes: bytes) -> dict:
+        start = time.time()
+        return self.analyze_array(self.service.decode(image_bytes), start)
+
+    def analyze_array(self, arr: np.ndarray, start: float = None) -> dict:
+        start = time.time() if start is None else start
+        future = self.submit(self.service.normalize(arr))
+        try:
+            probs, idx, confidence, risk = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Nobody will read the answer: the dispatcher skips it if it is still queued
+            future.cancel()
+            raise
+        latency_ms = int((time.time() - start) * 1000)
+        return self.service.format_result(probs, idx, confidence, risk, latency_ms)
+
+    def _collect(self, first: _Pending) -> List[_Pending]:
+        batch = [first]
+        # The wait budget starts when the oldest request arrived, not when we dequeued it
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Leave the sentinel for this thread's next loop iteration
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+
+            # Dynamic-shape models may yield different (H, W) per image: one invoke per shape
+            groups = {}
+            for item in batch:
+                groups.setdefault(item.array.shape, []).append(item)
+            for group in groups.values():
+                self._run(group)
+
+    def _run(self, batch: List[_Pending]) -> None:
+        # Requests cancelled by their caller or past their deadline are dropped before invoke()
+        live = []
+        for item in batch:
+            if not item.future.set_running_or_notify_cancel():
+                with self._stats_lock:
+                    self.cancelled += 1
+            elif expired(item.deadline):
+                item.future.set_exception(DeadlineExceeded("Request deadline exceeded before inference"))
+            else:
+                live.append(item)
+        if not live:
+            return
+        batch = live
+        n = len(batch)
+        size = next(b for b in self.buckets if b >= n)
+        started = time.monotonic()
+        with self._stats_lock:
+            self.batch_sizes[n] += 1
+            self.items += n
+            self.padded += size - n
+            self.queue_wait_ms_total += sum((started - item.enqueued_at) * 1000 for item in batch)
+        BATCH_SIZE.observe(n)
+        traces = ()
+        for item in batch:
+            QUEUE_WAIT_SECONDS.labels(queue="batch").observe(started - item.enqueued_at)
+            if item.traces:
+                with activate(item.traces):
+                    record_span("queue_wait", started - item.enqueued_at, queue="batch", batch_size=n)
+                traces += item.traces
+
+        try:
+            # Padding rows stay zero; their outputs are sliced off
+            first = batch[0].array
+            input_data = np.zeros((size,) + first.shape, dtype=first.dtype)
+            for i, item in enumerate(batch):
+                input_data[i] = item.array
+            # invoke / postprocess spans go to the trace of every request in the batch
+            with activate(traces):
+                output = self.service.run_batch(input_data)
+                probs, idx, confidence, risk = self.service.postprocess_batch(np.asarray(output)[:n], n)
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        for i, item in enumerate(batch):
+            item.future.set_result((probs[i], idx[i], confidence[i], risk[i]))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "batches": batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / batches, 2) if batches else 0.0,
+                "padded_slots": self.padded,
+                "cancelled": self.cancelled,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+                "avg_queue_wait_ms": round(self.queue_wait_ms_total / self.items, 2) if self.items else 0.0,
+            }
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
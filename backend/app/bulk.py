@@ -0,0 +1,87 @@
+"""
+Pipeline de prédiction par lots pour ``/api/predict/batch``.
+
+Les images sont décodées et analysées en parallèle sur un pool de threads ;
+au plus ``max_in_flight`` images sont en mémoire à la fois, quelle que soit la
+taille du lot. Chaque résultat est produit dès qu'il est prêt (ordre de fin,
+l'index d'origine est conservé dans l'enregistrement).
+"""
+import time
+import logging
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Callable, Iterable, Iterator
+
+from .decoding import ImageTooLarge
+from .interpreter_pool import InterpreterPoolTimeout
+from .uploads import Upload
+
+logger = logging.getLogger(__name__)
+
+
+def _record(index: int, upload: Upload, future=None) -> dict:
+    record = {"index": index, "filename": upload.filename}
+    if future is None:
+        record.update(success=False, error=upload.error, status=upload.status)
+        return record
+    try:
+        record.update(success=True, diagnosis=future.result())
+    except ValueError as e:
+        record.update(success=False, error=str(e), status=413 if isinstance(e, ImageTooLarge) else 400)
+    except (InterpreterPoolTimeout, TimeoutError):
+        record.update(success=False, error="Server busy, retry later", status=503)
+    except Exception:
+        logger.exception("Batch item failed (%s)", upload.filename)
+        record.update(success=False, error="Inference error", status=500)
+    return record
+
+
+def stream_predictions(uploads: Iterable[Upload], analyze: Callable[[bytes], dict], executor: Executor,
+                       max_in_flight: int = 8, max_files: int = 1000) -> Iterator[dict]:
+    """Produit un enregistrement par image puis un enregistrement ``summary`` final.
+
+    ``uploads`` n'est consommé que lorsqu'une place se libère dans la fenêtre,
+    ce qui borne la mémoire et applique une contre-pression sur la lecture du corps.
+    """
+    start = time.time()
+    pending = {}
+    total = succeeded = 0
+
+    def drain(block_until_one: bool):
+        nonlocal succeeded
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED) if block_until_one else \
+            ([f for f in pending if f.done()], None)
+        for future in done:
+            index, upload = pending.pop(future)
+            record = _record(index, upload, future)
+            succeeded += record["success"]
+            yield record
+
+    for index, upload in enumerate(uploads):
+        if index >= max_files:
+            yield {"index": index, "filename": upload.filename, "success": False,
+                   "error": f"Batch limited to {max_files} files", "status": 413}
+            total += 1
+            break
+        total += 1
+
+        if upload.data is None:
+            yield _record(index, upload)
+        else:
+            # Executor threads do not inherit contextvars: carry the request's trace over
+            pending[executor.submit(contextvars.copy_context().run, analyze, upload.data)] = (index, upload)
+            upload.data = None  # the executor task holds the only reference
+
+        yield from drain(block_until_one=len(pending) >= max_in_flight)
+
+    while pending:
+        yield from drain(block_until_one=True)
+
+    yield {"summary": {
+        "total": total,
+        "succeeded": succeeded,
+        "failed": total - succeeded,
+        "elapsed_ms": int((time.time() - start) * 1000),
+    }}
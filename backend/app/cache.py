@@ -0,0 +1,178 @@
+"""
+Cache des prédictions adressé par contenu.
+
+La clé est le SHA-256 des octets de l'image combiné à la version du modèle :
+une même photo ré-envoyée ne repasse ni par le décodage ni par ``invoke()``.
+Niveau 1 : LRU en mémoire (taille + TTL). Niveau 2 optionnel : Redis partagé
+entre workers. Les requêtes identiques concurrentes sont fusionnées : une
+seule inférence s'exécute, les autres attendent son résultat.
+"""
+import copy
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(image_bytes: bytes, model_version: str) -> str:
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{model_version}:{digest}"
+
+
+class LRUCache:
+    """LRU thread-safe borné en nombre d'entrées, avec expiration (TTL)."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                record_cache("expiration")
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+                record_cache("eviction")
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisTier:
+    """Niveau partagé sur Redis ; toute erreur Redis est traitée comme un miss."""
+
+    def __init__(self, url: str, ttl_seconds: float = 3600, prefix: str = "healthguard:pred:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+        self.ttl = int(ttl_seconds)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            logger.debug("Redis cache get failed", exc_info=True)
+            return None
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, value: dict) -> None:
+        try:
+            self.client.setex(self.prefix + key, self.ttl, json.dumps(value))
+        except Exception:
+            logger.debug("Redis cache set failed", exc_info=True)
+
+
+class CachedPredictor:
+    """Enveloppe un service d'inférence (``analyze_bytes``) avec cache et coalescence."""
+
+    def __init__(self, service, model_version: str, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 redis_tier: Optional[RedisTier] = None):
+        self.service = service
+        self.model_version = model_version
+        self.local = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.redis = redis_tier
+
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    _OUTCOMES = {"hits": "hit", "redis_hits": "redis_hit", "misses": "miss", "coalesced": "coalesced"}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        record_cache(self._OUTCOMES[name])
+
+    @staticmethod
+    def _mark_cached(result: dict) -> dict:
+        result = copy.deepcopy(result)
+        if isinstance(result.get("diagnosis"), dict):
+            result["diagnosis"]["cached"] = True
+        return result
+
+    def analyze_bytes(self, image_bytes: bytes) -> dict:
+        key = content_key(image_bytes, self.model_version)
+
+        cached = self.local.get(key)
+        if cached is not None:
+            self._count("hits")
+            return self._mark_cached(cached)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            self._count("coalesced")
+            return self._mark_cached(future.result())
+
+        try:
+            result = self.redis.get(key) if self.redis is not None else None
+            if result is not None:
+                self._count("redis_hits")
+                self.local.set(key, result)
+                future.set_result(result)
+                return self._mark_cached(result)
+
+            self._count("misses")
+            result = self.service.analyze_bytes(image_bytes)
+            self.local.set(key, copy.deepcopy(result))
+            if self.redis is not None:
+                self.redis.set(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # Waiters get the same error; nothing is cached
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.local.evictions,
+                "expirations": self.local.expirations,
+                "entries": len(self.local),
+                "hit_rate": round((self.hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+            }
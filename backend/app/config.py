@@ -21,16 +21,93 @@ class Settings(BaseSettings):
     # Database
     MONGO_URI: str = os.getenv('MONGO_URI', 'mongodb://localhost:27017/healthguard')
     MONGO_DB_NAME: str = os.getenv('MONGO_DB_NAME', 'healthguard')
+    MONGO_ENABLED: bool = os.getenv('MONGO_ENABLED', 'False').lower() == 'true'
+    MONGO_COLLECTION: str = os.getenv('MONGO_COLLECTION', 'predictions')
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv('MONGO_MAX_POOL_SIZE', 10))
+    
+    # Historique (tampon circulaire en mémoire + écriture MongoDB par lots)
+    HISTORY_MAX_ENTRIES: int = int(os.getenv('HISTORY_MAX_ENTRIES', 1000))
+    HISTORY_BATCH_SIZE: int = int(os.getenv('HISTORY_BATCH_SIZE', 100))
+    HISTORY_FLUSH_INTERVAL: float = float(os.getenv('HISTORY_FLUSH_INTERVAL', 1.0))
+    HISTORY_QUEUE_SIZE: int = int(os.getenv('HISTORY_QUEUE_SIZE', 10000))
     
     # Logging
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FORMAT: str = os.getenv('LOG_FORMAT', 'json')  # json ou text
+    LOG_QUEUE_SIZE: int = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # au-delà, enregistrements abandonnés
+    # Log "Inference done" : fraction échantillonnée, et toujours au-delà de LOG_SLOW_INFERENCE_MS
+    LOG_INFERENCE_SAMPLE_RATE: float = float(os.getenv('LOG_INFERENCE_SAMPLE_RATE', 0.01))
+    LOG_SLOW_INFERENCE_MS: float = float(os.getenv('LOG_SLOW_INFERENCE_MS', 500))
+    
+    # Traces par requête (OTLP/JSON) : none, file (TRACE_FILE) ou otlp (TRACE_OTLP_ENDPOINT)
+    TRACE_EXPORTER: str = os.getenv('TRACE_EXPORTER', 'none')
+    TRACE_SAMPLE_RATE: float = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))
+    TRACE_FILE: str = os.getenv('TRACE_FILE', '')  # logs/traces.jsonl si vide
+    TRACE_OTLP_ENDPOINT: str = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACE_QUEUE_SIZE: int = int(os.getenv('TRACE_QUEUE_SIZE', 2048))
     
     # ML Models
     MODELS_PATH: str = os.getenv('MODELS_PATH', './ml')
     CONFIDENCE_THRESHOLD: float = float(os.getenv('CONFIDENCE_THRESHOLD', 0.75))
+    WARMUP_ENABLED: bool = os.getenv('WARMUP_ENABLED', 'True').lower() == 'true'  # /health/ready après préchauffage
+    WARMUP_MODELS: str = os.getenv('WARMUP_MODELS', '')  # liste séparée par des virgules, vide = tous
+    MODEL_WATCH_INTERVAL: float = float(os.getenv('MODEL_WATCH_INTERVAL', 5))  # rechargement à chaud, 0 = désactivé
+    DEFAULT_MODEL: str = os.getenv('DEFAULT_MODEL', 'anemia')  # modèle utilisé sans ?model=
+    MODEL_MEMORY_BUDGET_MB: float = float(os.getenv('MODEL_MEMORY_BUDGET_MB', 512))  # 0 = illimité
+    IMAGE_DECODER: str = os.getenv('IMAGE_DECODER', 'auto')  # auto, pil, pil-draft, opencv
+    ZERO_COPY_INPUT: bool = os.getenv('ZERO_COPY_INPUT', 'True').lower() == 'true'
+    MAX_IMAGE_PIXELS: int = int(os.getenv('MAX_IMAGE_PIXELS', 50_000_000))  # lu dans l'en-tête, avant décodage
+    
+    # Inference (0 = auto, calculé depuis les CPU disponibles / WEB_CONCURRENCY)
+    WEB_CONCURRENCY: int = int(os.getenv('WEB_CONCURRENCY', 4))
+    INTERPRETER_POOL_SIZE: int = int(os.getenv('INTERPRETER_POOL_SIZE', 0))
+    INTERPRETER_NUM_THREADS: int = int(os.getenv('INTERPRETER_NUM_THREADS', 0))
+    INTERPRETER_CHECKOUT_TIMEOUT: float = float(os.getenv('INTERPRETER_CHECKOUT_TIMEOUT', 30))
+    RUNTIME_TUNING: bool = os.getenv('RUNTIME_TUNING', 'True').lower() == 'true'  # ml/<modèle>/tuning.json
+    
+    # Micro-batching (regroupe les requêtes concurrentes en un seul invoke)
+    BATCHING_ENABLED: bool = os.getenv('BATCHING_ENABLED', 'False').lower() == 'true'
+    BATCH_MAX_SIZE: int = int(os.getenv('BATCH_MAX_SIZE', 0))  # 0 = auto : tuning.json, sinon 8
+    BATCH_MAX_WAIT_MS: float = float(os.getenv('BATCH_MAX_WAIT_MS', 5))
+    
+    # /api/predict/batch (décodage parallèle, résultats NDJSON en flux)
+    PREDICT_BATCH_WORKERS: int = int(os.getenv('PREDICT_BATCH_WORKERS', 4))
+    PREDICT_BATCH_MAX_IN_FLIGHT: int = int(os.getenv('PREDICT_BATCH_MAX_IN_FLIGHT', 16))
+    PREDICT_BATCH_MAX_FILES: int = int(os.getenv('PREDICT_BATCH_MAX_FILES', 1000))
+    PREDICT_BATCH_MAX_BYTES: int = int(os.getenv('PREDICT_BATCH_MAX_BYTES', 512 * 1024 * 1024))  # corps complet
+    
+    # /api/screen (un décodage, modèles exécutés en parallèle)
+    SCREEN_WORKERS: int = int(os.getenv('SCREEN_WORKERS', 8))
+    
+    # Mode ASGI (app.asgi:app) : pool borné pour décodage + inférence
+    ASGI_EXECUTOR_WORKERS: int = int(os.getenv('ASGI_EXECUTOR_WORKERS', 8))
+    ASGI_MAX_PENDING: int = int(os.getenv('ASGI_MAX_PENDING', 256))
+    
+    # Contrôle d'admission de /api/predict : refus immédiat (503 + Retry-After) au-delà de la file
+    ADMISSION_MAX_CONCURRENT: int = int(os.getenv('ADMISSION_MAX_CONCURRENT', 0))  # par modèle ; 0 = interpréteurs x lot
+    ADMISSION_MAX_QUEUE: int = int(os.getenv('ADMISSION_MAX_QUEUE', 32))
+    ADMISSION_DEADLINE_MS: float = float(os.getenv('ADMISSION_DEADLINE_MS', 10000))  # 0 = pas d'échéance
+    ADMISSION_RETRY_AFTER: int = int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+    ADMISSION_MAX_WAIT_MS: float = float(os.getenv('ADMISSION_MAX_WAIT_MS', 10000))  # attente max d'une place, échéance ou non
+    
+    # Limitation de débit par client (seau à jetons, partagé via Redis si REDIS_ENABLED) ; 0 = désactivée
+    RATE_LIMIT_PER_SECOND: float = float(os.getenv('RATE_LIMIT_PER_SECOND', 0))
+    RATE_LIMIT_BURST: int = int(os.getenv('RATE_LIMIT_BURST', 10))
+    RATE_LIMIT_KEY_HEADER: str = os.getenv('RATE_LIMIT_KEY_HEADER', '')  # IP du client si vide
+    
+    # Cache des prédictions (LRU local + Redis si REDIS_ENABLED)
+    CACHE_ENABLED: bool = os.getenv('CACHE_ENABLED', 'True').lower() == 'true'
+    CACHE_MAX_ENTRIES: int = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+    CACHE_TTL_SECONDS: float = float(os.getenv('CACHE_TTL_SECONDS', 3600))
+    
+    # Quasi-doublons (dHash) : photo ré-enregistrée, redimensionnée ou recompressée
+    NEAR_DUPLICATE_ENABLED: bool = os.getenv('NEAR_DUPLICATE_ENABLED', 'False').lower() == 'true'
+    NEAR_DUPLICATE_MAX_DISTANCE: int = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 4))  # bits sur 64
+    NEAR_DUPLICATE_MAX_ENTRIES: int = int(os.getenv('NEAR_DUPLICATE_MAX_ENTRIES', 4096))
+    NEAR_DUPLICATE_AUDIT_RATE: float = float(os.getenv('NEAR_DUPLICATE_AUDIT_RATE', 0.05))
     
     # Security
+    ADMIN_TOKEN: str = os.getenv('ADMIN_TOKEN', '')  # routes /api/admin/* désactivées si vide
     ENABLE_CORS: bool = os.getenv('ENABLE_CORS', 'True').lower() == 'true'
     CORS_ORIGINS: list = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:5000').split(',')
     
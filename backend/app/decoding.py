@@ -0,0 +1,183 @@
+"""
+Décodage d'images rapide pour l'inférence.
+
+Le modèle n'a besoin que de 224x224 pixels : pour un JPEG de téléphone, on
+décode directement à l'échelle réduite (1/2, 1/4, 1/8) la plus petite qui
+reste >= à l'entrée du modèle, via PIL ``draft()`` ou OpenCV
+``IMREAD_REDUCED_*``, puis on redimensionne. Les autres formats passent par
+le décodage PIL complet.
+
+Les dimensions sont lues dans l'en-tête avant tout décodage : une image au-delà
+du budget de pixels (petit fichier, dimensions énormes) est refusée sans
+qu'aucun pixel ne soit alloué.
+
+Tous les backends suivent les mêmes conventions que le chemin PIL historique :
+orientation EXIF ignorée, redimensionnement final par ``Image.resize``
+(bicubique). Les pixels ne sont pas identiques pour autant : le décodage DCT
+réduit (``draft`` / ``IMREAD_REDUCED_*``) diffère d'un décodage complet, et un
+modèle entraîné avec ``image_dataset_from_directory`` a vu un redimensionnement
+bilinéaire TensorFlow. Les tests bornent l'écart entre backends à moins de
+2 niveaux (sur 255) en moyenne par pixel, pas pixel à pixel.
+"""
+import io
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# OpenCV is optional (opencv-python-headless in requirements)
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from .metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+DECODERS = ("auto", "pil", "pil-draft", "opencv")
+
+_CV2_REDUCED = {
+    8: "IMREAD_REDUCED_COLOR_8",
+    4: "IMREAD_REDUCED_COLOR_4",
+    2: "IMREAD_REDUCED_COLOR_2",
+}
+
+# PIL's Image.resize default, used by the baseline and by training
+RESAMPLE = Image.BICUBIC
+
+
+class ImageTooLarge(ValueError):
+    """Dimensions (lues dans l'en-tête) au-delà du budget de pixels."""
+
+
+def sniff_format(data: bytes) -> str:
+    """Détecte le format à partir des octets magiques (sans décoder)."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "JPEG"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "PNG"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    return "OTHER"
+
+
+def reduction_factor(width: int, height: int, target: Tuple[int, int]) -> int:
+    """Plus grand facteur (1, 2, 4, 8) qui garde l'image >= à la taille cible."""
+    tw, th = target
+    for factor in (8, 4, 2):
+        if width // factor >= tw and height // factor >= th:
+            return factor
+    return 1
+
+
+def _open_header(data: bytes, max_pixels: Optional[int]) -> Image.Image:
+    """Ouvre l'image sans la décoder (PIL est paresseux) et vérifie ses dimensions."""
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        logger.warning(f"Image refusée avant décodage: {width}x{height} pixels (budget {max_pixels})")
+        raise ImageTooLarge(f"Image too large ({width}x{height} pixels, max {max_pixels})")
+    return img
+
+
+def _decode_pil(img: Image.Image, size: Optional[Tuple[int, int]], draft: bool, exact: bool = True) -> np.ndarray:
+    with stage_timer("decode"):
+        if draft and size is not None and img.format == "JPEG":
+            # JPEG DCT scaling: decodes straight to the smallest scale >= size
+            img.draft("RGB", size)
+        img = img.convert("RGB")
+    if exact and size is not None and img.size != size:
+        with stage_timer("resize"):
+            img = img.resize(size, RESAMPLE)
+    return np.asarray(img)
+
+
+def _decode_opencv(data: bytes, header_size: Tuple[int, int], size: Optional[Tuple[int, int]],
+                   exact: bool = True) -> np.ndarray:
+    flag = cv2.IMREAD_COLOR
+    if size is not None:
+        # The header size picks the reduction factor
+        factor = reduction_factor(*header_size, size)
+        if factor > 1:
+            flag = getattr(cv2, _CV2_REDUCED[factor])
+    # OpenCV applies the EXIF rotation by default; PIL (and training) does not
+    flag |= cv2.IMREAD_IGNORE_ORIENTATION
+
+    with stage_timer("decode"):
+        buf = np.frombuffer(data, dtype=np.uint8)
+        arr = cv2.imdecode(buf, flag)
+        if arr is None:
+            raise ValueError("OpenCV could not decode image")
+        arr = cv2.cvtColor(arr, cv2.COLOR_BGR2RGB)
+    if exact and size is not None:
+        arr = resize_image(arr, size)
+    return arr
+
+
+def resize_image(arr: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Redimensionne un tableau RGB uint8 à ``size`` (w, h), avec le même filtre que le chemin PIL."""
+    if (arr.shape[1], arr.shape[0]) == size:
+        return arr
+    with stage_timer("resize"):
+        return np.asarray(Image.fromarray(arr).resize(size, RESAMPLE))
+
+
+def resolve_decoder(decoder: str, fmt: str) -> str:
+    """Choisit le backend effectif pour un format donné."""
+    if decoder not in DECODERS:
+        raise ValueError(f"Unknown decoder '{decoder}' (expected one of {DECODERS})")
+    if decoder == "opencv" and cv2 is None:
+        decoder = "pil-draft"
+    if decoder == "auto":
+        if fmt == "JPEG":
+            return "opencv" if cv2 is not None else "pil-draft"
+        return "pil"
+    if fmt != "JPEG" and decoder == "pil-draft":
+        # draft() only applies to JPEG
+        return "pil"
+    return decoder
+
+
+def decode_image(data: bytes, size: Optional[Tuple[int, int]] = None, decoder: str = "auto",
+                 exact: bool = True, max_pixels: Optional[int] = None) -> np.ndarray:
+    """Décode ``data`` en tableau RGB uint8 (H, W, 3), redimensionné à ``size`` (w, h) si fourni.
+
+    Avec ``exact=False``, ``size`` n'est qu'une borne inférieure : l'image est
+    seulement réduite au décodage, sans redimensionnement final.
+    Lève ImageTooLarge au-delà de ``max_pixels`` (vérifié sur l'en-tête, avant
+    décodage) et ValueError si l'image est illisible.
+    """
+    backend = resolve_decoder(decoder, sniff_format(data))
+    try:
+        img = _open_header(data, max_pixels)
+        if backend == "opencv":
+            return _decode_opencv(data, img.size, size, exact)
+        return _decode_pil(img, size, draft=(backend == "pil-draft"), exact=exact)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        logger.warning("Invalid image provided")
+        raise ValueError("Invalid image file")
+
+
+def decode_images(data: bytes, sizes: Iterable[Tuple[int, int]], decoder: str = "auto",
+                  max_pixels: Optional[int] = None) -> Dict[Tuple[int, int], np.ndarray]:
+    """Décode ``data`` une seule fois pour plusieurs tailles d'entrée (w, h).
+
+    L'image est décodée à l'échelle réduite qui couvre la plus grande taille,
+    puis redimensionnée une fois par taille distincte.
+    """
+    sizes = set(sizes)
+    if not sizes:
+        return {}
+    if len(sizes) == 1:
+        size = sizes.pop()
+        return {size: decode_image(data, size, decoder, max_pixels=max_pixels)}
+    bound = (max(w for w, _ in sizes), max(h for _, h in sizes))
+    base = decode_image(data, bound, decoder, exact=False, max_pixels=max_pixels)
+    return {size: resize_image(base, size) for size in sizes}
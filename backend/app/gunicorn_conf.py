@@ -0,0 +1,31 @@
+"""
+Hooks gunicorn : gunicorn -c python:app.gunicorn_conf app.main:app
+
+Avec PROMETHEUS_MULTIPROC_DIR, chaque worker écrit ses métriques dans ce
+répertoire ; il est vidé au démarrage du master et les fichiers d'un worker
+terminé sont marqués morts pour que /metrics reste juste.
+
+Chaque worker démarre son propre thread de logging après le fork (``logger.py``).
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def post_fork(server, worker):
+    from .logger import setup_logging
+
+    setup_logging()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,218 @@
+"""
+Historique des prédictions.
+
+En mémoire : un tampon circulaire de taille fixe (plus de croissance illimitée
+par worker). Persistance optionnelle : un thread d'arrière-plan insère les
+résultats par lots dans MongoDB (``insert_many``), hors du chemin critique de
+la requête. Quand MongoDB est actif, ``/api/results`` est servi depuis la
+collection indexée, identique pour tous les workers, avec une pagination
+par curseur sur (``timestamp``, ``_id``), l'index de la collection. Si MongoDB
+est injoignable, ``page()`` lève HistoryUnavailable (503) au lieu d'une erreur 500.
+"""
+import time
+import queue
+import hashlib
+import itertools
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 500
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class HistoryUnavailable(RuntimeError):
+    """Historique MongoDB injoignable (``/api/results`` répond 503)."""
+
+
+def _summary(result: dict) -> dict:
+    """Champs indexés (schéma ARCHITECTURE.md) extraits d'un résultat d'inférence."""
+    diagnosis = result.get("diagnosis", result) if isinstance(result, dict) else {}
+    return {
+        "condition": diagnosis.get("condition"),
+        "risk_level": diagnosis.get("risk_level"),
+        "confidence": diagnosis.get("confidence"),
+        "model_version": diagnosis.get("model_version"),
+    }
+
+
+class MongoHistoryWriter:
+    """Écrit les documents dans MongoDB par lots depuis un thread d'arrière-plan.
+
+    ``submit()`` ne bloque jamais : si la file est pleine (MongoDB lent ou
+    indisponible), le document est abandonné et compté dans ``dropped``.
+    """
+
+    def __init__(self, collection, batch_size: int = 100, flush_interval: float = 1.0, max_queue: int = 10000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_uri(cls, uri: str, db_name: str, collection: str = "predictions", max_pool_size: int = 10, **kwargs):
+        from pymongo import ASCENDING, DESCENDING, MongoClient
+
+        client = MongoClient(uri, maxPoolSize=max_pool_size, serverSelectionTimeoutMS=2000, connect=False)
+        coll = client[db_name][collection]
+        writer = cls(coll, **kwargs)
+
+        def ensure_indexes():
+            try:
+                # Serves the (timestamp, _id) pagination of /api/results
+                coll.create_index([("timestamp", DESCENDING), ("_id", DESCENDING)])
+                coll.create_index([("condition", ASCENDING)])
+            except Exception as e:
+                logger.warning(f"Création des index MongoDB impossible ({e})")
+
+        threading.Thread(target=ensure_indexes, name="history-indexes", daemon=True).start()
+        return writer
+
+    def submit(self, document: dict) -> bool:
+        try:
+            self._queue.put_nowait(document)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+
+    def _collect(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch) -> None:
+        if not batch:
+            return
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"Écriture de l'historique MongoDB échouée ({len(batch)} documents perdus): {e}")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._flush(self._collect())
+        # Drain what is left on shutdown
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for i in range(0, len(remaining), self.batch_size):
+            self._flush(remaining[i:i + self.batch_size])
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written,
+                "dropped": self.dropped, "failed": self.failed}
+
+
+class ResultHistory:
+    """Tampon circulaire des derniers résultats, avec persistance MongoDB optionnelle."""
+
+    def __init__(self, max_entries: int = 1000, writer: Optional[MongoHistoryWriter] = None):
+        self._entries: deque = deque(maxlen=max_entries)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.writer = writer
+
+    def record(self, result: dict, image_bytes: Optional[bytes] = None) -> dict:
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = {"id": next(self._ids), "timestamp": now.isoformat(), "result": result}
+            self._entries.append(entry)
+
+        if self.writer is not None:
+            document = {"timestamp": now, "result": result, **_summary(result)}
+            if image_bytes is not None:
+                # Privacy: only the hash is persisted, never the image
+                document["image_hash"] = hashlib.sha256(image_bytes).hexdigest()
+                document["image_size_bytes"] = len(image_bytes)
+            self.writer.submit(document)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def page(self, limit: int = 50, cursor: Optional[str] = None) -> dict:
+        """Page de résultats, du plus récent au plus ancien. ``next_cursor`` vaut None en fin de liste."""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if self.writer is not None:
+            return self._page_mongo(limit, cursor)
+
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if cursor:
+            try:
+                before = int(cursor)
+            except ValueError:
+                raise ValueError("Invalid cursor")
+            entries = [e for e in entries if e["id"] < before]
+        page = entries[:limit]
+        next_cursor = str(page[-1]["id"]) if len(entries) > limit else None
+        return {"count": len(page), "results": page, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _mongo_cursor(doc: dict) -> str:
+        # "<timestamp in ms>.<_id>": BSON dates have millisecond precision
+        ts = doc["timestamp"]
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return f"{(ts - _EPOCH) // timedelta(milliseconds=1)}.{doc['_id']}"
+
+    def _page_mongo(self, limit: int, cursor: Optional[str]) -> dict:
+        from bson import ObjectId
+        from bson.errors import InvalidId
+        from pymongo.errors import PyMongoError
+
+        query = {}
+        if cursor:
+            try:
+                ms, oid = cursor.split(".", 1)
+                ts, oid = _EPOCH + timedelta(milliseconds=int(ms)), ObjectId(oid)
+            except (InvalidId, TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+            query = {"$or": [{"timestamp": {"$lt": ts}}, {"timestamp": ts, "_id": {"$lt": oid}}]}
+        try:
+            docs = list(self.writer.collection.find(query).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1))
+        except PyMongoError as e:
+            logger.warning(f"Lecture de l'historique MongoDB impossible ({e})")
+            raise HistoryUnavailable("History unavailable, retry later") from e
+        page = [
+            {"id": str(doc["_id"]), "timestamp": doc["timestamp"].isoformat(), "result": doc.get("result")}
+            for doc in docs[:limit]
+        ]
+        next_cursor = self._mongo_cursor(docs[limit - 1]) if len(docs) > limit else None
+        return {"count": len(page), "results": page, "next_cursor": next_cursor}
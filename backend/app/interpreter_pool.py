@@ -0,0 +1,141 @@
+"""
+Pool d'interpréteurs TFLite pour l'inférence concurrente.
+
+Un interpréteur TFLite n'est pas thread-safe : plutôt que de sérialiser toutes
+les requêtes derrière un seul verrou, chaque requête emprunte un interpréteur
+libre du pool et le rend à la fin de l'inférence.
+"""
+import os
+import time
+import queue
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional, Tuple
+
+from .metrics import INTERPRETER_CONTENTION, QUEUE_WAIT_SECONDS
+from .tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+
+class InterpreterPoolTimeout(RuntimeError):
+    """Aucun interpréteur libre dans le délai imparti."""
+
+
+def available_cpus() -> int:
+    """Nombre de CPU réellement utilisables par ce processus.
+
+    Tient compte de l'affinité CPU et du quota cgroup v2 (conteneurs), pas
+    seulement du nombre de coeurs de la machine hôte.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" ou "<quota> <period>"
+    try:
+        with open('/sys/fs/cgroup/cpu.max', 'r') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cpus)
+
+
+def default_pool_config(workers: int = 1, cpus: Optional[int] = None) -> Tuple[int, int]:
+    """Calcule (pool_size, num_threads) sans sursouscrire les CPU.
+
+    Le budget de coeurs est partagé entre les workers gunicorn du conteneur ;
+    chaque worker reçoit ``cpus // workers`` coeurs, répartis entre
+    ``pool_size`` interpréteurs de ``num_threads`` threads chacun.
+    """
+    if cpus is None:
+        cpus = available_cpus()
+    budget = max(1, cpus // max(1, workers))
+
+    # Favor several single/dual-threaded interpreters: concurrent requests
+    # scale better than intra-op threads for a MobileNetV2-sized model.
+    num_threads = 1 if budget <= 2 else 2
+    pool_size = max(1, budget // num_threads)
+    return pool_size, num_threads
+
+
+class InterpreterPool:
+    """Pool borné d'interpréteurs, emprunt bloquant avec timeout optionnel."""
+
+    def __init__(self, factory: Callable[[], Any], size: int, timeout: Optional[float] = None):
+        if size < 1:
+            raise ValueError("La taille du pool doit être >= 1")
+
+        self.size = size
+        self.timeout = timeout
+        self.interpreters: List[Any] = [factory() for _ in range(size)]
+
+        # LIFO: the most recently used interpreter has the warmest caches
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue(maxsize=size)
+        for interpreter in self.interpreters:
+            self._idle.put(interpreter)
+
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    @property
+    def available(self) -> int:
+        return self._idle.qsize()
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """Emprunte un interpréteur ; lève InterpreterPoolTimeout si aucun ne se libère."""
+        if timeout is None:
+            timeout = self.timeout
+
+        start = time.perf_counter()
+        try:
+            interpreter = self._idle.get_nowait()
+            waited = False
+        except queue.Empty:
+            waited = True
+            try:
+                interpreter = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                with self._stats_lock:
+                    self.timeouts += 1
+                INTERPRETER_CONTENTION.labels(outcome="timeout").inc()
+                logger.warning("Interpreter pool exhausted (size=%d, timeout=%s)", self.size, timeout)
+                raise InterpreterPoolTimeout(f"No interpreter available after {timeout}s")
+            INTERPRETER_CONTENTION.labels(outcome="waited").inc()
+        waited_seconds = time.perf_counter() - start
+        QUEUE_WAIT_SECONDS.labels(queue="interpreter").observe(waited_seconds)
+        record_span("queue_wait", waited_seconds, queue="interpreter")
+
+        with self._stats_lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+        return interpreter
+
+    def release(self, interpreter: Any) -> None:
+        self._idle.put_nowait(interpreter)
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None):
+        interpreter = self.acquire(timeout)
+        try:
+            yield interpreter
+        finally:
+            self.release(interpreter)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "size": self.size,
+                "available": self.available,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+            }
@@ -1,23 +1,55 @@
 """
 Configuration du logging pour HealthGuard
 Support des logs structurés JSON et texte
+
+Les handlers (console, app.log, error.log) ne tournent pas dans le thread de
+la requête : le logger racine n'a qu'un ``QueueHandler`` qui dépose les
+enregistrements dans une file bornée, vidée par un ``QueueListener`` en
+arrière-plan. Le formatage JSON, les écritures disque et les rotations ne
+bloquent donc plus l'inférence. File pleine : l'enregistrement est abandonné et
+compté (``healthguard_log_records_dropped_total``) plutôt que de bloquer.
+
+Le thread d'écoute ne survit pas à un fork : sous gunicorn, ``setup_logging``
+est appelé dans chaque worker (hook ``post_fork``).
 """
+import atexit
+import queue
 import logging
 import logging.config
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from pythonjsonlogger import jsonlogger
 from .config import settings
+from .metrics import record_log_dropped
 
+_listener = None
+_queue_handler = None
 
-def setup_logging():
-    """Configure le logging pour l'application"""
-    
-    # Créer le répertoire logs s'il n'existe pas
-    log_dir = settings.LOG_DIR
-    log_dir.mkdir(exist_ok=True)
-    
-    # Config de base
-    config = {
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler non bloquant : abandonne (et compte) les enregistrements quand la file est pleine."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            record_log_dropped()
+
+
+class _DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Blocking put: on a full queue the stop marker waits for the listener to make room
+        self.queue.put(self._sentinel)
+
+
+def logging_config(log_dir: Path, max_bytes: int = 10485760) -> dict:
+    """Configuration ``dictConfig`` des handlers (console, app.log, error.log) sur le logger racine."""
+    return {
         'version': 1,
         'disable_existing_loggers': False,
         'formatters': {
@@ -46,7 +78,7 @@ def setup_logging():
                 'level': settings.LOG_LEVEL,
                 'formatter': 'json' if settings.LOG_FORMAT == 'json' else 'detailed',
                 'filename': log_dir / 'app.log',
-                'maxBytes': 10485760,  # 10MB
+                'maxBytes': max_bytes,  # 10MB
                 'backupCount': 5
             },
             'error_file': {
@@ -54,7 +86,7 @@ def setup_logging():
                 'level': 'ERROR',
                 'formatter': 'detailed',
                 'filename': log_dir / 'error.log',
-                'maxBytes': 10485760,  # 10MB
+                'maxBytes': max_bytes,  # 10MB
                 'backupCount': 5
             }
         },
@@ -63,23 +95,57 @@ def setup_logging():
                 'level': settings.LOG_LEVEL,
                 'handlers': ['console', 'file', 'error_file']
             },
+            # Propagate to the root queue handler: no synchronous handler of their own
             'flask.app': {
                 'level': settings.LOG_LEVEL,
-                'handlers': ['console', 'file'],
-                'propagate': False
             },
             'werkzeug': {
                 'level': 'INFO',
-                'handlers': ['console', 'file'],
-                'propagate': False
             }
         }
     }
-    
-    logging.config.dictConfig(config)
+
+
+def setup_logging(log_dir: Path = None, queue_size: int = None, max_bytes: int = 10485760):
+    """Configure le logging pour l'application (handlers dans un thread d'arrière-plan)"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return logging.getLogger(__name__)
+
+    # Créer le répertoire logs s'il n'existe pas
+    log_dir = Path(log_dir or settings.LOG_DIR)
+    log_dir.mkdir(exist_ok=True)
+    logging.config.dictConfig(logging_config(log_dir, max_bytes))
+
+    # The configured handlers move behind the queue
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size or settings.LOG_QUEUE_SIZE))
+    root.addHandler(_queue_handler)
+    _listener = _DrainingQueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
     return logging.getLogger(__name__)
 
 
+def shutdown_logging() -> None:
+    """Vide la file (enregistrements en attente écrits) et arrête le thread d'écoute."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _queue_handler = None
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
 def get_logger(name: str) -> logging.Logger:
     """Obtenir un logger nommé"""
     return logging.getLogger(name)
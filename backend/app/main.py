@@ -1,30 +1,73 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import os
+import time
 import logging
-from .ml_service import MLService, tflite as tflite_runtime
+from .config import settings
+from .history import HistoryUnavailable
+from .metrics import record_request, render_metrics
+from .tracing import span
+from .services import (
+    check_rate_limit,
+    history,
+    is_admin,
+    predict_batch_lines,
+    predict_bytes,
+    registry,
+    reject_upload,
+    request_deadline,
+    request_reload,
+    retry_headers,
+    screen_bytes,
+    startup,
+    tracer,
+)
+from .uploads import BoundedStream, batch_uploads, check_batch_size, check_request_size, read_single_upload
 
 logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
-class DummyMLService:
-    def analyze_bytes(self, image_bytes):
-        return {
-            "condition": "anemia",
-            "label": "anemia",
-            "risk_level": "medium",
-            "confidence": 0.8,
-            "latency_ms": 0,
-            "recommendation": "Blood test recommended",
-            "raw": [0.2, 0.8],
-        }
-
-try:
-    ml_service = MLService()
-except Exception as e:
-    logger.warning(f"MLService indisponible ({e}), fallback DummyMLService pour l'API.")
-    ml_service = DummyMLService()
-
-RESULTS = []
+
+@app.before_request
+def _start_timer():
+    g.start_time = time.perf_counter()
+    g.trace = None
+    if request.path.startswith('/api/'):
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.trace = tracer.begin(f"{request.method} {endpoint}", request.headers.get('traceparent'),
+                               model=request.args.get('model'))
+
+
+@app.after_request
+def _record_request_metrics(response):
+    # Route template (not the raw path) keeps label cardinality bounded
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if endpoint != '/metrics':
+        record_request(endpoint, request.method, response.status_code, time.perf_counter() - g.start_time)
+    if g.get('trace') is not None:
+        response.headers['X-Trace-Id'] = g.trace.trace_id
+        attributes = {"http.status_code": response.status_code}
+        if response.is_streamed:
+            # The body (per-image spans of /api/predict/batch) is produced after this hook:
+            # close the trace once the server has sent it, not before teardown_request does
+            trace, g.trace = g.trace, None
+            response.call_on_close(lambda: tracer.finish(trace, **attributes))
+        else:
+            tracer.finish(g.trace, **attributes)
+    return response
+
+
+@app.teardown_request
+def _finish_trace(exc):
+    # Unhandled exception: after_request did not run
+    tracer.finish(g.get('trace'), **{"http.status_code": 500})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métriques Prometheus (agrégées sur tous les workers en mode multiprocess)."""
+    body, content_type = render_metrics()
+    return Response(body, mimetype=None, content_type=content_type)
+
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -32,37 +75,135 @@ def health_check():
     return jsonify({"status": "healthy"}), 200
 
 
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Sonde de vivacité : le processus répond (sans attendre les modèles)."""
+    return jsonify({"status": "alive"}), 200
+
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Sonde de préparation : 503 tant que le préchauffage des modèles n'est pas terminé."""
+    return jsonify(startup.status()), 200 if startup.ready else 503
+
+
+def _read_upload():
+    """Lit le champ 'file' en flux borné ; retourne (octets, None) ou (None, réponse d'erreur).
+
+    Un Content-Length trop grand est refusé (413) sans lire le corps.
+    """
+    error = check_request_size(request.content_length)
+    if error is None:
+        boundary = request.mimetype_params.get('boundary')
+        upload = None
+        if request.mimetype == 'multipart/form-data' and boundary:
+            with span("upload_read"):
+                upload = read_single_upload(request.stream, boundary.encode('latin-1'))
+        if upload is None:
+            error = "No file part", 400
+        elif upload.error is not None:
+            error = upload.error, upload.status
+    if error is not None:
+        payload, status = reject_upload(*error)
+        return None, (jsonify(payload), status)
+    return upload.data, None
+
+
+def _client_key() -> str:
+    """Clé de limitation de débit : en-tête RATE_LIMIT_KEY_HEADER, sinon IP du client."""
+    if settings.RATE_LIMIT_KEY_HEADER:
+        return request.headers.get(settings.RATE_LIMIT_KEY_HEADER) or request.remote_addr
+    return request.remote_addr
+
+
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """Endpoint principal pour l'inférence. Attend un champ 'file' (multipart/form-data).
-    Retourne 400 si invalide, 413 si fichier trop volumineux.
+    ?model=<nom> choisit le modèle (DEFAULT_MODEL sinon).
+    Retourne 400 si invalide, 413 si fichier trop volumineux, 404 si modèle inconnu,
+    429 au-delà du débit du client et 503 en surcharge (avec Retry-After).
+    """
+    # Cheapest rejection first: before reading the upload
+    limited = check_rate_limit(_client_key())
+    if limited is not None:
+        return jsonify(limited[0]), limited[1], retry_headers(limited[0])
+
+    data, rejected = _read_upload()
+    if rejected is not None:
+        return rejected
+
+    payload, status = predict_bytes(data, request.args.get('model'), deadline=request_deadline(g.start_time))
+    return jsonify(payload), status, retry_headers(payload)
+
+
+@app.route('/api/screen', methods=['POST'])
+def screen():
+    """Dépistage multi-conditions : l'image (champ 'file') est décodée une fois et
+    analysée par chaque modèle en parallèle (?models=anemia,diabetes, tous sinon).
+    Mêmes limites que /api/predict : 429 au-delà du débit du client, 503 en surcharge.
+    """
+    limited = check_rate_limit(_client_key())
+    if limited is not None:
+        return jsonify(limited[0]), limited[1], retry_headers(limited[0])
+
+    data, rejected = _read_upload()
+    if rejected is not None:
+        return rejected
+
+    models = [m for m in request.args.get('models', '').split(',') if m]
+    payload, status = screen_bytes(data, models, deadline=request_deadline(g.start_time))
+    return jsonify(payload), status, retry_headers(payload)
+
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    """Inférence par lots. Accepte plusieurs fichiers (multipart/form-data) ou une
+    archive zip/tar dans le corps de la requête. Retourne un flux NDJSON : une ligne
+    par image dès qu'elle est analysée, puis une ligne 'summary'.
     """
-    if 'file' not in request.files:
-        return jsonify({"success": False, "error": "No file part"}), 400
+    model = request.args.get('model')
+    if model not in registry:
+        return jsonify({"success": False, "error": "Unknown model"}), 404
+
+    error = check_batch_size(request.content_length, settings.PREDICT_BATCH_MAX_BYTES)
+    if error is not None:
+        payload, status = reject_upload(*error)
+        return jsonify(payload), status
+    # Chunked bodies (no Content-Length) stop being read past the same limit
+    stream = BoundedStream(request.stream, settings.PREDICT_BATCH_MAX_BYTES)
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"success": False, "error": "No selected file"}), 400
+    uploads, error = batch_uploads(request.mimetype, request.mimetype_params.get('boundary'), stream)
+    if error is not None:
+        return jsonify({"success": False, "error": error[0]}), error[1]
 
-    content_type = file.content_type or ''
-    if not content_type.startswith('image/'):
-        return jsonify({"success": False, "error": "Invalid content type"}), 400
+    return Response(stream_with_context(predict_batch_lines(uploads, model)), mimetype='application/x-ndjson')
 
-    data = file.read()
-    MAX_BYTES = 2 * 1024 * 1024  # 2 MB
-    if len(data) > MAX_BYTES:
-        return jsonify({"success": False, "error": "File too large"}), 413
 
-    result = ml_service.analyze_bytes(data)
-    entry = {"result": result}
-    RESULTS.append(entry)
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """Modèles disponibles, modèles chargés et mémoire utilisée par ce worker."""
+    return jsonify(registry.stats()), 200
+
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_model():
+    """Rechargement à chaud de ?model=<nom> (Authorization: Bearer ADMIN_TOKEN). Répond 202."""
+    if not is_admin(request.headers.get('Authorization', '')):
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    payload, status = request_reload(request.args.get('model') or registry.default)
+    return jsonify(payload), status
 
-    return jsonify({"success": True, "diagnosis": result}), 200
-    
 
 @app.route('/api/results', methods=['GET'])
 def get_results():
-    return jsonify({"count": len(RESULTS), "results": RESULTS}), 200
+    """Historique paginé par curseur : ?limit=50&cursor=<next_cursor de la page précédente>."""
+    try:
+        page = history.page(limit=request.args.get('limit', 50, type=int), cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except HistoryUnavailable as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    return jsonify(page), 200
 
 
 # Serve a minimal frontend if available
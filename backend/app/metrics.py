@@ -0,0 +1,188 @@
+"""
+Métriques Prometheus de HealthGuard.
+
+Histogrammes de latence par étape d'inférence (decode, resize, quantize,
+invoke, postprocess), temps d'attente (file de micro-batching, pool
+d'interpréteurs), erreurs par type et métriques HTTP décrites dans
+ARCHITECTURE.md.
+
+Sous gunicorn, chaque worker est un processus distinct : définir
+``PROMETHEUS_MULTIPROC_DIR`` (répertoire vide, avant le démarrage) active le
+mode multiprocess de prometheus-client, et ``/metrics`` agrège alors tous les
+workers (voir ``gunicorn_conf.py``). Le répertoire est créé s'il manque (autre
+serveur que gunicorn). Si prometheus-client n'est pas installé, toutes les
+métriques sont des no-op.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from .tracing import record_span
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+if MULTIPROCESS and PROMETHEUS_AVAILABLE:
+    # Only gunicorn_conf.on_starting creates it; metric files are opened on first use
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Inference stages are sub-millisecond to a few hundred ms
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+if PROMETHEUS_AVAILABLE:
+    STAGE_SECONDS = Histogram(
+        'healthguard_inference_stage_seconds', "Durée de chaque étape d'inférence",
+        ['stage'], buckets=STAGE_BUCKETS,
+    )
+    QUEUE_WAIT_SECONDS = Histogram(
+        'healthguard_queue_wait_seconds', "Attente avant exécution (file de batching, pool d'interpréteurs)",
+        ['queue'], buckets=STAGE_BUCKETS,
+    )
+    BATCH_SIZE = Histogram(
+        'healthguard_batch_size', "Taille des lots envoyés à invoke()",
+        buckets=(1, 2, 4, 8, 16, 32, 64),
+    )
+    INTERPRETER_CONTENTION = Counter(
+        'healthguard_interpreter_contention_total', "Emprunts d'interpréteur ayant dû attendre",
+        ['outcome'],
+    )
+    ERRORS = Counter(
+        'healthguard_errors_total', "Erreurs par type",
+        ['type'],
+    )
+    PREDICTIONS = Counter(
+        'healthguard_predictions_total', "Prédictions réussies par condition",
+        ['condition'],
+    )
+    PREDICTION_DURATION = Histogram(
+        'healthguard_prediction_duration_seconds', "Durée totale d'une prédiction",
+        buckets=REQUEST_BUCKETS,
+    )
+    API_REQUESTS = Counter(
+        'healthguard_api_requests_total', "Requêtes HTTP",
+        ['endpoint', 'method', 'status'],
+    )
+    API_ERRORS = Counter(
+        'healthguard_api_errors_total', "Réponses HTTP en erreur (4xx/5xx)",
+        ['endpoint'],
+    )
+    API_LATENCY = Histogram(
+        'healthguard_api_request_duration_seconds', "Durée des requêtes HTTP",
+        ['endpoint'], buckets=REQUEST_BUCKETS,
+    )
+    STARTUP_SECONDS = Gauge(
+        'healthguard_startup_seconds', "Temps depuis le lancement du processus (import, prêt après préchauffage)",
+        ['phase'], multiprocess_mode='max',
+    )
+    NEAR_DUPLICATE_LOOKUPS = Counter(
+        'healthguard_near_duplicate_lookups_total', "Recherches dans l'index des quasi-doublons",
+        ['outcome'],
+    )
+    NEAR_DUPLICATE_AUDITS = Counter(
+        'healthguard_near_duplicate_audits_total', "Quasi-doublons ré-évalués : accord avec le résultat réutilisé",
+        ['outcome'],
+    )
+    CACHE_LOOKUPS = Counter(
+        'healthguard_cache_total', "Cache des prédictions (hit, redis_hit, miss, coalesced, eviction, expiration)",
+        ['outcome'],
+    )
+    ADMISSION = Counter(
+        'healthguard_admission_total', "Décisions du contrôle d'admission (admitted, queue_full, queue_timeout, deadline)",
+        ['outcome'],
+    )
+    LOG_RECORDS_DROPPED = Counter(
+        'healthguard_log_records_dropped_total', "Enregistrements de log abandonnés (file du logging pleine)",
+    )
+else:
+    STAGE_SECONDS = QUEUE_WAIT_SECONDS = BATCH_SIZE = INTERPRETER_CONTENTION = ERRORS = _NoopMetric()
+    PREDICTIONS = PREDICTION_DURATION = API_REQUESTS = API_ERRORS = API_LATENCY = STARTUP_SECONDS = _NoopMetric()
+    NEAR_DUPLICATE_LOOKUPS = NEAR_DUPLICATE_AUDITS = LOG_RECORDS_DROPPED = ADMISSION = CACHE_LOOKUPS = _NoopMetric()
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Mesure la durée d'une étape d'inférence (histogramme ``healthguard_inference_stage_seconds``
+    et span de la trace de la requête, si elle est échantillonnée)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(seconds)
+        record_span(stage, seconds)
+
+
+def record_error(kind: str) -> None:
+    ERRORS.labels(type=kind).inc()
+
+
+def record_prediction(result: dict, seconds: float) -> None:
+    diagnosis = result.get("diagnosis", result) if isinstance(result, dict) else {}
+    PREDICTIONS.labels(condition=diagnosis.get("condition") or "unknown").inc()
+    PREDICTION_DURATION.observe(seconds)
+
+
+def record_cache(outcome: str) -> None:
+    CACHE_LOOKUPS.labels(outcome=outcome).inc()
+
+
+def record_near_duplicate(outcome: str) -> None:
+    NEAR_DUPLICATE_LOOKUPS.labels(outcome=outcome).inc()
+
+
+def record_near_duplicate_audit(agree: bool) -> None:
+    NEAR_DUPLICATE_AUDITS.labels(outcome="agree" if agree else "disagree").inc()
+
+
+def record_admission(outcome: str) -> None:
+    ADMISSION.labels(outcome=outcome).inc()
+
+
+def record_log_dropped() -> None:
+    LOG_RECORDS_DROPPED.inc()
+
+
+def record_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    API_REQUESTS.labels(endpoint=endpoint, method=method, status=str(status)).inc()
+    API_LATENCY.labels(endpoint=endpoint).observe(seconds)
+    if status >= 400:
+        API_ERRORS.labels(endpoint=endpoint).inc()
+
+
+def render_metrics():
+    """Retourne (corps, content-type) pour ``/metrics`` ; agrège tous les workers en mode multiprocess."""
+    if not PROMETHEUS_AVAILABLE:
+        return b"# prometheus-client not installed\n", "text/plain; charset=utf-8"
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,86 +1,237 @@
 
 import io
+import os
 import time
+import inspect
+import random
 import threading
+import hashlib
 import logging
 import numpy as np
 from PIL import Image
 
-# Import tflite runtime if available, else fallback to tensorflow.lite
-try:
-    import tflite_runtime.interpreter as tflite
-    TFLITE_BACKEND = 'tflite-runtime'
-except ImportError:
-    try:
-        import tensorflow as tf
-        tflite = tf.lite
-        TFLITE_BACKEND = 'tensorflow'
-    except ImportError:
-        tflite = None
-        TFLITE_BACKEND = None
+from .admission import DeadlineExceeded, current_deadline, expired
+from .decoding import decode_image, resize_image, resolve_decoder
+from .interpreter_pool import InterpreterPool, default_pool_config
+from .metrics import stage_timer
 
 logger = logging.getLogger(__name__)
 
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def load_tflite():
+    """Importe le backend TFLite au premier usage : tflite-runtime, sinon tensorflow.lite.
+
+    Retourne (module, nom) ou (None, None). Différé pour que l'import de l'application
+    (et donc /health/live) ne paie pas les secondes d'import de tensorflow.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            start = time.perf_counter()
+            try:
+                import tflite_runtime.interpreter as tflite
+                _backend = (tflite, 'tflite-runtime')
+            except ImportError:
+                try:
+                    import tensorflow as tf
+                    _backend = (tf.lite, 'tensorflow')
+                except ImportError:
+                    _backend = (None, None)
+            logger.info(f"Backend TFLite: {_backend[1]} (import {time.perf_counter() - start:.2f}s)")
+        return _backend
+
+
+def _warmup_image(size) -> bytes:
+    """JPEG synthétique (dégradé + bruit) pour exercer le pipeline complet au préchauffage."""
+    w, h = size
+    rng = np.random.default_rng(0)
+    pixels = (np.linspace(0, 200, w, dtype=np.uint8)[None, :, None] + rng.integers(0, 40, (h, w, 3), dtype=np.uint8))
+    buf = io.BytesIO()
+    Image.fromarray(pixels.astype(np.uint8)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def model_fingerprint(model_path: str) -> str:
+    """Identité courte du modèle (SHA-256 du fichier), utilisée pour les clés de cache."""
+    digest = hashlib.sha256()
+    try:
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except OSError:
+        return "unversioned"
+    return digest.hexdigest()[:12]
+
+
+def _supported_options(interpreter_cls, options: dict) -> dict:
+    """Sous-ensemble de ``options`` accepté par le constructeur de ``interpreter_cls``."""
+    try:
+        params = inspect.signature(interpreter_cls).parameters
+    except (TypeError, ValueError):
+        return dict(options)  # no introspectable signature: pass everything
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in params.values()):
+        return dict(options)
+    return {k: v for k, v in options.items() if k in params}
+
 
 
 class MLService:
     """Service d'inférence TFLite robuste (tflite-runtime ou tensorflow)."""
 
-    def __init__(self, model_path: str = "ml/anemia/model.tflite", interpreter_cls=None, warmup: bool = False):
+    def __init__(self, model_path: str = "ml/anemia/model.tflite", interpreter_cls=None, warmup: bool = False,
+                 pool_size: int = None, num_threads: int = None, checkout_timeout: float = None, workers: int = 1,
+                 decoder: str = "auto", zero_copy: bool = True, name: str = "anemia", labels=None,
+                 recommendations: dict = None, description: str = None, max_pixels: int = None,
+                 xnnpack: bool = True, log_sample_rate: float = 1.0, slow_log_ms: float = None):
+        backend = "custom"
+        options = {}
         if interpreter_cls is None:
+            tflite, backend = load_tflite()
             if tflite is None:
                 raise RuntimeError("Aucun backend TFLite disponible. Installez tflite-runtime ou tensorflow, ou passez interpreter_cls pour les tests.")
             interpreter_cls = tflite.Interpreter
+            if not xnnpack:
+                # XNNPACK is the default CPU delegate; the autotuner measures without it too
+                resolver = getattr(tflite, "OpResolverType", None) or \
+                    getattr(getattr(tflite, "experimental", None), "OpResolverType", None)
+                if resolver is not None:
+                    options["experimental_op_resolver_type"] = resolver.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+                else:
+                    logger.warning(f"Backend {backend}: impossible de désactiver XNNPACK")
+
+        # Pool size x threads defaults to the per-worker share of the CPUs
+        auto_size, auto_threads = default_pool_config(workers=workers)
+        pool_size = pool_size or auto_size
+        num_threads = num_threads or auto_threads
 
+        self.name = name
         self.model_path = model_path
-        self.interpreter = interpreter_cls(model_path=model_path)
-        self.interpreter.allocate_tensors()
+        self.model_version = model_fingerprint(model_path)
+        self.num_threads = num_threads
+        self.xnnpack = xnnpack
+        resolve_decoder(decoder, "JPEG")  # fail fast on an unknown decoder name
+        self.decoder = decoder
+        self.max_pixels = max_pixels  # checked on the image header, before decoding
+        # Per-inference INFO log: a sampled fraction, plus every inference slower than slow_log_ms
+        self.log_sample_rate = log_sample_rate
+        self.slow_log_ms = slow_log_ms
 
-        self.input_details = self.interpreter.get_input_details()[0]
-        self.output_details = self.interpreter.get_output_details()[0]
+        # model_path= maps the file read-only: its page-cache pages are shared by every worker.
+        # Kernels such as XNNPACK still repack weights privately in each interpreter
+        source = {"model_path": model_path}
 
-        # Thread-safety (important with Flask/Gunicorn)
-        self._lock = threading.Lock()
+        # Injected interpreters (tests, mocks) may not accept num_threads or the resolver option
+        requested = {"num_threads": num_threads, **options}
+        accepted = _supported_options(interpreter_cls, requested)
+        dropped = sorted(set(requested) - set(accepted))
+        if dropped:
+            logger.warning(f"Interpréteur {getattr(interpreter_cls, '__name__', interpreter_cls)}: "
+                           f"options ignorées {dropped}")
+            if "num_threads" in dropped:
+                self.num_threads = 1
+            if "experimental_op_resolver_type" in dropped:
+                self.xnnpack = True
 
-        # Example labels (should be loaded from a config file in prod)
-        self.labels = ["normal", "anemia"]
+        def make_interpreter():
+            interpreter = interpreter_cls(**source, **accepted)
+            interpreter.allocate_tensors()
+            return interpreter
+
+        # One interpreter per concurrent request (TFLite interpreters are not thread-safe)
+        self.pool = InterpreterPool(make_interpreter, size=pool_size, timeout=checkout_timeout)
+
+        self.input_details = self.pool.interpreters[0].get_input_details()[0]
+        self.output_details = self.pool.interpreters[0].get_output_details()[0]
+        # Current input batch size per interpreter (see _ensure_batch_size)
+        self._batch_sizes = {}
+
+        # Zero-copy input: per-interpreter buffers, reused across requests
+        shape = self.input_details.get("shape", [1, 224, 224, 3])
+        self.zero_copy = zero_copy
+        self._static_input_shape = tuple(int(d) for d in shape[1:]) if all(d and d > 0 for d in shape[1:]) else None
+        self._input_buffers = {}
+        self._scratch_buffers = {}
+
+        # Defaults describe the anemia model; the registry passes each model's config.json
+        self.labels = list(labels or ["normal", "anemia"])
+        self.recommendations = recommendations if recommendations is not None else {
+            "normal": "No anemia detected",
+            "anemia": "Blood test recommended",
+        }
+        self.description = description or (
+            "Analyse automatique d'image pour la détection de l'anémie. "
+            "Les résultats sont à interpréter par un professionnel de santé."
+        )
 
         if warmup:
             # Warm-up call to reduce first-inference latency
             try:
-                with self._lock:
-                    # set minimal dummy input if shape allows
-                    shape = self.input_details.get("shape", [1, 1, 1, 3])
-                    dummy = np.zeros(shape, dtype=self.input_details.get("dtype", np.float32))
-                    self.interpreter.set_tensor(self.input_details["index"], dummy)
-                    self.interpreter.invoke()
+                self.warmup()
             except Exception:
                 logger.debug("Warmup failed; continuing without warmup", exc_info=True)
 
-        logger.info(f"MLService initialized (model={model_path}, backend={TFLITE_BACKEND})")
+        logger.info(
+            f"MLService initialized (name={name}, model={model_path}, backend={backend}, "
+            f"pool_size={pool_size}, num_threads={num_threads}, xnnpack={xnnpack})"
+        )
+
+    def warmup(self, batch_sizes=(1,)) -> float:
+        """Exécute chaque taille de lot sur chaque interpréteur du pool, puis une requête
+        complète (décodage, normalisation, post-traitement) ; retourne la durée en secondes.
+
+        Les interpréteurs sont tous empruntés pendant le préchauffage.
+        """
+        start = time.perf_counter()
+        index = self.input_details["index"]
+        sizes = sorted(set(batch_sizes) | {1}) if self._static_input_shape else []
+        if sizes:
+            rng = np.random.default_rng(0)
+            sample = self.normalize(rng.integers(0, 256, self._static_input_shape, dtype=np.uint8))
+            held = [self.pool.acquire() for _ in range(self.pool.size)]
+            try:
+                for interpreter in held:
+                    for n in sizes:
+                        self._ensure_batch_size(interpreter, n)
+                        interpreter.set_tensor(index, np.repeat(sample[None], n, axis=0))
+                        interpreter.invoke()
+                    self._ensure_batch_size(interpreter, 1)
+            finally:
+                for interpreter in held:
+                    self.pool.release(interpreter)
+
+        self.analyze_bytes(_warmup_image(self.input_size or (224, 224)))
+        return time.perf_counter() - start
 
     def _softmax(self, x: np.ndarray) -> np.ndarray:
-        e = np.exp(x - np.max(x))
+        e = np.exp(x - np.max(x, axis=-1, keepdims=True))
         return e / e.sum(axis=-1, keepdims=True)
 
-    def analyze_bytes(self, image_bytes: bytes) -> dict:
-        start = time.time()
-
-        # --- Image loading ---
-        try:
-            img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        except Exception:
-            logger.warning("Invalid image provided")
-            raise ValueError("Invalid image file")
+    @property
+    def input_size(self):
+        """Taille d'entrée (w, h) du modèle, ou None si elle est dynamique."""
+        shape = self.input_details.get("shape", [1, 224, 224, 3])
+        if shape[1] and shape[1] > 0 and shape[2] and shape[2] > 0:
+            return int(shape[2]), int(shape[1])
+        return None
 
+    def decode(self, image_bytes: bytes) -> np.ndarray:
+        """Décode une image en pixels uint8 (H, W, C) à la taille d'entrée du modèle."""
         # --- Input shape (robust to dynamic shapes) ---
         shape = self.input_details.get("shape", [1, 224, 224, 3])
         # shape format assumed (N,H,W,C) by default
-        h = int(shape[1]) if shape[1] and shape[1] > 0 else img.height
-        w = int(shape[2]) if shape[2] and shape[2] > 0 else img.width
-        img = img.resize((w, h))
+        h = int(shape[1]) if shape[1] and shape[1] > 0 else None
+        w = int(shape[2]) if shape[2] and shape[2] > 0 else None
 
-        arr = np.asarray(img)
+        # --- Image loading (reduced-size decode when the target size is known) ---
+        if h and w:
+            arr = decode_image(image_bytes, (w, h), decoder=self.decoder, max_pixels=self.max_pixels)
+        else:
+            arr = decode_image(image_bytes, None, decoder=self.decoder, max_pixels=self.max_pixels)
+            size = (w or arr.shape[1], h or arr.shape[0])
+            arr = resize_image(arr, size)
 
         # Ensure channels last
         if arr.ndim == 3 and arr.shape[2] not in (1, 3):
@@ -88,83 +239,221 @@ class MLService:
             if arr.shape[0] in (1, 3):
                 arr = np.transpose(arr, (1, 2, 0))
 
+        return arr
+
+    def normalize(self, arr: np.ndarray, out: np.ndarray = None, scratch: np.ndarray = None) -> np.ndarray:
+        """Convertit des pixels uint8 au dtype d'entrée du modèle.
+
+        Si ``out`` (et ``scratch`` float32 pour les modèles quantifiés) sont fournis,
+        le résultat y est écrit en place sans aucune allocation pleine taille.
+        """
+        with stage_timer("quantize"):
+            return self._normalize(arr, out, scratch)
+
+    def _normalize(self, arr: np.ndarray, out: np.ndarray, scratch: np.ndarray) -> np.ndarray:
         # --- Dtype + quantization ---
-        input_dtype = self.input_details.get("dtype", np.float32)
+        input_dtype = np.dtype(self.input_details.get("dtype", np.float32))
         quant = self.input_details.get("quantization", (0.0, 0))
         scale = float(quant[0]) if quant else 0.0
         zero_point = int(quant[1]) if quant else 0
 
+        if out is None:
+            out = np.empty(arr.shape, dtype=input_dtype)
+
         if np.issubdtype(input_dtype, np.floating):
-            arr = arr.astype(np.float32) / 255.0
+            np.divide(arr, np.float32(255.0), out=out, dtype=np.float32)
+        elif scale == 0.0:
+            # Fallback: treat as non-quantized uint8
+            np.copyto(out, arr, casting='unsafe')
         else:
-            # Quantized model: convert to quantized integers correctly
-            if scale == 0.0:
-                # Fallback: treat as non-quantized uint8
-                arr = arr.astype(np.uint8)
-            else:
-                # arr in [0..255] -> normalized [0..1] -> quantized
-                arr = (arr.astype(np.float32) / 255.0) / scale + zero_point
-                arr = np.round(arr).astype(np.int32)
-                arr = np.clip(arr, np.iinfo(np.uint8).min, np.iinfo(np.uint8).max).astype(np.uint8)
-
-        input_data = np.expand_dims(arr, axis=0)
-
-        # --- Inference (thread-safe) ---
-        try:
-            with self._lock:
-                self.interpreter.set_tensor(self.input_details["index"], input_data)
-                self.interpreter.invoke()
-                output = self.interpreter.get_tensor(self.output_details["index"])
-        except Exception as e:
-            logger.exception("Inference failed")
-            raise RuntimeError("Inference error") from e
+            # Quantized model: arr in [0..255] -> normalized [0..1] -> quantized
+            if scratch is None:
+                scratch = np.empty(arr.shape, dtype=np.float32)
+            info = np.iinfo(input_dtype)
+            np.divide(arr, np.float32(255.0), out=scratch, dtype=np.float32)
+            np.divide(scratch, np.float32(scale), out=scratch)
+            np.add(scratch, np.float32(zero_point), out=scratch)
+            np.rint(scratch, out=scratch)
+            np.clip(scratch, info.min, info.max, out=scratch)
+            np.copyto(out, scratch, casting='unsafe')
 
-        # --- Output post-processing ---
-        output = np.squeeze(output)
+        return out
+
+    def preprocess(self, image_bytes: bytes) -> np.ndarray:
+        """Décode et prépare une image (H, W, C) au dtype d'entrée du modèle."""
+        return self.normalize(self.decode(image_bytes))
+
+    def _ensure_batch_size(self, interpreter, n: int) -> None:
+        """Redimensionne le tenseur d'entrée à N si nécessaire (réalloue les tenseurs)."""
+        current = self._batch_sizes.get(id(interpreter), 1)
+        if current == n:
+            return
+        shape = list(self.input_details.get("shape", [1, 224, 224, 3]))
+        shape[0] = n
+        interpreter.resize_tensor_input(self.input_details["index"], shape)
+        interpreter.allocate_tensors()
+        self._batch_sizes[id(interpreter)] = n
+
+    def _write_input(self, interpreter, arr: np.ndarray) -> None:
+        """Écrit les pixels normalisés directement dans le tenseur d'entrée de l'interpréteur.
+
+        Utilise la vue ``interpreter.tensor()`` quand elle existe, sinon un tampon
+        préalloué par interpréteur suivi d'un ``set_tensor``.
+        """
+        key = id(interpreter)
+        index = self.input_details["index"]
+        dtype = np.dtype(self.input_details.get("dtype", np.float32))
+
+        scratch = None
+        if not np.issubdtype(dtype, np.floating):
+            scratch = self._scratch_buffers.get(key)
+            if scratch is None:
+                scratch = self._scratch_buffers[key] = np.empty(arr.shape, dtype=np.float32)
+
+        tensor = getattr(interpreter, "tensor", None)
+        if tensor is not None:
+            # The view must not outlive this call: TFLite refuses to invoke()
+            # while references to its internal buffers are alive.
+            view = tensor(index)()
+            self.normalize(arr, out=view[0], scratch=scratch)
+            del view
+            return
+
+        buf = self._input_buffers.get(key)
+        if buf is None:
+            buf = self._input_buffers[key] = np.empty((1,) + arr.shape, dtype=dtype)
+        self.normalize(arr, out=buf[0], scratch=scratch)
+        interpreter.set_tensor(index, buf)
+
+    def _invoke(self, n: int, fill) -> np.ndarray:
+        with self.pool.checkout() as interpreter:
+            # The checkout may wait up to checkout_timeout: do not run a request already past its deadline
+            if expired(current_deadline()):
+                raise DeadlineExceeded("Request deadline exceeded before inference")
+            try:
+                self._ensure_batch_size(interpreter, n)
+                fill(interpreter)
+                with stage_timer("invoke"):
+                    interpreter.invoke()
+                # get_tensor copies, so the buffer may be reused once released
+                return interpreter.get_tensor(self.output_details["index"])
+            except Exception as e:
+                logger.exception("Inference failed")
+                raise RuntimeError("Inference error") from e
+
+    def run_batch(self, input_data: np.ndarray) -> np.ndarray:
+        """Exécute un seul invoke() sur un lot (N, H, W, C) et retourne la sortie brute."""
+        index = self.input_details["index"]
+        return self._invoke(int(input_data.shape[0]), lambda interpreter: interpreter.set_tensor(index, input_data))
+
+    def run_inplace(self, arr: np.ndarray) -> np.ndarray:
+        """Inférence d'une image uint8 (H, W, C) normalisée en place dans le tenseur d'entrée."""
+        return self._invoke(1, lambda interpreter: self._write_input(interpreter, arr))
+
+    def postprocess_batch(self, output: np.ndarray, n: int):
+        """Softmax/argmax/niveau de risque vectorisés sur une sortie (N, C).
+
+        Retourne (probs, idx, confidence, risk) sous forme de tableaux de longueur N.
+        """
+        with stage_timer("postprocess"):
+            return self._postprocess_batch(output, n)
+
+    def _postprocess_batch(self, output: np.ndarray, n: int):
+        output = np.asarray(output)
 
         # Gestion des sorties vides ou scalaires
         if output.size == 0:
             raise RuntimeError("Le modèle a retourné une sortie vide. Vérifiez l'entraînement ou l'architecture.")
-        if output.ndim == 0:
-            # Sortie scalaire : transformer en tableau
-            probs = np.array([float(output)])
-        elif output.ndim == 1:
-            probs = np.asarray(output, dtype=np.float32)
-        else:
+        if output.size % n != 0 or (output.ndim > 1 and sum(d > 1 for d in output.shape[1:]) > 1):
             # Sortie inattendue
             raise RuntimeError(f"Sortie du modèle inattendue: shape={output.shape}")
+        probs = output.reshape(n, -1).astype(np.float32)
 
-        # Si output semble être des logits, appliquer softmax
-        if probs.ndim == 1 and not np.all((0 <= probs) & (probs <= 1)):
-            probs = self._softmax(probs)
+        # Full-int8 models (convert_to_tflite.py --variants int8) also quantize their output
+        quant = self.output_details.get("quantization", (0.0, 0))
+        if quant and quant[0] and not np.issubdtype(output.dtype, np.floating):
+            probs = (probs - np.float32(quant[1])) * np.float32(quant[0])
+
+        if probs.shape[1] == 1:
+            # Single sigmoid unit: p is the probability of label 1, thresholded at 0.5
+            logits = (probs < 0) | (probs > 1)
+            if logits.any():
+                probs[logits] = 1 / (1 + np.exp(-probs[logits]))
+            p = probs[:, 0]
+            idx = (p > 0.5).astype(np.int64)
+            confidence = np.where(idx == 1, p, 1 - p)
+        else:
+            # Si une ligne semble être des logits, lui appliquer softmax
+            logits = ~np.all((0 <= probs) & (probs <= 1), axis=1)
+            if logits.any():
+                probs[logits] = self._softmax(probs[logits])
 
-        idx = int(np.argmax(probs))
-        confidence = float(probs[idx])
+            idx = np.argmax(probs, axis=1)
+            confidence = probs[np.arange(n), idx]
 
         # --- Risk mapping (documented) ---
-        if confidence > 0.75:
-            risk = "high"
-        elif confidence > 0.5:
-            risk = "medium"
-        else:
-            risk = "low"
+        risk = np.where(confidence > 0.75, "high", np.where(confidence > 0.5, "medium", "low"))
+        return probs, idx, confidence, risk
 
-        latency_ms = int((time.time() - start) * 1000)
+    def _should_log(self, latency_ms: int) -> bool:
+        if self.slow_log_ms is not None and latency_ms >= self.slow_log_ms:
+            return True
+        return self.log_sample_rate >= 1 or random.random() < self.log_sample_rate
 
-        logger.info(
-            "Inference done | label=%s confidence=%.2f latency=%dms",
-            self.labels[idx] if idx < len(self.labels) else str(idx), confidence, latency_ms
-        )
+    def format_result(self, probs: np.ndarray, idx: int, confidence: float, risk: str, latency_ms: int) -> dict:
+        idx = int(idx)
+        confidence = float(confidence)
+        label = self.labels[idx] if idx < len(self.labels) else str(idx)
+
+        if self._should_log(latency_ms):
+            logger.info(
+                "Inference done | label=%s confidence=%.2f latency=%dms",
+                label, confidence, latency_ms
+            )
 
         return {
             "diagnosis": {
-                "condition": "anemia" if idx == 1 else "normal",
-                "label": self.labels[idx] if idx < len(self.labels) else str(idx),
+                "model": self.name,
+                "model_version": self.model_version,
+                "condition": label,
+                "label": label,
                 "confidence": round(confidence, 2),
-                "risk_level": risk,
-                "recommendation": "Blood test recommended" if idx == 1 else "No anemia detected",
+                "risk_level": str(risk),
+                "recommendation": self.recommendations.get(label, ""),
                 "raw_output": probs.tolist(),
                 "latency_ms": latency_ms
             },
-            "description": "Analyse automatique d'image pour la détection de l'anémie. Les résultats sont à interpréter par un professionnel de santé."
-        }
\ No newline at end of file
+            "description": self.description
+        }
+
+    def estimated_memory_bytes(self) -> int:
+        """Estimation (majorante) de la mémoire du service : chaque interpréteur du pool
+        a ses propres tenseurs et ses poids réorganisés (XNNPACK), comptés ici comme une
+        copie des poids plus les entrées."""
+        try:
+            weights = os.path.getsize(self.model_path)
+        except OSError:
+            weights = 0
+        shape = self.input_details.get("shape", [1, 224, 224, 3])
+        input_bytes = int(np.prod(shape)) * np.dtype(self.input_details.get("dtype", np.float32)).itemsize
+        return self.pool.size * (weights + 2 * input_bytes)
+
+    def analyze_bytes(self, image_bytes: bytes) -> dict:
+        start = time.time()
+        return self.analyze_array(self.decode(image_bytes), start)
+
+    def analyze_array(self, arr: np.ndarray, start: float = None) -> dict:
+        """Analyse une image déjà décodée (uint8 HWC à la taille d'entrée du modèle)."""
+        start = time.time() if start is None else start
+
+        # --- Inference (one pooled interpreter per request) ---
+        if self.zero_copy and arr.shape == self._static_input_shape:
+            output = self.run_inplace(arr)
+        else:
+            output = self.run_batch(np.expand_dims(self.normalize(arr), axis=0))
+
+        # --- Output post-processing ---
+        probs, idx, confidence, risk = self.postprocess_batch(output, 1)
+
+        latency_ms = int((time.time() - start) * 1000)
+        return self.format_result(probs[0], idx[0], confidence[0], risk[0], latency_ms)
@@ -0,0 +1,171 @@
+"""
+Index des quasi-doublons par hachage perceptuel (dHash 64 bits).
+
+Une même photo ré-enregistrée, redimensionnée ou recompressée (messageries)
+n'a plus les mêmes octets : le cache par contenu (``cache.py``) la manque. Le
+dHash est calculé sur l'image déjà décodée à la taille du modèle ; une image
+récente à une distance de Hamming <= ``max_distance`` rend son résultat sans
+inférence.
+
+L'index est un tampon circulaire de taille fixe (tableau uint64 + résultats) :
+mémoire bornée, les entrées les plus anciennes sont écrasées, et celles qui ont
+expiré (TTL) sont ignorées. Une fraction des quasi-doublons (``audit_rate``) est
+ré-évaluée pour mesurer le désaccord entre le résultat réutilisé et une nouvelle
+inférence (métriques ``healthguard_near_duplicate_*``).
+"""
+import copy
+import time
+import random
+import threading
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .metrics import record_near_duplicate, record_near_duplicate_audit
+
+logger = logging.getLogger(__name__)
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(arr: np.ndarray, hash_size: int = 8) -> int:
+    """Hachage par différences (``hash_size``² bits) d'une image uint8 (H, W[, C])."""
+    img = Image.fromarray(arr).convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(img, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Distances de Hamming entre ``value`` et chaque hachage uint64 de ``hashes``."""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    # numpy < 2.0: per-byte lookup table
+    return _POPCOUNT8[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class PerceptualIndex:
+    """Tampon circulaire thread-safe de (dHash, résultat), borné en entrées, avec TTL."""
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._hashes = np.zeros(max_entries, dtype=np.uint64)
+        self._expires = np.full(max_entries, -np.inf)
+        self._results = [None] * max_entries
+        self._next = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def lookup(self, value: int, max_distance: int) -> Optional[Tuple[dict, int]]:
+        """Résultat de l'entrée vivante la plus proche si sa distance est <= ``max_distance``."""
+        with self._lock:
+            live = np.flatnonzero(self._expires >= time.monotonic())
+            if not live.size:
+                return None
+            distances = hamming(self._hashes[live], value)
+            best = int(np.argmin(distances))
+            distance = int(distances[best])
+            if distance > max_distance:
+                return None
+            return self._results[live[best]], distance
+
+    def add(self, value: int, result: dict) -> None:
+        with self._lock:
+            slot = self._next
+            if self._results[slot] is not None and self._expires[slot] >= time.monotonic():
+                self.evictions += 1
+            self._hashes[slot] = value
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._results[slot] = result
+            self._next = (slot + 1) % self.max_entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(np.count_nonzero(self._expires >= time.monotonic()))
+
+
+class NearDuplicatePredictor:
+    """Enveloppe un prédicteur (``analyze_array``) : les quasi-doublons récents sautent l'inférence.
+
+    ``decode`` : décodage à la taille du modèle (``MLService.decode``), fait une seule
+    fois par requête et réutilisé par l'inférence.
+    """
+
+    def __init__(self, predictor, decode, max_distance: int = 4, max_entries: int = 4096,
+                 ttl_seconds: float = 3600, audit_rate: float = 0.05):
+        self.predictor = predictor
+        self.decode = decode
+        self.max_distance = max_distance
+        self.audit_rate = audit_rate
+        self.index = PerceptualIndex(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.audits = 0
+        self.disagreements = 0
+
+    def _count(self, **deltas) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    @staticmethod
+    def _label(result: dict):
+        return (result.get("diagnosis") or {}).get("label")
+
+    @staticmethod
+    def _mark_near_duplicate(result: dict, distance: int) -> dict:
+        result = copy.deepcopy(result)
+        if isinstance(result.get("diagnosis"), dict):
+            result["diagnosis"]["cached"] = True
+            result["diagnosis"]["near_duplicate_distance"] = distance
+        return result
+
+    def analyze_bytes(self, image_bytes: bytes) -> dict:
+        start = time.time()
+        arr = self.decode(image_bytes)
+        value = dhash(arr)
+        match = self.index.lookup(value, self.max_distance)
+
+        if match is None:
+            self._count(misses=1)
+            record_near_duplicate("miss")
+            result = self.predictor.analyze_array(arr, start)
+            self.index.add(value, copy.deepcopy(result))
+            return result
+
+        stored, distance = match
+        self._count(hits=1)
+        record_near_duplicate("hit")
+        if self.audit_rate <= 0 or random.random() >= self.audit_rate:
+            return self._mark_near_duplicate(stored, distance)
+
+        # Audit: fresh inference, served instead of the stored result
+        result = self.predictor.analyze_array(arr, start)
+        agree = self._label(result) == self._label(stored)
+        self._count(audits=1, disagreements=0 if agree else 1)
+        record_near_duplicate_audit(agree)
+        if not agree:
+            logger.info(f"Quasi-doublon en désaccord (distance {distance}): "
+                        f"{self._label(stored)} réutilisé, {self._label(result)} recalculé")
+        self.index.add(value, copy.deepcopy(result))
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "audits": self.audits,
+                "disagreements": self.disagreements,
+                "evictions": self.index.evictions,
+                "entries": len(self.index),
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "disagreement_rate": round(self.disagreements / self.audits, 4) if self.audits else 0.0,
+            }
@@ -0,0 +1,360 @@
+"""
+Registre des modèles : découverte, chargement paresseux et éviction LRU.
+
+Chaque sous-répertoire de ``MODELS_PATH`` contenant un ``config.json`` déclare
+un modèle (voir ``ml/anemia/config.json``). Rien n'est chargé au démarrage :
+le premier ``use(nom)`` construit le modèle (interpréteurs, micro-batching,
+cache). Quand la somme des coûts mémoire estimés dépasse le budget, les
+modèles les moins récemment utilisés sont déchargés ; un modèle déchargé
+pendant qu'une requête l'utilise n'est fermé qu'à la fin de cette requête.
+
+Rechargement à chaud : ``reload(nom)`` construit et préchauffe la nouvelle
+version en arrière-plan puis la substitue atomiquement ; ``ModelWatcher``
+le déclenche quand les fichiers d'un modèle changent.
+"""
+import os
+import json
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownModel(KeyError):
+    """Aucun modèle de ce nom sous MODELS_PATH."""
+
+
+@dataclass
+class ModelSpec:
+    """Description d'un modèle, lue depuis son ``config.json``."""
+    name: str
+    directory: Path
+    model_file: str = "model.tflite"
+    labels: List[str] = field(default_factory=list)
+    recommendations: Dict[str, str] = field(default_factory=dict)
+    description: str = ""
+    memory_mb: Optional[float] = None  # overrides the estimate used for the memory budget
+
+    @property
+    def model_path(self) -> str:
+        return str(self.directory / self.model_file)
+
+    @classmethod
+    def from_config(cls, config_path: Path) -> "ModelSpec":
+        config = json.loads(Path(config_path).read_text(encoding="utf-8"))
+        if not isinstance(config, dict):
+            raise ValueError(f"{config_path}: un objet JSON est attendu")
+        directory = Path(config_path).parent
+        name = config.get("name") or directory.name
+        return cls(
+            name=name,
+            directory=directory,
+            model_file=config.get("model_file", "model.tflite"),
+            labels=list(config.get("labels") or ["normal", name]),
+            recommendations=dict(config.get("recommendations") or {}),
+            description=config.get("description", ""),
+            memory_mb=config.get("memory_mb"),
+        )
+
+
+def discover_models(models_path) -> Dict[str, ModelSpec]:
+    """Lit ``<models_path>/*/config.json`` ; les configurations invalides sont ignorées (avec un avertissement)."""
+    specs = {}
+    for config_path in sorted(Path(models_path).glob("*/config.json")):
+        try:
+            spec = ModelSpec.from_config(config_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Configuration de modèle ignorée ({config_path}): {e}")
+            continue
+        specs[spec.name] = spec
+    return specs
+
+
+class _Entry:
+    __slots__ = ("model", "cost", "users", "retired")
+
+    def __init__(self, model, cost: int):
+        self.model = model
+        self.cost = cost
+        self.users = 0
+        self.retired = False
+
+
+class ModelRegistry:
+    """Modèles chargés à la demande, sous un budget mémoire (octets, 0 = illimité).
+
+    ``loader(spec)`` construit le modèle ; son coût est ``spec.memory_mb`` s'il
+    est fourni, sinon l'attribut ``memory_bytes`` du modèle. Un modèle évincé
+    est fermé (``close()``) quand sa dernière requête se termine.
+    """
+
+    def __init__(self, specs: Dict[str, ModelSpec], loader: Callable[[ModelSpec], object],
+                 memory_budget_bytes: int = 0, default: Optional[str] = None,
+                 warm: Optional[Callable[[object], object]] = None):
+        self.specs = dict(specs)
+        self.loader = loader
+        self.warm = warm
+        self.memory_budget_bytes = int(memory_budget_bytes)
+        self.default = default if default in self.specs else next(iter(self.specs), None)
+
+        self._loaded: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per model: a slow load does not block requests for other models
+        self._load_locks = {name: threading.Lock() for name in self.specs}
+
+        self.loads = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    def __contains__(self, name) -> bool:
+        return (name is None and self.default is not None) or name in self.specs
+
+    def resolve(self, name: Optional[str] = None) -> ModelSpec:
+        name = name or self.default
+        with self._lock:
+            spec = self.specs.get(name)
+        if spec is None:
+            raise UnknownModel(name)
+        return spec
+
+    @contextmanager
+    def use(self, name: Optional[str] = None):
+        """Emprunte le modèle ``name`` (le modèle par défaut si None), chargé au besoin."""
+        entry = self._acquire(self.resolve(name).name)
+        try:
+            yield entry.model
+        finally:
+            self._release(entry)
+
+    def _acquire(self, name: str) -> _Entry:
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                entry.users += 1
+                return entry
+
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:  # loaded by a concurrent request
+                    self._loaded.move_to_end(name)
+                    entry.users += 1
+                    return entry
+
+            with self._lock:
+                spec = self.specs[name]
+            entry = self._build(spec)
+            entry.users = 1
+            with self._lock:
+                self._loaded[name] = entry
+                self.loads += 1
+                evicted = self._evict_locked(keep=name)
+            logger.info(f"Modèle chargé: {name} (~{entry.cost / 1e6:.1f} MB, {len(self._loaded)} en mémoire)")
+
+        for old in evicted:
+            self._close(old)
+        return entry
+
+    def _build(self, spec: ModelSpec) -> _Entry:
+        model = self.loader(spec)
+        cost = int(spec.memory_mb * 1024 * 1024) if spec.memory_mb is not None \
+            else int(getattr(model, "memory_bytes", 0))
+        return _Entry(model, cost)
+
+    def reload(self, name: str) -> bool:
+        """Recharge ``name`` sans interruption : relit son config.json, construit et préchauffe
+        le nouveau modèle hors verrou, puis le substitue atomiquement à l'ancien.
+
+        Les requêtes en cours terminent sur l'ancienne version, fermée après la dernière.
+        Un modèle non chargé est seulement relu (chargé à sa prochaine requête).
+        Retourne False (l'ancienne version reste en service) si le nouveau modèle est invalide.
+        """
+        old_spec = self.resolve(name)
+        try:
+            spec = ModelSpec.from_config(old_spec.directory / "config.json")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rechargement de {name} annulé, config.json invalide ({e})")
+            return False
+        spec.name = name
+
+        with self._load_locks[name]:
+            with self._lock:
+                loaded = name in self._loaded
+                if not loaded:
+                    self.specs[name] = spec
+            if not loaded:
+                return True
+
+            entry = self._build(spec)
+            error = getattr(entry.model, "load_error", None)
+            if error is None and self.warm is not None:
+                try:
+                    self.warm(entry.model)
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                logger.warning(f"Rechargement de {name} annulé, ancienne version conservée ({error})")
+                self._close(entry)
+                return False
+
+            with self._lock:
+                self.specs[name] = spec
+                old = self._loaded.pop(name, None)
+                self._loaded[name] = entry
+                self.reloads += 1
+                to_close = self._evict_locked(keep=name)
+                if old is not None:
+                    old.retired = True
+                    if old.users == 0:
+                        to_close.append(old)
+            logger.info(f"Modèle rechargé: {name} (version {getattr(entry.model, 'model_version', '?')})")
+
+        for stale in to_close:
+            self._close(stale)
+        return True
+
+    def _release(self, entry: _Entry) -> None:
+        with self._lock:
+            entry.users -= 1
+            close = entry.retired and entry.users == 0
+        if close:
+            self._close(entry)
+
+    def _evict_locked(self, keep: str) -> List[_Entry]:
+        """Retire les modèles LRU jusqu'à respecter le budget ; retourne ceux à fermer tout de suite."""
+        to_close = []
+        if self.memory_budget_bytes <= 0:
+            return to_close
+        while self._used_locked() > self.memory_budget_bytes:
+            victim = next((n for n in self._loaded if n != keep), None)
+            if victim is None:
+                break  # the requested model alone exceeds the budget: keep it anyway
+            entry = self._loaded.pop(victim)
+            entry.retired = True
+            self.evictions += 1
+            logger.info(f"Modèle déchargé (budget mémoire): {victim}")
+            if entry.users == 0:
+                to_close.append(entry)
+        return to_close
+
+    def _used_locked(self) -> int:
+        return sum(entry.cost for entry in self._loaded.values())
+
+    @staticmethod
+    def _close(entry: _Entry) -> None:
+        close = getattr(entry.model, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                logger.warning("Fermeture du modèle échouée", exc_info=True)
+
+    def close(self) -> None:
+        with self._lock:
+            entries = list(self._loaded.values())
+            self._loaded.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = {
+                name: {"version": getattr(e.model, "model_version", None), "memory_bytes": e.cost, "in_use": e.users}
+                for name, e in self._loaded.items()
+            }
+            models = {name: e.model for name, e in self._loaded.items()}
+            used = self._used_locked()
+        # Per-model counters (cache, batching) are read outside the registry lock
+        for name, model in models.items():
+            model_stats = getattr(model, "stats", None)
+            if callable(model_stats):
+                loaded[name]["stats"] = model_stats()
+        return {
+            "worker": os.getpid(),  # the registry is per gunicorn worker
+            "default": self.default,
+            "available": sorted(self.specs),
+            "loaded": loaded,
+            "memory_used_bytes": used,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+        }
+
+
+RELOAD_MARKER = ".reload"
+
+
+def _stamp(spec: ModelSpec) -> tuple:
+    stamp = []
+    for path in (spec.model_path, spec.directory / "config.json", spec.directory / RELOAD_MARKER):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+class ModelWatcher:
+    """Recharge un modèle quand son fichier, son ``config.json`` ou son marqueur
+    ``.reload`` change (mtime/taille).
+
+    Un changement n'est appliqué qu'une fois stable pendant un intervalle complet,
+    pour ne pas charger un fichier en cours de copie. Chaque worker a son propre
+    observateur : toucher le marqueur recharge le modèle dans tous les workers.
+    """
+
+    def __init__(self, registry: ModelRegistry, interval: float = 5.0):
+        self.registry = registry
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._seen = {name: _stamp(spec) for name, spec in registry.specs.items()}
+        self._pending: Dict[str, tuple] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ModelWatcher":
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def acknowledge(self, name: str) -> None:
+        """Considère l'état actuel des fichiers de ``name`` comme déjà pris en compte."""
+        with self._lock:
+            self._seen[name] = _stamp(self.registry.specs[name])
+            self._pending.pop(name, None)
+
+    def poll(self) -> List[str]:
+        """Vérifie les fichiers une fois ; retourne les modèles rechargés."""
+        changed = []
+        with self._lock:
+            for name, spec in list(self.registry.specs.items()):
+                stamp = _stamp(spec)
+                if stamp == self._seen.get(name):
+                    self._pending.pop(name, None)
+                elif self._pending.get(name) != stamp:
+                    self._pending[name] = stamp  # wait until it stops changing
+                else:
+                    del self._pending[name]
+                    self._seen[name] = stamp
+                    changed.append(name)
+        return [name for name in changed if self.registry.reload(name)]
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.warning("Surveillance des modèles en échec", exc_info=True)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval + 1)
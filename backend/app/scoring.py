@@ -0,0 +1,352 @@
+"""
+Scoring hors ligne d'archives d'images (remplace ``test_batch_predict.py``).
+
+Les arborescences sont parcourues en flux et réparties par lots sur un pool de
+processus, chacun avec son propre MLService ; les images d'un lot de même
+taille passent dans un seul ``invoke()``. Les résultats sont ajoutés au
+fichier de sortie (CSV ou JSONL) au fil de l'eau, et ce fichier sert de point
+de reprise : avec ``--resume``, les images déjà scorées sans erreur sont
+ignorées, celles en erreur sont retentées (une dernière ligne tronquée par un
+crash est retirée).
+
+En fin de traitement : images/s, temps par étape (lecture, décodage,
+inférence, post-traitement) et matrice de confusion quand le label se déduit
+du dossier parent (``dataset/anemia``, ``dataset/normal``). La mémoire reste
+bornée quel que soit le nombre d'images : seuls des compteurs (label,
+prédiction) et un échantillon de taille fixe des temps par étape sont gardés.
+
+Usage (depuis la racine du dépôt) :
+    python score_images.py dataset --output scores.jsonl --workers 4
+    python score_images.py /archive/2024 --output scores.csv --resume --report report.json
+"""
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import logging
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .ml_service import MLService
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+STAGES = ("read", "decode", "infer", "postprocess")
+FIELDS = ("path", "label", "prediction", "confidence", "risk_level", "model_version", "error")
+# Per-stage timing samples kept for the percentiles (the mean is exact)
+RESERVOIR_SIZE = 10000
+
+
+def iter_images(roots: Iterable[str]) -> Iterator[str]:
+    """Chemins des images sous ``roots``, en flux et dans un ordre stable."""
+    for root in roots:
+        if os.path.isfile(root):
+            yield root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(IMAGE_EXTS):
+                    yield os.path.join(dirpath, name)
+
+
+def folder_label(path: str, labels) -> Optional[str]:
+    """Label déduit du dossier parent s'il fait partie des labels du modèle."""
+    parent = os.path.basename(os.path.dirname(path))
+    return parent if parent in labels else None
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- Worker processes -------------------------------------------------------
+
+_service: Optional[MLService] = None
+
+
+def _init_worker(service_kwargs: dict) -> None:
+    global _service
+    # format_result logs every inference at INFO: far too verbose for an archive
+    logging.getLogger(MLService.__module__).setLevel(logging.WARNING)
+    _service = MLService(**service_kwargs)
+
+
+def _infer_group(svc: MLService, records: List[dict], arrays: List[np.ndarray]) -> None:
+    """Un seul invoke() pour des images de même taille ; temps répartis par image."""
+    n = len(arrays)
+    try:
+        t0 = time.perf_counter()
+        output = svc.run_batch(np.stack([svc.normalize(a) for a in arrays]))
+        t1 = time.perf_counter()
+        probs, idx, confidence, risk = svc.postprocess_batch(output, n)
+        t2 = time.perf_counter()
+    except Exception as e:
+        for record in records:
+            record["error"] = f"Inference error: {e}"
+        return
+    for i, record in enumerate(records):
+        diagnosis = svc.format_result(probs[i], idx[i], confidence[i], risk[i], 0)["diagnosis"]
+        record.update(prediction=diagnosis["condition"], confidence=diagnosis["confidence"],
+                      risk_level=diagnosis["risk_level"])
+        record["timings"].update(infer=(t1 - t0) * 1000 / n, postprocess=(t2 - t1) * 1000 / n)
+
+
+def _score_chunk(paths: List[str]) -> List[dict]:
+    svc = _service
+    records, groups = [], {}
+    for path in paths:
+        record = {"path": path, "label": folder_label(path, svc.labels), "prediction": None,
+                  "confidence": None, "risk_level": None, "model_version": svc.model_version,
+                  "error": None, "timings": {}}
+        records.append(record)
+        try:
+            t0 = time.perf_counter()
+            with open(path, 'rb') as f:
+                data = f.read()
+            t1 = time.perf_counter()
+            arr = svc.decode(data)
+            t2 = time.perf_counter()
+        except (OSError, ValueError) as e:
+            record["error"] = str(e) if isinstance(e, ValueError) else f"Unreadable file: {e}"
+            continue
+        record["timings"].update(read=(t1 - t0) * 1000, decode=(t2 - t1) * 1000)
+        groups.setdefault(arr.shape, ([], []))
+        groups[arr.shape][0].append(record)
+        groups[arr.shape][1].append(arr)
+
+    for group_records, arrays in groups.values():
+        _infer_group(svc, group_records, arrays)
+    return records
+
+
+# --- Output / checkpoint ----------------------------------------------------
+
+class ResultWriter:
+    """Fichier de résultats CSV ou JSONL (selon l'extension), ajouté au fil de l'eau.
+
+    Avec ``resume``, relit le fichier existant : chemins déjà scorés sans erreur
+    (les lignes en erreur sont retentées) et nombre de couples (label, prédiction)
+    pour la matrice de confusion.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.format = "csv" if path.lower().endswith(".csv") else "jsonl"
+        self.done = set()
+        self.previous: Counter = Counter()
+        if resume and os.path.exists(path):
+            self._load()
+            mode = 'a'
+        else:
+            mode = 'w'
+        self._file = open(path, mode, newline='' if self.format == "csv" else None, encoding='utf-8')
+        self._csv = csv.DictWriter(self._file, fieldnames=FIELDS) if self.format == "csv" else None
+        if self._csv is not None and mode == 'w':
+            self._csv.writeheader()
+
+    def _load(self) -> None:
+        # A crash can leave a truncated last line: cut the file back to the last newline
+        with open(self.path, 'rb+') as f:
+            content = f.read()
+            end = content.rfind(b"\n") + 1
+            if end != len(content):
+                f.truncate(end)
+        with open(self.path, newline='', encoding='utf-8') as f:
+            rows = csv.DictReader(f) if self.format == "csv" else (json.loads(line) for line in f if line.strip())
+            for row in rows:
+                if row.get("error"):
+                    continue  # transient failures (killed worker, file still syncing) are retried
+                self.done.add(row["path"])
+                self.previous[(row.get("label") or None, row.get("prediction") or None)] += 1
+
+    def write(self, records: List[dict]) -> None:
+        for record in records:
+            row = {k: record.get(k) for k in FIELDS}
+            if self._csv is not None:
+                self._csv.writerow(row)
+            else:
+                self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# --- Report -----------------------------------------------------------------
+
+class Reservoir:
+    """Échantillon uniforme de taille fixe (algorithme R) d'une série de durées ; moyenne exacte."""
+
+    def __init__(self, size: int = RESERVOIR_SIZE, seed: int = 0):
+        self.size = size
+        self.values: List[float] = []
+        self.count = 0
+        self.total = 0.0
+        self._rng = random.Random(seed)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            i = self._rng.randrange(self.count)
+            if i < self.size:
+                self.values[i] = value
+
+
+def confusion_matrix(counts: Mapping[Tuple[Optional[str], Optional[str]], int], labels: List[str]) -> Optional[dict]:
+    """Matrice (lignes = label réel, colonnes = prédiction) sur les images labellisées,
+    depuis le nombre d'images par couple (label, prédiction)."""
+    index = {label: i for i, label in enumerate(labels)}
+    matrix = np.zeros((len(labels), len(labels)), dtype=int)
+    for (label, prediction), n in counts.items():
+        if label in index and prediction in index:
+            matrix[index[label], index[prediction]] += n
+    total = int(matrix.sum())
+    if total == 0:
+        return None
+    return {"labels": list(labels), "matrix": matrix.tolist(), "accuracy": round(float(np.trace(matrix)) / total, 4)}
+
+
+def _stage_summary(samples: Dict[str, Reservoir]) -> dict:
+    summary = {}
+    for stage in STAGES:
+        reservoir = samples[stage]
+        if reservoir.count:
+            p50, p95 = np.percentile(np.asarray(reservoir.values, dtype=np.float64), [50, 95])
+            summary[stage] = {"mean_ms": round(reservoir.total / reservoir.count, 3),
+                              "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3)}
+    return summary
+
+
+def _labels(service_kwargs: dict, counts: Mapping[tuple, int]) -> List[str]:
+    # Model order when the labels are known, otherwise everything that was seen
+    if service_kwargs.get("labels"):
+        return list(service_kwargs["labels"])
+    return sorted({value for pair in counts for value in pair if value})
+
+
+def score(roots: Iterable[str], output: str, service_kwargs: dict, workers: int = 1, batch_size: int = 8,
+          resume: bool = False, max_in_flight: Optional[int] = None, progress_every: int = 1000) -> dict:
+    """Score toutes les images sous ``roots`` ; retourne le rapport final."""
+    writer = ResultWriter(output, resume=resume)
+    pending_paths = (p for p in iter_images(roots) if p not in writer.done)
+    max_in_flight = max_in_flight or workers * 2
+
+    samples = {stage: Reservoir() for stage in STAGES}
+    pairs = Counter(writer.previous)
+    scored = errors = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(service_kwargs,)) as pool:
+        in_flight = set()
+
+        def collect(block: bool) -> None:
+            nonlocal scored, errors
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED) if block else \
+                ({f for f in in_flight if f.done()}, None)
+            for future in done:
+                in_flight.discard(future)
+                records = future.result()
+                writer.write(records)
+                for record in records:
+                    scored += 1
+                    if record["error"]:
+                        errors += 1
+                        continue
+                    pairs[(record["label"], record["prediction"])] += 1
+                    for stage, ms in record["timings"].items():
+                        samples[stage].add(ms)
+                    if progress_every and scored % progress_every == 0:
+                        logger.info(f"{scored} images ({scored / (time.perf_counter() - start):.1f} img/s)")
+
+        # Bounded window: the directory walk never runs far ahead of the workers
+        for chunk in chunked(pending_paths, batch_size):
+            in_flight.add(pool.submit(_score_chunk, chunk))
+            collect(block=len(in_flight) >= max_in_flight)
+        while in_flight:
+            collect(block=True)
+    writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "images": scored,
+        "errors": errors,
+        "skipped": len(writer.done),
+        "elapsed_s": round(elapsed, 3),
+        "images_per_sec": round(scored / elapsed, 2) if elapsed > 0 else None,
+        "stages": _stage_summary(samples),
+        "confusion": confusion_matrix(pairs, _labels(service_kwargs, pairs)),
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['images']} images scorées ({report['errors']} erreurs, {report['skipped']} reprises) "
+          f"en {report['elapsed_s']:.1f}s : {report['images_per_sec']} img/s")
+    for stage, s in report["stages"].items():
+        print(f"  {stage:<12} mean {s['mean_ms']:>8.2f} ms   p50 {s['p50_ms']:>8.2f} ms   p95 {s['p95_ms']:>8.2f} ms")
+    confusion = report["confusion"]
+    if confusion:
+        labels = confusion["labels"]
+        width = max(len(label) for label in labels) + 2
+        print(f"\nMatrice de confusion (lignes = dossier, colonnes = prédiction), exactitude {confusion['accuracy']:.2%}")
+        print(" " * width + "".join(f"{label:>{width}}" for label in labels))
+        for label, row in zip(labels, confusion["matrix"]):
+            print(f"{label:<{width}}" + "".join(f"{v:>{width}}" for v in row))
+
+
+def main(argv=None) -> None:
+    from .config import settings
+    from .ml_service import load_tflite
+    from .registry import discover_models
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('roots', nargs='+', help='Dossiers (parcourus récursivement) ou fichiers à scorer')
+    parser.add_argument('--output', required=True, help='Fichier de résultats .csv ou .jsonl (point de reprise)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reprendre : ignorer les images déjà scorées sans erreur dans --output')
+    parser.add_argument('--model', default=settings.DEFAULT_MODEL, help='Modèle (sous-répertoire de MODELS_PATH)')
+    parser.add_argument('--models-path', default=settings.MODELS_PATH)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processus de scoring')
+    parser.add_argument('--threads', type=int, default=1, help='Threads TFLite par processus')
+    parser.add_argument('--batch-size', type=int, default=8, help='Images par lot (un invoke() par lot)')
+    parser.add_argument('--report', help='Écrire le rapport final en JSON')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    specs = discover_models(args.models_path)
+    if args.model not in specs:
+        parser.error(f"Modèle inconnu: {args.model} (disponibles: {', '.join(sorted(specs)) or 'aucun'})")
+    if load_tflite()[0] is None:
+        parser.error("Aucun backend TFLite disponible (tflite-runtime ou tensorflow)")
+    spec = specs[args.model]
+    service_kwargs = dict(model_path=spec.model_path, name=spec.name, labels=spec.labels,
+                          recommendations=spec.recommendations, description=spec.description,
+                          pool_size=1, num_threads=args.threads, decoder=settings.IMAGE_DECODER,
+                          max_pixels=settings.MAX_IMAGE_PIXELS)
+
+    report = score(args.roots, args.output, service_kwargs, workers=args.workers,
+                   batch_size=args.batch_size, resume=args.resume)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Dépistage multi-conditions pour ``/api/screen``.
+
+Une même photo passe par plusieurs modèles (anémie, diabète, carences) :
+l'image est décodée une seule fois, redimensionnée une fois par taille
+d'entrée distincte, puis les modèles tournent en parallèle. La réponse
+combine les diagnostics, avec la latence de chaque modèle et la durée totale.
+"""
+import time
+import logging
+import contextvars
+from concurrent.futures import Executor
+from typing import Dict, Optional
+
+from .admission import Overloaded
+from .decoding import decode_images
+from .interpreter_pool import InterpreterPoolTimeout
+
+logger = logging.getLogger(__name__)
+
+RISK_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+
+def _diagnosis(result: dict) -> dict:
+    return result.get("diagnosis", result) if isinstance(result, dict) else {}
+
+
+def _run(predictor, arr, data: bytes) -> dict:
+    start = time.perf_counter()
+    # Models without a static input size (or without a decoder) decode on their own
+    result = predictor.analyze_array(arr) if arr is not None else predictor.analyze_bytes(data)
+    return {"success": True, "result": result, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+
+def _failure(e: Exception, name: str) -> dict:
+    if isinstance(e, Overloaded):
+        return {"success": False, "error": "Server overloaded, retry later", "status": 503,
+                "retry_after": e.retry_after}
+    if isinstance(e, (InterpreterPoolTimeout, TimeoutError)):
+        return {"success": False, "error": "Server busy, retry later", "status": 503}
+    logger.error(f"Screening failed for model {name}", exc_info=e)
+    return {"success": False, "error": "Inference error", "status": 500}
+
+
+def combine(models: Dict[str, dict]) -> dict:
+    """Synthèse : conditions détectées (label != normal) et niveau de risque le plus élevé parmi elles."""
+    findings = []
+    for name, entry in models.items():
+        if not entry["success"]:
+            continue
+        diagnosis = _diagnosis(entry["result"])
+        if diagnosis.get("condition") not in (None, "normal"):
+            findings.append({"model": name, "condition": diagnosis["condition"],
+                             "risk_level": diagnosis.get("risk_level"), "confidence": diagnosis.get("confidence")})
+    risk = max((f["risk_level"] for f in findings), key=lambda r: RISK_ORDER.get(r, -1), default="low")
+    return {"conditions": [f["condition"] for f in findings], "risk_level": risk, "findings": findings}
+
+
+def screen(data: bytes, predictors: Dict[str, object], executor: Executor, decoder: str = "auto",
+           max_pixels: Optional[int] = None) -> dict:
+    """Analyse ``data`` avec chaque prédicteur (``analyze_array`` / ``analyze_bytes``).
+
+    Lève ImageTooLarge au-delà de ``max_pixels``, ValueError si l'image est illisible ; les échecs d'un modèle sont
+    rapportés dans son entrée sans faire échouer les autres.
+    """
+    start = time.perf_counter()
+
+    sizes = {name: getattr(getattr(p, "service", p), "input_size", None) for name, p in predictors.items()}
+    decode_start = time.perf_counter()
+    arrays = decode_images(data, {s for s in sizes.values() if s is not None}, decoder=decoder,
+                           max_pixels=max_pixels)
+    decode_ms = round((time.perf_counter() - decode_start) * 1000, 2)
+
+    # Each model runs in a copy of the request context (trace, deadline)
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, _run, predictor, arrays.get(sizes[name]), data)
+        for name, predictor in predictors.items()
+    }
+    models = {}
+    for name, future in futures.items():
+        try:
+            models[name] = future.result()
+        except ValueError:
+            raise
+        except Exception as e:
+            models[name] = _failure(e, name)
+
+    return {
+        "summary": combine(models),
+        "models": models,
+        "decode_ms": decode_ms,
+        "wall_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
@@ -0,0 +1,403 @@
+"""
+Services partagés par les points d'entrée WSGI (main.py) et ASGI (asgi.py) :
+registre des modèles (service d'inférence, micro-batching et cache par modèle)
+et historique des résultats.
+"""
+import hmac
+import json
+import time
+import logging
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from .admission import AdmissionController, AdmittedPredictor, DeadlineExceeded, Overloaded, RateLimiter, deadline_scope
+from .batching import DEFAULT_MAX_BATCH_SIZE, BatchScheduler
+from .bulk import stream_predictions
+from .cache import CachedPredictor, RedisTier
+from .config import settings
+from .decoding import ImageTooLarge
+from .history import MongoHistoryWriter, ResultHistory
+from .interpreter_pool import InterpreterPoolTimeout
+from .metrics import record_error, record_prediction
+from .ml_service import MLService
+from .near_duplicates import NearDuplicatePredictor
+from .registry import RELOAD_MARKER, ModelRegistry, ModelSpec, ModelWatcher, UnknownModel, discover_models
+from .screening import screen
+from .startup import Startup
+from .tracing import FileExporter, OTLPHttpExporter, Tracer, span
+from .tuning import RuntimeConfig, load_tuning
+from .uploads import BatchTooLarge
+
+logger = logging.getLogger(__name__)
+
+
+class DummyMLService:
+    model_version = "dummy"
+
+    def analyze_bytes(self, image_bytes):
+        return {
+            "condition": "anemia",
+            "label": "anemia",
+            "risk_level": "medium",
+            "confidence": 0.8,
+            "latency_ms": 0,
+            "recommendation": "Blood test recommended",
+            "raw": [0.2, 0.8],
+            "model_version": self.model_version,
+        }
+
+# Shared by every model; local caches stay per model
+redis_tier = None
+if settings.CACHE_ENABLED and settings.REDIS_ENABLED:
+    try:
+        redis_tier = RedisTier(settings.REDIS_URL, ttl_seconds=settings.CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Cache Redis indisponible ({e}), cache local uniquement.")
+
+# Per-request traces, exported off the request path (TRACE_EXPORTER=file|otlp)
+trace_exporter = None
+if settings.TRACE_EXPORTER == 'file':
+    trace_exporter = FileExporter(settings.TRACE_FILE or settings.LOG_DIR / 'traces.jsonl')
+elif settings.TRACE_EXPORTER == 'otlp':
+    trace_exporter = OTLPHttpExporter(settings.TRACE_OTLP_ENDPOINT)
+elif settings.TRACE_EXPORTER != 'none':
+    logger.warning(f"TRACE_EXPORTER inconnu ({settings.TRACE_EXPORTER}), traces désactivées.")
+tracer = Tracer(trace_exporter, sample_rate=settings.TRACE_SAMPLE_RATE, max_queue=settings.TRACE_QUEUE_SIZE)
+
+# Per-client token bucket; shared by every worker through Redis when enabled
+rate_limiter = None
+if settings.RATE_LIMIT_PER_SECOND > 0:
+    if settings.REDIS_ENABLED:
+        try:
+            rate_limiter = RateLimiter.from_url(settings.REDIS_URL, settings.RATE_LIMIT_PER_SECOND,
+                                                settings.RATE_LIMIT_BURST)
+        except Exception as e:
+            logger.warning(f"Limitation de débit Redis indisponible ({e}), seaux locaux au worker.")
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(settings.RATE_LIMIT_PER_SECOND, settings.RATE_LIMIT_BURST)
+
+bulk_executor = ThreadPoolExecutor(max_workers=settings.PREDICT_BATCH_WORKERS, thread_name_prefix='bulk-predict')
+screen_executor = ThreadPoolExecutor(max_workers=settings.SCREEN_WORKERS, thread_name_prefix='screen')
+
+
+class ModelStack:
+    """Pile d'inférence d'un modèle : MLService, micro-batching et cache."""
+
+    def __init__(self, spec: ModelSpec):
+        self.name = spec.name
+        self.load_error = None  # set when falling back to DummyMLService (hot reload keeps the old version)
+        # Measured on this machine profile by benchmarks/autotune.py; explicit INTERPRETER_* / BATCH_MAX_SIZE win
+        self.tuning = load_tuning(spec.directory, settings.WEB_CONCURRENCY) if settings.RUNTIME_TUNING else None
+        tuned = self.tuning or RuntimeConfig(num_threads=0, pool_size=0, batch_size=0)
+        self.batch_size = settings.BATCH_MAX_SIZE or tuned.batch_size or DEFAULT_MAX_BATCH_SIZE
+        try:
+            self.service = MLService(
+                model_path=spec.model_path,
+                pool_size=settings.INTERPRETER_POOL_SIZE or tuned.pool_size or None,
+                num_threads=settings.INTERPRETER_NUM_THREADS or tuned.num_threads or None,
+                checkout_timeout=settings.INTERPRETER_CHECKOUT_TIMEOUT,
+                workers=settings.WEB_CONCURRENCY,
+                decoder=settings.IMAGE_DECODER,
+                zero_copy=settings.ZERO_COPY_INPUT,
+                max_pixels=settings.MAX_IMAGE_PIXELS,
+                xnnpack=tuned.xnnpack,
+                log_sample_rate=settings.LOG_INFERENCE_SAMPLE_RATE,
+                slow_log_ms=settings.LOG_SLOW_INFERENCE_MS,
+                name=spec.name,
+                labels=spec.labels,
+                recommendations=spec.recommendations,
+                description=spec.description,
+            )
+        except Exception as e:
+            logger.warning(f"MLService indisponible pour {spec.name} ({e}), fallback DummyMLService pour l'API.")
+            self.service = DummyMLService()
+            self.load_error = str(e)
+        self.model_version = self.service.model_version
+
+        # Micro-batching: trades up to BATCH_MAX_WAIT_MS of latency for batched invoke() throughput
+        self.scheduler = None
+        if isinstance(self.service, MLService):
+            self.scheduler = BatchScheduler(
+                self.service,
+                max_batch_size=self.batch_size,
+                max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+                timeout=settings.INTERPRETER_CHECKOUT_TIMEOUT,
+            )
+        self.inference = self.scheduler if settings.BATCHING_ENABLED and self.scheduler is not None else self.service
+
+        # Admission control: bounded in-flight inferences + bounded wait queue, the rest is shed at once.
+        # Sized from this model's actual pool and batch size; taken on cache misses only
+        pool_size = self.service.pool.size if isinstance(self.service, MLService) else 1
+        self.admission = AdmissionController(
+            settings.ADMISSION_MAX_CONCURRENT or pool_size * (self.batch_size if settings.BATCHING_ENABLED else 1),
+            max_queue=settings.ADMISSION_MAX_QUEUE,
+            retry_after=settings.ADMISSION_RETRY_AFTER,
+            max_wait=settings.ADMISSION_MAX_WAIT_MS / 1000,
+        )
+        # Uncached path taking decoded arrays (/api/screen), admitted like /api/predict
+        self.predictor = AdmittedPredictor(self.inference, self.admission)
+
+        # /api/predict/batch always goes through the scheduler: the items of one batch fill invoke()
+        self.bulk_inference = self.scheduler or self.service
+
+        # Perceptual index: re-saved or recompressed copies of a recent upload skip invoke
+        self.near_duplicates = None
+        if settings.NEAR_DUPLICATE_ENABLED and isinstance(self.service, MLService):
+            self.inference = self.near_duplicates = NearDuplicatePredictor(
+                self.inference,
+                decode=self.service.decode,
+                max_distance=settings.NEAR_DUPLICATE_MAX_DISTANCE,
+                max_entries=settings.NEAR_DUPLICATE_MAX_ENTRIES,
+                ttl_seconds=settings.CACHE_TTL_SECONDS,
+                audit_rate=settings.NEAR_DUPLICATE_AUDIT_RATE,
+            )
+        # Admitted above the perceptual index: its full decode counts against the slots too
+        self.inference = AdmittedPredictor(self.inference, self.admission)
+
+        # Content-addressed cache: identical uploads skip decode + invoke
+        self.cache = None
+        if settings.CACHE_ENABLED:
+            self.inference = self.cache = CachedPredictor(
+                self.inference,
+                model_version=f"{spec.name}:{self.model_version}",
+                max_entries=settings.CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.CACHE_TTL_SECONDS,
+                redis_tier=redis_tier,
+            )
+
+    def warmup(self) -> float:
+        """Préchauffe toutes les tailles de lot que le micro-batching peut produire."""
+        if isinstance(self.service, MLService):
+            return self.service.warmup(batch_sizes=self.scheduler.buckets)
+        return 0.0
+
+    @property
+    def memory_bytes(self) -> int:
+        if isinstance(self.service, MLService):
+            return self.service.estimated_memory_bytes()
+        return 0
+
+    def stats(self) -> dict:
+        """Compteurs du pool d'interpréteurs, du cache, du micro-batching, de l'index des
+        quasi-doublons et de l'admission (``/api/models``)."""
+        parts = {"interpreters": getattr(self.service, "pool", None), "cache": self.cache,
+                 "batching": self.scheduler, "near_duplicates": self.near_duplicates, "admission": self.admission}
+        return {name: part.stats() for name, part in parts.items() if part is not None}
+
+    def close(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.close()
+
+
+# Models are loaded on first use and evicted (LRU) past MODEL_MEMORY_BUDGET_MB
+registry = ModelRegistry(
+    discover_models(settings.MODELS_PATH),
+    loader=ModelStack,
+    memory_budget_bytes=int(settings.MODEL_MEMORY_BUDGET_MB * 1024 * 1024),
+    default=settings.DEFAULT_MODEL,
+    warm=lambda stack: stack.warmup(),  # hot reload: the new version is warm before the swap
+)
+if registry.default is None:
+    logger.warning(f"Aucun modèle trouvé sous {settings.MODELS_PATH} (config.json attendu par modèle).")
+
+# Zero-downtime reload when a model file, its config.json or its .reload marker changes
+watcher = ModelWatcher(registry, interval=settings.MODEL_WATCH_INTERVAL).start() \
+    if settings.MODEL_WATCH_INTERVAL > 0 else None
+
+
+def _warm(name: str) -> float:
+    with registry.use(name) as stack:
+        return stack.warmup()
+
+
+# /health/ready turns true once every served model is loaded and warmed (background thread)
+startup = Startup()
+
+# Bounded in-memory history; optional batched persistence to MongoDB (off the request path)
+history_writer = None
+if settings.MONGO_ENABLED:
+    try:
+        history_writer = MongoHistoryWriter.from_uri(
+            settings.MONGO_URI,
+            settings.MONGO_DB_NAME,
+            collection=settings.MONGO_COLLECTION,
+            max_pool_size=settings.MONGO_MAX_POOL_SIZE,
+            batch_size=settings.HISTORY_BATCH_SIZE,
+            flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+            max_queue=settings.HISTORY_QUEUE_SIZE,
+        )
+    except Exception as e:
+        logger.warning(f"MongoDB indisponible ({e}), historique en mémoire uniquement.")
+history = ResultHistory(max_entries=settings.HISTORY_MAX_ENTRIES, writer=history_writer)
+
+
+UPLOAD_ERROR_TYPES = {400: "invalid_upload", 413: "too_large"}
+
+
+def reject_upload(message: str, status: int):
+    """Réponse d'erreur de validation d'upload (comptée par type dans les métriques)."""
+    record_error(UPLOAD_ERROR_TYPES.get(status, "invalid_upload"))
+    return {"success": False, "error": message}, status
+
+
+def request_deadline(started: float):
+    """Échéance (horloge ``time.perf_counter``) d'une requête arrivée à ``started``."""
+    return started + settings.ADMISSION_DEADLINE_MS / 1000 if settings.ADMISSION_DEADLINE_MS > 0 else None
+
+
+def check_rate_limit(client: str):
+    """None si ``client`` peut envoyer la requête, sinon (corps JSON 429, code HTTP)."""
+    if rate_limiter is None:
+        return None
+    retry_after = rate_limiter.acquire(client or "unknown")
+    if not retry_after:
+        return None
+    record_error("rate_limited")
+    return {"success": False, "error": "Too many requests", "retry_after": retry_after}, 429
+
+
+def retry_headers(payload: dict) -> dict:
+    """En-tête ``Retry-After`` des réponses 429 / 503 de délestage."""
+    return {"Retry-After": str(payload["retry_after"])} if "retry_after" in payload else {}
+
+
+def _shed(reason: str, retry_after: int):
+    record_error(reason)
+    return {"success": False, "error": "Server overloaded, retry later", "retry_after": retry_after}, 503
+
+
+def predict_bytes(data: bytes, model: str = None, deadline: float = None):
+    """Prédiction complète pour /api/predict (WSGI et ASGI) ; retourne (corps JSON, code HTTP).
+
+    ``deadline`` (``time.perf_counter``) : au-delà, la requête est abandonnée avant l'inférence (503).
+    """
+    start = time.perf_counter()
+    try:
+        with deadline_scope(deadline), registry.use(model) as stack:
+            result = stack.inference.analyze_bytes(data)
+    except Overloaded as e:
+        return _shed("deadline" if e.reason == "deadline" else "overloaded", e.retry_after)
+    except DeadlineExceeded:
+        return _shed("deadline", settings.ADMISSION_RETRY_AFTER)
+    except UnknownModel:
+        record_error("unknown_model")
+        return {"success": False, "error": "Unknown model"}, 404
+    except ImageTooLarge:
+        record_error("too_large")
+        return {"success": False, "error": "Image too large"}, 413
+    except ValueError:
+        record_error("invalid_image")
+        return {"success": False, "error": "Invalid image file"}, 400
+    except (InterpreterPoolTimeout, TimeoutError):
+        record_error("busy")
+        return {"success": False, "error": "Server busy, retry later"}, 503
+    except Exception:
+        logger.exception("Prediction failed")
+        record_error("inference_error")
+        return {"success": False, "error": "Inference error"}, 500
+
+    record_prediction(result, time.perf_counter() - start)
+    with span("history_write"):
+        history.record(result, data)
+    return {"success": True, "diagnosis": result}, 200
+
+
+def predict_batch_lines(uploads, model: str = None):
+    """Lignes NDJSON de /api/predict/batch (WSGI et ASGI) : une par image dès qu'elle est
+    analysée, puis le résumé. Les erreurs de lecture du corps sont signalées dans le flux."""
+    try:
+        # The model stays loaded (not evicted) until the whole batch is done
+        with registry.use(model) as stack:
+            for record in stream_predictions(
+                uploads,
+                stack.bulk_inference.analyze_bytes,
+                bulk_executor,
+                max_in_flight=settings.PREDICT_BATCH_MAX_IN_FLIGHT,
+                max_files=settings.PREDICT_BATCH_MAX_FILES,
+            ):
+                if record.get("success"):
+                    history.record(record["diagnosis"])
+                yield json.dumps(record) + "\n"
+    except BatchTooLarge:
+        yield json.dumps({"success": False, "error": "Batch too large", "status": 413}) + "\n"
+    except Exception:
+        # Headers are already sent: report malformed payloads in-band
+        logger.warning("Invalid batch payload", exc_info=True)
+        yield json.dumps({"success": False, "error": "Invalid batch payload", "status": 400}) + "\n"
+
+
+def screen_bytes(data: bytes, models=None, deadline: float = None):
+    """Dépistage multi-modèles pour /api/screen (WSGI et ASGI) ; retourne (corps JSON, code HTTP).
+
+    ``models`` : noms des modèles à exécuter (tous les modèles disponibles si vide).
+    Chaque modèle passe par son contrôle d'admission ; si tous refusent, la réponse est 503.
+    """
+    names = list(models) if models else sorted(registry.specs)
+    if not names or any(name not in registry.specs for name in names):
+        record_error("unknown_model")
+        return {"success": False, "error": "Unknown model"}, 404
+
+    try:
+        with deadline_scope(deadline), ExitStack() as held:
+            # Keep every model loaded for the whole fan-out
+            predictors = {name: held.enter_context(registry.use(name)).predictor for name in names}
+            report = screen(data, predictors, screen_executor, decoder=settings.IMAGE_DECODER,
+                            max_pixels=settings.MAX_IMAGE_PIXELS)
+    except ImageTooLarge:
+        record_error("too_large")
+        return {"success": False, "error": "Image too large"}, 413
+    except ValueError:
+        record_error("invalid_image")
+        return {"success": False, "error": "Invalid image file"}, 400
+    except Exception:
+        logger.exception("Screening failed")
+        record_error("inference_error")
+        return {"success": False, "error": "Inference error"}, 500
+
+    entries = report["models"].values()
+    if all("retry_after" in entry for entry in entries):
+        return _shed("overloaded", max(entry["retry_after"] for entry in entries))
+    for entry in entries:
+        if entry["success"]:
+            record_prediction(entry["result"], entry["latency_ms"] / 1000)
+            history.record(entry["result"], data)
+        else:
+            record_error("busy" if entry["status"] == 503 else "inference_error")
+    return {"success": True, **report}, 200
+
+
+
+def is_admin(authorization: str) -> bool:
+    """Vérifie l'en-tête ``Authorization: Bearer <ADMIN_TOKEN>`` (routes d'administration désactivées sans jeton)."""
+    if not settings.ADMIN_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), settings.ADMIN_TOKEN)
+
+
+def request_reload(name: str):
+    """Déclenche le rechargement à chaud de ``name`` ; retourne (corps JSON, code HTTP).
+
+    Ce worker recharge en arrière-plan ; le marqueur ``.reload`` fait recharger les autres
+    workers par leur ModelWatcher.
+    """
+    if name not in registry.specs:
+        return {"success": False, "error": "Unknown model"}, 404
+    try:
+        (registry.specs[name].directory / RELOAD_MARKER).touch()
+    except OSError as e:
+        logger.warning(f"Marqueur de rechargement non écrit pour {name} ({e}) : seul ce worker rechargera.")
+    if watcher is not None:
+        watcher.acknowledge(name)  # reloaded below, not again on the next poll
+    threading.Thread(target=registry.reload, args=(name,), name=f"reload-{name}", daemon=True).start()
+    return {"success": True, "reloading": name}, 202
+
+
+startup.mark_imported()
+if settings.WARMUP_ENABLED:
+    names = [m for m in settings.WARMUP_MODELS.split(',') if m in registry.specs] or sorted(registry.specs)
+    # Default model last: most recently used, so the last one evicted under the memory budget
+    names.sort(key=lambda name: name == registry.default)
+    startup.start_warmup(_warm, names)
+else:
+    startup.mark_ready()
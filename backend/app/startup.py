@@ -0,0 +1,101 @@
+"""
+Démarrage d'un worker : durée de démarrage et état de préparation.
+
+``/health/live`` répond dès que l'application est importée (le backend TFLite
+n'est importé qu'au premier chargement de modèle). ``/health/ready`` ne passe
+à 200 qu'après le préchauffage, exécuté dans un thread d'arrière-plan : chaque
+modèle servi est chargé et chaque taille de lot exécutée sur chaque
+interpréteur. Les durées depuis le lancement du processus sont journalisées et
+exportées dans ``healthguard_startup_seconds{phase="import|ready"}``.
+"""
+import os
+import time
+import threading
+import logging
+from typing import Callable, Dict, Iterable, Optional
+
+from .metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_IMPORTED_AT = time.time()
+
+
+def process_start_time() -> float:
+    """Heure de lancement du processus (epoch), lue dans /proc ; à défaut, l'import de ce module."""
+    try:
+        with open(f"/proc/{os.getpid()}/stat") as f:
+            # Fields after the command name, which may contain spaces
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _IMPORTED_AT
+
+
+class Startup:
+    """Suit le démarrage du worker et le préchauffage des modèles."""
+
+    def __init__(self):
+        self.started_at = process_start_time()
+        self.import_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self.warmup_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._ready = threading.Event()
+
+    def _elapsed(self) -> float:
+        return max(0.0, time.time() - self.started_at)
+
+    def mark_imported(self) -> None:
+        if self.import_seconds is None:
+            self.import_seconds = self._elapsed()
+            STARTUP_SECONDS.labels(phase="import").set(self.import_seconds)
+            logger.info(f"Application importée en {self.import_seconds:.2f}s depuis le lancement du processus")
+
+    def mark_ready(self) -> None:
+        if not self._ready.is_set():
+            self.ready_seconds = self._elapsed()
+            STARTUP_SECONDS.labels(phase="ready").set(self.ready_seconds)
+            self._ready.set()
+            logger.info(
+                f"Prêt en {self.ready_seconds:.2f}s depuis le lancement du processus "
+                f"(préchauffage: {sum(self.warmup_seconds.values()):.2f}s, {len(self.warmup_seconds)} modèle(s))"
+            )
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def start_warmup(self, warm: Callable[[str], float], names: Iterable[str]) -> threading.Thread:
+        """Préchauffe ``names`` dans l'ordre (``warm(nom)`` retourne sa durée), puis passe à prêt.
+
+        Un échec est journalisé et rapporté dans ``/health/ready`` sans bloquer la préparation.
+        """
+        names = list(names)
+
+        def run():
+            for name in names:
+                try:
+                    self.warmup_seconds[name] = round(warm(name), 3)
+                except Exception as e:
+                    logger.warning(f"Préchauffage du modèle {name} échoué ({e})", exc_info=True)
+                    self.errors[name] = str(e)
+            self.mark_ready()
+
+        thread = threading.Thread(target=run, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "import_seconds": self.import_seconds,
+            "ready_seconds": self.ready_seconds,
+            "warmup_seconds": dict(self.warmup_seconds),
+            "warmup_errors": dict(self.errors),
+        }
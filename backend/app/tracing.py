@@ -0,0 +1,307 @@
+"""
+Traces par requête : identifiant de trace et spans par étape.
+
+Chaque requête ``/api/*`` reçoit un identifiant de trace, renvoyé dans
+l'en-tête ``X-Trace-Id``. C'est celui du ``traceparent`` W3C entrant s'il est
+fourni, sinon un identifiant généré. Une fraction des requêtes
+(``TRACE_SAMPLE_RATE``) est tracée. On obtient un span racine pour la requête
+et des spans enfants pour la lecture de l'upload, decode, resize, quantize,
+les attentes (file de micro-batching, pool d'interpréteurs), invoke,
+postprocess et l'écriture de l'historique. Les spans d'étape partagent les
+points de mesure des métriques (``stage_timer``). Un lot du micro-batching
+ajoute ses spans invoke / postprocess à la trace de chacune de ses requêtes.
+
+L'export se fait au format OTLP/JSON, hors du chemin de la requête (thread
+d'arrière-plan, file bornée), vers un fichier JSONL local ou un collecteur
+OTLP/HTTP (``/v1/traces``). Sans échantillonnage, le coût se limite à
+l'identifiant de trace et à la lecture d'une ContextVar par étape.
+"""
+import os
+import json
+import time
+import queue
+import random
+import threading
+import logging
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Traces the current code runs for: one per request, several inside a micro-batch
+_active: ContextVar[tuple] = ContextVar("healthguard_traces", default=())
+
+_SPAN_KIND_INTERNAL = 1
+_SPAN_KIND_SERVER = 2
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], start_ns: int, end_ns: int = None,
+                 attributes: dict = None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+        self.attributes = attributes or {}
+
+
+class Trace:
+    """Span racine d'une requête et ses spans enfants (ajoutés depuis n'importe quel thread)."""
+
+    def __init__(self, trace_id: str, name: str, parent_id: Optional[str] = None, attributes: dict = None):
+        self.trace_id = trace_id
+        self.root = Span(name, parent_id, time.time_ns(), attributes=dict(attributes or {}))
+        self.spans: List[Span] = [self.root]
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, attributes: dict = None) -> None:
+        span = Span(name, self.root.span_id, start_ns, end_ns, attributes)
+        with self._lock:
+            self.spans.append(span)
+
+    def end(self, **attributes) -> None:
+        self.root.attributes.update(attributes)
+        self.root.end_ns = time.time_ns()
+
+    def to_otlp(self) -> list:
+        with self._lock:
+            spans = list(self.spans)
+        return [{
+            "traceId": self.trace_id,
+            "spanId": span.span_id,
+            **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+            "name": span.name,
+            "kind": _SPAN_KIND_SERVER if span is self.root else _SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": [_attribute(k, v) for k, v in span.attributes.items() if v is not None],
+        } for span in spans]
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_payload(traces: Iterable[Trace], service_name: str = "healthguard") -> dict:
+    """Corps OTLP/JSON (``ExportTraceServiceRequest``) pour un lot de traces."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", service_name)]},
+        "scopeSpans": [{
+            "scope": {"name": "healthguard"},
+            "spans": [span for trace in traces for span in trace.to_otlp()],
+        }],
+    }]}
+
+
+def parse_traceparent(header: str) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, span parent, échantillonné) d'un en-tête ``traceparent`` W3C, ou None s'il est invalide."""
+    parts = header.strip().split('-')
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1].lower(), parts[2].lower(), bool(flags & 1)
+
+
+class FileExporter:
+    """Une ligne OTLP/JSON par lot de traces (fichier JSONL local)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, payload: dict) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(payload) + "\n")
+
+
+class OTLPHttpExporter:
+    """Envoi OTLP/HTTP en JSON vers un collecteur (``http://collector:4318/v1/traces``)."""
+
+    def __init__(self, endpoint: str, timeout: float = 2.0, headers: dict = None):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def export(self, payload: dict) -> None:
+        request = urllib.request.Request(self.endpoint, data=json.dumps(payload).encode('utf-8'),
+                                         headers=self.headers, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class RequestTrace:
+    """Trace d'une requête : identifiant toujours présent, ``trace`` seulement si échantillonnée."""
+
+    __slots__ = ("trace_id", "trace", "token")
+
+    def __init__(self, trace_id: str, trace: Optional[Trace] = None, token=None):
+        self.trace_id = trace_id
+        self.trace = trace
+        self.token = token
+
+    @property
+    def sampled(self) -> bool:
+        return self.trace is not None
+
+
+class Tracer:
+    """Échantillonnage des requêtes et export des traces par lots, en arrière-plan.
+
+    ``exporter`` : objet avec ``export(payload)`` (FileExporter, OTLPHttpExporter) ;
+    sans exporteur, aucune requête n'est tracée.
+    """
+
+    _STOP = object()
+
+    def __init__(self, exporter=None, sample_rate: float = 0.0, service_name: str = "healthguard",
+                 batch_size: int = 64, flush_interval: float = 1.0, max_queue: int = 2048):
+        self.exporter = exporter
+        self.sample_rate = sample_rate if exporter is not None else 0.0
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+
+        self._stats_lock = threading.Lock()
+        self.sampled = 0
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+
+        self._thread = None
+        if exporter is not None:
+            self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+            self._thread.start()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def begin(self, name: str, traceparent: str = None, **attributes) -> RequestTrace:
+        """Ouvre la trace d'une requête ; les spans d'étape du contexte courant s'y rattachent."""
+        parent = parse_traceparent(traceparent) if traceparent else None
+        trace_id = parent[0] if parent else os.urandom(16).hex()
+        if self.sample_rate <= 0:
+            return RequestTrace(trace_id)
+        # Parent-based: a request the caller traces is always traced here too
+        if not (parent and parent[2]) and random.random() >= self.sample_rate:
+            return RequestTrace(trace_id)
+        trace = Trace(trace_id, name, parent[1] if parent else None, attributes)
+        self._count("sampled")
+        return RequestTrace(trace_id, trace, _active.set((trace,)))
+
+    def finish(self, request_trace: Optional[RequestTrace], **attributes) -> None:
+        """Ferme la trace (idempotent) et la met en file d'export sans bloquer."""
+        if request_trace is None or request_trace.trace is None or request_trace.token is None:
+            return
+        _active.reset(request_trace.token)
+        request_trace.token = None
+        request_trace.trace.end(**attributes)
+        try:
+            self._queue.put_nowait(request_trace.trace)
+        except queue.Full:
+            self._count("dropped")
+
+    def _collect(self):
+        """Attend une trace puis accumule jusqu'à ``batch_size`` traces ou ``flush_interval`` secondes."""
+        first = self._queue.get()
+        if first is self._STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                self.exporter.export(otlp_payload(batch, self.service_name))
+                self._count("exported", len(batch))
+            except Exception as e:
+                self._count("export_errors")
+                logger.warning(f"Export de {len(batch)} trace(s) impossible ({e})")
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Exporte les traces en attente puis arrête le thread d'export."""
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "sampled": self.sampled,
+                "exported": self.exported,
+                "dropped": self.dropped,
+                "export_errors": self.export_errors,
+                "queued": self._queue.qsize(),
+            }
+
+
+def current_traces() -> tuple:
+    return _active.get()
+
+
+@contextmanager
+def activate(traces: tuple):
+    """Rattache les spans du bloc à ``traces`` (thread du micro-batching : une trace par requête du lot)."""
+    token = _active.set(traces)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def record_span(name: str, seconds: float, **attributes) -> None:
+    """Span d'étape terminé à l'instant, d'une durée ``seconds``, dans les traces actives."""
+    traces = _active.get()
+    if not traces:
+        return
+    end = time.time_ns()
+    start = end - int(seconds * 1e9)
+    for trace in traces:
+        trace.add_span(name, start, end, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Span d'étape autour d'un bloc (aucun coût hors de la ContextVar si rien n'est tracé)."""
+    if not _active.get():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start, **attributes)
@@ -0,0 +1,71 @@
+"""
+Configuration d'exécution mesurée sur la machine (``benchmarks/autotune.py``).
+
+L'autotuner écrit ``tuning.json`` dans le répertoire du modèle : pour chaque
+profil de machine (CPU disponibles, workers gunicorn), la combinaison threads /
+interpréteurs / taille de lot / XNNPACK au meilleur débit. Au démarrage,
+``ModelStack`` applique le profil qui correspond exactement à la machine ; un
+réglage mesuré sur une autre machine (portable, nœud plus petit) n'est jamais
+réutilisé, on revient alors au calcul automatique (``default_pool_config``).
+"""
+import os
+import json
+import logging
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from .interpreter_pool import available_cpus
+
+logger = logging.getLogger(__name__)
+
+TUNING_FILE = "tuning.json"
+
+
+@dataclass
+class RuntimeConfig:
+    num_threads: int
+    pool_size: int
+    batch_size: int
+    xnnpack: bool = True
+
+
+def machine_key(workers: int, cpus: Optional[int] = None) -> str:
+    return f"cpus={cpus or available_cpus()},workers={max(1, workers)}"
+
+
+def load_tuning(directory, workers: int, cpus: Optional[int] = None) -> Optional[RuntimeConfig]:
+    """Réglage mesuré pour cette machine, ou None (fichier absent, illisible ou autre profil)."""
+    path = Path(directory) / TUNING_FILE
+    try:
+        profiles = json.loads(path.read_text()).get("profiles", {})
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Réglage {path} ignoré ({e})")
+        return None
+    key = machine_key(workers, cpus)
+    entry = profiles.get(key)
+    if entry is None:
+        logger.info(f"{path}: aucun réglage pour {key} (profils: {', '.join(profiles) or 'aucun'})")
+        return None
+    try:
+        return RuntimeConfig(**entry["config"])
+    except (KeyError, TypeError) as e:
+        logger.warning(f"Réglage {path} [{key}] ignoré ({e})")
+        return None
+
+
+def save_tuning(directory, workers: int, config: RuntimeConfig, details: dict = None,
+                cpus: Optional[int] = None) -> Path:
+    """Ajoute (ou remplace) le profil de cette machine dans ``tuning.json``, de façon atomique."""
+    path = Path(directory) / TUNING_FILE
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        data = {}
+    data.setdefault("profiles", {})[machine_key(workers, cpus)] = {"config": asdict(config), **(details or {})}
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    tmp_path.write_text(json.dumps(data, indent=2) + "\n")
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,257 @@
+"""
+Validation et lecture en flux des images envoyées à l'API.
+
+Les règles de validation (type de contenu, taille maximale) sont partagées
+entre ``/api/predict`` et ``/api/predict/batch``. Pour les lots, le corps de la
+requête est parcouru au fil de l'eau : un fichier n'est jamais conservé
+au-delà de ``MAX_UPLOAD_BYTES``, et le lot complet n'est jamais mis en mémoire.
+
+Pour les routes à un seul fichier (``/api/predict``, ``/api/screen``), un
+``Content-Length`` au-delà de ``MAX_REQUEST_BYTES`` est refusé (413) sans lire
+le corps ; sans ``Content-Length`` (transfert chunked), la lecture s'arrête dès
+que cette limite est dépassée. La mémoire par requête reste ainsi bornée à
+environ ``MAX_UPLOAD_BYTES``, quelle que soit la taille envoyée.
+
+Un lot est borné de la même façon par ``PREDICT_BATCH_MAX_BYTES`` : refus sur
+``Content-Length``, sinon arrêt de la lecture (et de la copie d'une archive zip
+sur disque) dès que la limite est dépassée.
+"""
+import mimetypes
+import tarfile
+import tempfile
+import zipfile
+import logging
+from dataclasses import dataclass
+from typing import IO, Iterator, List, Optional, Tuple
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024  # 2 MB
+CHUNK_SIZE = 64 * 1024
+# Single-file requests: the file plus multipart headers and boundaries
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+
+ARCHIVE_CONTENT_TYPES = {
+    'application/zip': 'zip',
+    'application/x-zip-compressed': 'zip',
+    'application/x-tar': 'tar',
+    'application/gzip': 'tar',
+    'application/x-gzip': 'tar',
+    'application/x-gtar': 'tar',
+}
+
+
+@dataclass
+class Upload:
+    """Un fichier reçu : soit ``data``, soit une erreur (message + code HTTP)."""
+    filename: str
+    content_type: str
+    data: Optional[bytes] = None
+    error: Optional[str] = None
+    status: int = 200
+    field: str = ''
+
+
+def validate_upload(filename: str, content_type: str, size: Optional[int] = None) -> Optional[Tuple[str, int]]:
+    """Retourne (message, code HTTP) si l'upload est invalide, sinon None."""
+    if filename == '':
+        return "No selected file", 400
+    if not (content_type or '').startswith('image/'):
+        return "Invalid content type", 400
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        return "File too large", 413
+    return None
+
+
+def check_request_size(content_length: Optional[int]) -> Optional[Tuple[str, int]]:
+    """Refus d'une requête à un seul fichier d'après son Content-Length, avant toute lecture."""
+    if content_length is not None and content_length > MAX_REQUEST_BYTES:
+        return "File too large", 413
+    return None
+
+
+class BatchTooLarge(ValueError):
+    """Corps d'une requête par lots au-delà de ``PREDICT_BATCH_MAX_BYTES``."""
+
+
+def check_batch_size(content_length: Optional[int], max_bytes: int) -> Optional[Tuple[str, int]]:
+    """Refus d'une requête par lots d'après son Content-Length, avant toute lecture."""
+    if content_length is not None and content_length > max_bytes:
+        return "Batch too large", 413
+    return None
+
+
+class BoundedStream:
+    """Enveloppe un flux de corps de requête : lève BatchTooLarge au-delà de ``max_bytes`` lus."""
+
+    def __init__(self, stream: IO[bytes], max_bytes: int):
+        self._stream = stream
+        self.max_bytes = max_bytes
+        self.received = 0
+
+    def read(self, size: int = -1) -> bytes:
+        # Never more than one byte past the limit, even for read() without size
+        limit = self.max_bytes - self.received + 1
+        chunk = self._stream.read(limit if size is None or size < 0 else min(size, limit))
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise BatchTooLarge(f"Batch too large (max {self.max_bytes} bytes)")
+        return chunk
+
+
+def _checked(filename: str, content_type: str, data: Optional[bytes], size: int) -> Upload:
+    error = validate_upload(filename, content_type, size)
+    if error is not None:
+        return Upload(filename, content_type, error=error[0], status=error[1])
+    return Upload(filename, content_type, data=data)
+
+
+class MultipartUploadParser:
+    """Analyseur multipart/form-data incrémental (push) : ``feed()`` reçoit des morceaux
+    du corps et retourne les fichiers complétés. Utilisé en WSGI comme en ASGI.
+
+    Les champs non-fichier sont ignorés ; un fichier trop volumineux est signalé
+    sans que son contenu au-delà de la limite soit conservé.
+    """
+
+    def __init__(self, boundary: bytes):
+        self._decoder = MultipartDecoder(boundary)
+        self._current: Optional[File] = None
+        self._buf: Optional[bytearray] = None
+        self._size = 0
+        self.complete = False
+
+    def feed(self, chunk: Optional[bytes]) -> List[Upload]:
+        """``chunk`` vide ou None signale la fin du corps."""
+        uploads = []
+        if self.complete:
+            return uploads
+        self._decoder.receive_data(chunk or None)
+
+        event = self._decoder.next_event()
+        while not isinstance(event, NeedData):
+            if isinstance(event, File):
+                self._current, self._buf, self._size = event, bytearray(), 0
+            elif isinstance(event, Field):
+                self._current = None
+            elif isinstance(event, Data) and self._current is not None:
+                self._size += len(event.data)
+                if self._buf is not None:
+                    if self._size > MAX_UPLOAD_BYTES:
+                        self._buf = None  # stop buffering, keep counting
+                    else:
+                        self._buf.extend(event.data)
+                if not event.more_data:
+                    current = self._current
+                    upload = _checked(current.filename or '', current.headers.get('Content-Type', ''),
+                                      bytes(self._buf) if self._buf is not None else None, self._size)
+                    upload.field = current.name
+                    uploads.append(upload)
+                    self._current, self._buf = None, None
+            elif isinstance(event, Epilogue):
+                self.complete = True
+                break
+            event = self._decoder.next_event()
+
+        if not chunk:
+            self.complete = True
+        return uploads
+
+
+class SingleUploadReader:
+    """Lecture bornée du champ ``field`` d'une requête à un seul fichier.
+
+    ``feed()`` retourne True dès que la lecture peut s'arrêter : le fichier est
+    complet, le corps est terminé, ou plus de ``MAX_REQUEST_BYTES`` ont été reçus
+    (``upload`` porte alors une erreur 413). ``upload`` reste None sans champ ``field``.
+    """
+
+    def __init__(self, boundary: bytes, field: str = 'file'):
+        self._parser = MultipartUploadParser(boundary)
+        self.field = field
+        self.received = 0
+        self.upload: Optional[Upload] = None
+        self.done = False
+
+    def feed(self, chunk: Optional[bytes]) -> bool:
+        if self.done:
+            return True
+        self.received += len(chunk or b'')
+        if self.received > MAX_REQUEST_BYTES:
+            self.upload = Upload('', '', error="File too large", status=413, field=self.field)
+            self.done = True
+            return True
+        for upload in self._parser.feed(chunk):
+            if upload.field == self.field:
+                self.upload = upload
+                self.done = True
+                return True
+        self.done = self._parser.complete
+        return self.done
+
+
+def read_single_upload(stream: IO[bytes], boundary: bytes, field: str = 'file') -> Optional[Upload]:
+    """Lit le champ ``field`` par morceaux de CHUNK_SIZE ; le reste du corps n'est pas lu."""
+    reader = SingleUploadReader(boundary, field)
+    while not reader.feed(stream.read(CHUNK_SIZE)):
+        pass
+    return reader.upload
+
+
+def iter_multipart_uploads(stream: IO[bytes], boundary: bytes) -> Iterator[Upload]:
+    """Parcourt un corps multipart/form-data et produit chaque fichier dès qu'il est complet."""
+    parser = MultipartUploadParser(boundary)
+    while not parser.complete:
+        yield from parser.feed(stream.read(CHUNK_SIZE))
+
+
+def _guess_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or ''
+
+
+def iter_tar_uploads(stream: IO[bytes]) -> Iterator[Upload]:
+    """Lit une archive tar (éventuellement compressée) en flux, membre par membre."""
+    with tarfile.open(fileobj=stream, mode='r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            content_type = _guess_type(member.name)
+            if validate_upload(member.name, content_type, member.size) is not None:
+                # Unread members are skipped by the streaming reader
+                yield _checked(member.name, content_type, None, member.size)
+                continue
+            yield _checked(member.name, content_type, tar.extractfile(member).read(), member.size)
+
+
+def iter_zip_uploads(stream: IO[bytes]) -> Iterator[Upload]:
+    """Lit une archive zip. Le répertoire central étant en fin de fichier, le corps
+    est d'abord recopié dans un fichier temporaire (sur disque au-delà de 8 MB)."""
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            spool.write(chunk)
+        spool.seek(0)
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                content_type = _guess_type(info.filename)
+                if validate_upload(info.filename, content_type, info.file_size) is not None:
+                    yield _checked(info.filename, content_type, None, info.file_size)
+                    continue
+                yield _checked(info.filename, content_type, archive.read(info), info.file_size)
+
+
+def batch_uploads(mimetype: str, boundary: Optional[str], stream: IO[bytes]):
+    """Itérateur des fichiers d'un corps ``/api/predict/batch`` selon son type ; retourne
+    (uploads, None) ou (None, (message, code HTTP)). Partagé par les routes WSGI et ASGI."""
+    if mimetype == 'multipart/form-data':
+        if not boundary:
+            return None, ("Missing multipart boundary", 400)
+        return iter_multipart_uploads(stream, boundary.encode('latin-1')), None
+    if ARCHIVE_CONTENT_TYPES.get(mimetype) == 'zip':
+        return iter_zip_uploads(stream), None
+    if ARCHIVE_CONTENT_TYPES.get(mimetype) == 'tar':
+        return iter_tar_uploads(stream), None
+    return None, ("Invalid content type", 400)
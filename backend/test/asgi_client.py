@@ -0,0 +1,62 @@
+"""Minimal synchronous test client for the ASGI app, mirroring Flask's test client API."""
+import asyncio
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response
+
+
+class ASGITestClient:
+    def __init__(self, app, chunk_size=64 * 1024):
+        self.app = app
+        self.chunk_size = chunk_size
+
+    def get(self, path, **kwargs):
+        return self.open(path, method='GET', **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open(path, method='POST', **kwargs)
+
+    def open(self, path, method='GET', data=None, content_type=None, headers=None):
+        # Reuse werkzeug's request builder so multipart bodies match the Flask client exactly
+        builder = EnvironBuilder(path=path, method=method, data=data, content_type=content_type, headers=headers)
+        try:
+            environ = builder.get_environ()
+            body = environ['wsgi.input'].read()
+            request_headers = [
+                (key[5:].replace('_', '-').lower().encode('latin-1'), value.encode('latin-1'))
+                for key, value in environ.items() if key.startswith('HTTP_')
+            ]
+            for key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                if environ.get(key):
+                    request_headers.append((key.replace('_', '-').lower().encode('latin-1'), environ[key].encode('latin-1')))
+        finally:
+            builder.close()
+
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'path': builder.path,
+            'query_string': builder.query_string.encode('latin-1'),
+            'headers': request_headers,
+        }
+        return asyncio.run(self._call(scope, body))
+
+    async def _call(self, scope, body):
+        chunks = [body[i:i + self.chunk_size] for i in range(0, len(body), self.chunk_size)] or [b'']
+        status, headers, out = 500, [], []
+
+        async def receive():
+            chunk = chunks.pop(0)
+            return {'type': 'http.request', 'body': chunk, 'more_body': bool(chunks)}
+
+        async def send(message):
+            nonlocal status, headers
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in message.get('headers', [])]
+            elif message['type'] == 'http.response.body':
+                out.append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return Response(b''.join(out), status=status, headers=headers)
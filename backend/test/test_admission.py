@@ -0,0 +1,209 @@
+import io
+import threading
+import time
+import pytest
+from PIL import Image
+from backend.app.admission import (AdmissionController, AdmittedPredictor, DeadlineExceeded, Overloaded, RateLimiter,
+                                   deadline_scope)
+from backend.app.batching import BatchScheduler
+from backend.app.cache import CachedPredictor
+from backend.app.ml_service import MLService
+from backend.app.near_duplicates import NearDuplicatePredictor
+from backend.test.test_batching import BatchMockInterpreter
+
+
+def _png(color=(200, 0, 0)):
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _hold(controller, entered, release):
+    with controller.admit():
+        entered.set()
+        release.wait(5)
+
+
+def test_queue_full_is_rejected_immediately():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, retry_after=2)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=_hold, args=(controller, entered, release))
+    holder.start()
+    entered.wait(5)
+    waiter = threading.Thread(target=lambda: controller.admit().__enter__())
+    try:
+        waiter.start()
+        while controller.stats()["waiting"] < 1:
+            time.sleep(0.001)
+        start = time.perf_counter()
+        with pytest.raises(Overloaded) as excinfo:
+            with controller.admit():
+                pass
+        assert time.perf_counter() - start < 0.1
+        assert excinfo.value.reason == "queue_full" and excinfo.value.retry_after == 2
+    finally:
+        release.set()
+        holder.join()
+        waiter.join()
+    assert controller.stats()["rejected"] == 1
+
+
+def test_deadline_expires_while_waiting():
+    controller = AdmissionController(max_concurrent=1, max_queue=4)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=_hold, args=(controller, entered, release))
+    holder.start()
+    entered.wait(5)
+    try:
+        with pytest.raises(Overloaded) as excinfo:
+            with controller.admit(deadline=time.perf_counter() + 0.02):
+                pass
+        assert excinfo.value.reason == "deadline"
+    finally:
+        release.set()
+        holder.join()
+    stats = controller.stats()
+    assert stats["expired"] == 1 and stats["waiting"] == 0 and stats["active"] == 0
+
+
+def test_wait_without_deadline_is_bounded():
+    # ADMISSION_DEADLINE_MS=0: no deadline, the queue wait still gives up
+    controller = AdmissionController(max_concurrent=1, max_queue=4, max_wait=0.02)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=_hold, args=(controller, entered, release))
+    holder.start()
+    entered.wait(5)
+    try:
+        with pytest.raises(Overloaded) as excinfo:
+            with controller.admit(deadline=None):
+                pass
+        assert excinfo.value.reason == "queue_timeout"
+    finally:
+        release.set()
+        holder.join()
+    stats = controller.stats()
+    assert stats["rejected"] == 1 and stats["waiting"] == 0 and stats["active"] == 0
+
+
+def test_expired_requests_are_dropped_before_invoke():
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    scheduler = BatchScheduler(svc, max_batch_size=4, max_wait_ms=1)
+    controller = AdmissionController(max_concurrent=4)
+    arr = svc.decode(_png())
+    BatchMockInterpreter.invoked_batches.clear()
+    try:
+        with controller.admit(deadline=time.perf_counter() + 0.02):
+            time.sleep(0.03)
+            with pytest.raises(DeadlineExceeded):
+                scheduler.analyze_array(arr)
+        assert BatchMockInterpreter.invoked_batches == []
+        with controller.admit(deadline=time.perf_counter() + 5):
+            assert scheduler.analyze_array(arr)["diagnosis"]["label"] == "anemia"
+    finally:
+        scheduler.close()
+
+
+def test_expired_request_is_dropped_after_interpreter_checkout():
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    arr = svc.decode(_png())
+    BatchMockInterpreter.invoked_batches.clear()
+    entered = threading.Event()
+
+    def hold():
+        with svc.pool.checkout():
+            entered.set()
+            time.sleep(0.05)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    entered.wait(5)
+    try:
+        with deadline_scope(time.perf_counter() + 0.02):
+            with pytest.raises(DeadlineExceeded):
+                svc.analyze_array(arr)
+    finally:
+        holder.join()
+    assert BatchMockInterpreter.invoked_batches == []
+
+
+def test_cache_hits_do_not_take_an_admission_slot():
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    cached = CachedPredictor(AdmittedPredictor(svc, controller), model_version="v1")
+    cached.analyze_bytes(_png())
+    controller.active = 1  # saturated: a miss would be shed at once
+    assert cached.analyze_bytes(_png())["diagnosis"]["cached"] is True
+    with pytest.raises(Overloaded):
+        cached.analyze_bytes(_png((0, 200, 0)))
+    assert controller.stats()["admitted"] == 1 and controller.stats()["rejected"] == 1
+
+
+def test_near_duplicate_decode_runs_inside_an_admission_slot():
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    slots_held = []
+
+    def decode(data):
+        slots_held.append(controller.active)
+        return svc.decode(data)
+
+    admitted = AdmittedPredictor(NearDuplicatePredictor(svc, decode=decode), controller)
+    admitted.analyze_bytes(_png())
+    assert slots_held == [1]
+    controller.active = 1  # saturated: shed before any decode
+    with pytest.raises(Overloaded):
+        admitted.analyze_bytes(_png((0, 200, 0)))
+    assert slots_held == [1]
+
+
+def test_token_bucket_per_client():
+    limiter = RateLimiter(rate=1, burst=2)
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") >= 1
+    assert limiter.acquire("b") == 0
+    assert limiter.limited == 1
+
+
+class BrokenRedis:
+    def register_script(self, script):
+        def run(keys, args):
+            raise ConnectionError("redis down")
+        return run
+
+
+def test_redis_errors_fall_back_to_local_buckets():
+    limiter = RateLimiter(rate=1, burst=1, redis_client=BrokenRedis())
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 1
+
+
+def test_api_sheds_load_with_retry_after(monkeypatch):
+    from backend.app import services
+    from backend.app.main import app
+    from backend.app.asgi import app as asgi_app
+    from backend.test.asgi_client import ASGITestClient
+
+    with services.registry.use() as stack:
+        # Saturated: every cache miss is shed at once
+        monkeypatch.setattr(stack.admission, "max_queue", 0)
+        monkeypatch.setattr(stack.admission, "retry_after", 3)
+        monkeypatch.setattr(stack.admission, "active", stack.admission.max_concurrent)
+    app.config['TESTING'] = True
+    paths = ('/api/predict', f'/api/screen?models={stack.name}')
+    for i, client in enumerate((app.test_client(), ASGITestClient(asgi_app))):
+        for path in paths:
+            data = {'file': (io.BytesIO(_png((1, 2, i))), 'test.png')}
+            r = client.post(path, data=data, content_type='multipart/form-data')
+            assert r.status_code == 503, path
+            assert r.headers['Retry-After'] == '3'
+
+    for client in (app.test_client(), ASGITestClient(asgi_app)):
+        for path in paths:
+            monkeypatch.setattr(services, "rate_limiter", RateLimiter(rate=0.01, burst=1))
+            statuses = []
+            for _ in range(2):
+                data = {'file': (io.BytesIO(_png()), 'test.png')}
+                r = client.post(path, data=data, content_type='multipart/form-data')
+                statuses.append(r.status_code)
+            assert statuses[-1] == 429 and int(r.headers['Retry-After']) >= 1, path
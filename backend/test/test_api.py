@@ -1,10 +1,20 @@
 import io
+import os
+import json
+import tarfile
+import zipfile
 import pytest
+from backend.app.asgi import app as asgi_app
 from backend.app.main import app
+from backend.test.asgi_client import ASGITestClient
 
 
-@pytest.fixture
-def client():
+@pytest.fixture(params=['wsgi', 'asgi'])
+def client(request):
+    """The API contract tests run against both the Flask app and the ASGI entry point."""
+    if request.param == 'asgi':
+        yield ASGITestClient(asgi_app)
+        return
     app.config['TESTING'] = True
     with app.test_client() as client:
         yield client
@@ -51,3 +61,279 @@ def test_results_endpoint(client):
     json = r.get_json()
     assert json['count'] >= 1
     assert isinstance(json['results'], list)
+
+
+
+def _png_bytes(color=(255, 0, 0)):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _ndjson(r):
+    return [json.loads(line) for line in r.get_data(as_text=True).splitlines() if line]
+
+
+def test_predict_batch_multipart_streams_ndjson(client):
+    data = {'files': [
+        (io.BytesIO(_png_bytes()), 'a.png'),
+        (io.BytesIO(b'notanimage'), 'b.txt'),
+        (io.BytesIO(_png_bytes((0, 0, 255))), 'c.png'),
+        (io.BytesIO(b'\xff' * (2 * 1024 * 1024 + 1)), 'big.jpg'),
+    ]}
+    r = client.post('/api/predict/batch', data=data, content_type='multipart/form-data')
+    assert r.status_code == 200
+    assert r.mimetype == 'application/x-ndjson'
+    records = _ndjson(r)
+    items = {rec['filename']: rec for rec in records if 'summary' not in rec}
+    assert items['a.png']['success'] is True and 'diagnosis' in items['a.png']
+    assert items['c.png']['success'] is True
+    assert items['b.txt']['status'] == 400
+    assert items['big.jpg']['status'] == 413
+    summary = records[-1]['summary']
+    assert (summary['total'], summary['succeeded'], summary['failed']) == (4, 2, 2)
+
+
+def test_predict_batch_archives(client):
+    zbuf = io.BytesIO()
+    with zipfile.ZipFile(zbuf, 'w') as zf:
+        zf.writestr('x/one.png', _png_bytes())
+        zf.writestr('notes.txt', 'hello')
+    r = client.post('/api/predict/batch', data=zbuf.getvalue(), content_type='application/zip')
+    summary = _ndjson(r)[-1]['summary']
+    assert summary['total'] == 2 and summary['succeeded'] == 1
+
+    tbuf = io.BytesIO()
+    with tarfile.open(fileobj=tbuf, mode='w:gz') as tf:
+        for name in ('one.png', 'two.png'):
+            payload = _png_bytes()
+            info = tarfile.TarInfo(name)
+            info.size = len(payload)
+            tf.addfile(info, io.BytesIO(payload))
+    r = client.post('/api/predict/batch', data=tbuf.getvalue(), content_type='application/gzip')
+    assert _ndjson(r)[-1]['summary']['succeeded'] == 2
+
+
+def test_predict_batch_body_is_capped(client, monkeypatch):
+    from backend.app.config import settings
+    from backend.app.uploads import BatchTooLarge, BoundedStream, iter_zip_uploads
+
+    monkeypatch.setattr(settings, 'PREDICT_BATCH_MAX_BYTES', 1024)
+    r = client.post('/api/predict/batch', data=b'PK' + b'\x00' * 2048, content_type='application/zip')
+    assert r.status_code == 413
+
+    # Without Content-Length, spooling stops once the cap is passed
+    body = io.BytesIO(b'\x00' * (1 << 20))
+    with pytest.raises(BatchTooLarge):
+        next(iter_zip_uploads(BoundedStream(body, 1024)))
+    assert body.tell() <= 1025
+
+
+def test_asgi_predict_batch_reads_body_in_small_chunks():
+    tbuf = io.BytesIO()
+    with tarfile.open(fileobj=tbuf, mode='w') as tf:
+        for name in ('one.png', 'two.png', 'three.png'):
+            payload = _png_bytes()
+            info = tarfile.TarInfo(name)
+            info.size = len(payload)
+            tf.addfile(info, io.BytesIO(payload))
+    r = ASGITestClient(asgi_app, chunk_size=100).post('/api/predict/batch', data=tbuf.getvalue(),
+                                                      content_type='application/x-tar')
+    assert r.status_code == 200 and r.mimetype == 'application/x-ndjson'
+    assert _ndjson(r)[-1]['summary']['succeeded'] == 3
+
+
+def test_predict_batch_rejects_other_content_types(client):
+    r = client.post('/api/predict/batch', data=b'{}', content_type='application/json')
+    assert r.status_code == 400
+
+
+def test_predict_routes_to_model(client):
+    data = {'file': (io.BytesIO(_png_bytes()), 'test.png')}
+    r = client.post('/api/predict?model=diabetes', data=data, content_type='multipart/form-data')
+    assert r.status_code == 200
+
+    data = {'file': (io.BytesIO(_png_bytes()), 'test.png')}
+    r = client.post('/api/predict?model=unknown', data=data, content_type='multipart/form-data')
+    assert r.status_code == 404
+    assert r.get_json()['error'] == 'Unknown model'
+
+    models = client.get('/api/models').get_json()
+    assert {'anemia', 'diabetes', 'deficiency'} <= set(models['available'])
+    assert 'diabetes' in models['loaded']
+    assert models['loaded']['diabetes']['stats']['cache']['misses'] >= 1
+    assert models['worker'] == os.getpid()
+
+
+def test_predict_batch_unknown_model(client):
+    data = {'files': [(io.BytesIO(_png_bytes()), 'a.png')]}
+    r = client.post('/api/predict/batch?model=unknown', data=data, content_type='multipart/form-data')
+    assert r.status_code == 404
+
+
+def test_screen_runs_all_models(client):
+    data = {'file': (io.BytesIO(_png_bytes()), 'test.png')}
+    r = client.post('/api/screen', data=data, content_type='multipart/form-data')
+    assert r.status_code == 200
+    body = r.get_json()
+    assert {'anemia', 'diabetes', 'deficiency'} <= set(body['models'])
+    assert 'summary' in body and body['wall_ms'] >= 0
+
+    data = {'file': (io.BytesIO(_png_bytes()), 'test.png')}
+    r = client.post('/api/screen?models=anemia,unknown', data=data, content_type='multipart/form-data')
+    assert r.status_code == 404
+
+
+def test_liveness_and_readiness_probes(client):
+    from backend.app.services import startup
+    assert client.get('/health/live').status_code == 200
+    assert startup.wait(10)
+    r = client.get('/health/ready')
+    assert r.status_code == 200
+    assert r.get_json()['status'] == 'ready'
+
+
+def test_admin_reload_requires_token(client, monkeypatch, tmp_path):
+    import dataclasses
+    from backend.app.config import settings
+    from backend.app.services import registry
+    (tmp_path / 'config.json').write_text(json.dumps({"name": "anemia"}))
+    monkeypatch.setitem(registry.specs, 'anemia', dataclasses.replace(registry.specs['anemia'], directory=tmp_path))
+
+    assert client.post('/api/admin/reload?model=anemia').status_code == 403
+    monkeypatch.setattr(settings, 'ADMIN_TOKEN', 's3cret')
+    headers = {'Authorization': 'Bearer wrong'}
+    assert client.post('/api/admin/reload?model=anemia', headers=headers).status_code == 403
+
+    headers = {'Authorization': 'Bearer s3cret'}
+    r = client.post('/api/admin/reload?model=anemia', headers=headers)
+    assert r.status_code == 202 and r.get_json()['reloading'] == 'anemia'
+    assert (tmp_path / '.reload').exists()
+    assert client.post('/api/admin/reload?model=unknown', headers=headers).status_code == 404
+
+    data = {'file': (io.BytesIO(_png_bytes()), 'test.png')}
+    r = client.post('/api/predict', data=data, content_type='multipart/form-data')
+    assert 'model_version' in r.get_json()['diagnosis']
+
+
+class _LazyUpload:
+    """Multipart body produced on demand: a 'file' part of ``size`` bytes (counts what is read)."""
+
+    def __init__(self, size):
+        self.head = (b'--x\r\nContent-Disposition: form-data; name="file"; filename="big.jpg"\r\n'
+                     b'Content-Type: image/jpeg\r\n\r\n')
+        self.remaining = size
+        self.read_bytes = 0
+
+    def read(self, n=-1):
+        if self.head:
+            chunk, self.head = self.head, b''
+        else:
+            n = min(n if n > 0 else 64 * 1024, self.remaining)
+            chunk, self.remaining = b'\xff' * n, self.remaining - n
+        self.read_bytes += len(chunk)
+        return chunk
+
+
+def _wsgi_post(body, content_length=None):
+    """POST /api/predict with a lazy body; the test client would read it to compute Content-Length."""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+    environ = EnvironBuilder(path='/api/predict', method='POST').get_environ()
+    environ.update({'wsgi.input': body, 'CONTENT_TYPE': 'multipart/form-data; boundary=x'})
+    if content_length is None:
+        # Chunked transfer: the server marks the input as terminated
+        environ.pop('CONTENT_LENGTH', None)
+        environ['wsgi.input_terminated'] = True
+    else:
+        environ['CONTENT_LENGTH'] = str(content_length)
+    _, status, _ = run_wsgi_app(app, environ, buffered=True)
+    return int(status.split()[0])
+
+
+def test_predict_rejects_declared_oversized_body_unread():
+    body = _LazyUpload(500 * 1024 * 1024)
+    assert _wsgi_post(body, content_length=500 * 1024 * 1024) == 413
+    assert body.read_bytes == 0
+
+
+def test_predict_streamed_upload_memory_is_bounded():
+    import tracemalloc
+    from backend.app.uploads import CHUNK_SIZE, MAX_REQUEST_BYTES, MAX_UPLOAD_BYTES
+    body = _LazyUpload(200 * 1024 * 1024)
+    tracemalloc.start()
+    try:
+        status = _wsgi_post(body)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert status == 413
+    assert body.read_bytes <= MAX_REQUEST_BYTES + CHUNK_SIZE
+    assert peak < 2 * MAX_UPLOAD_BYTES
+
+
+def test_asgi_upload_stops_reading_past_limit():
+    import asyncio
+    from backend.app.uploads import CHUNK_SIZE, MAX_REQUEST_BYTES
+    body, sent = _LazyUpload(200 * 1024 * 1024), []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body.read(CHUNK_SIZE), 'more_body': True}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/predict', 'query_string': b'',
+             'headers': [(b'content-type', b'multipart/form-data; boundary=x')]}
+    asyncio.run(asgi_app(scope, receive, send))
+    assert sent[0]['status'] == 413
+    assert body.read_bytes <= MAX_REQUEST_BYTES + CHUNK_SIZE
+
+    body, sent = _LazyUpload(0), []
+    scope['headers'].append((b'content-length', str(500 * 1024 * 1024).encode()))
+    asyncio.run(asgi_app(scope, receive, send))
+    assert sent[0]['status'] == 413
+    assert body.read_bytes == 0
+
+
+def test_predict_returns_trace_id(client):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), (255, 0, 0)).save(buf, format='PNG')
+    data = {'file': (io.BytesIO(buf.getvalue()), 'test.png')}
+    traceparent = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+    r = client.post('/api/predict', data=data, content_type='multipart/form-data',
+                    headers={'traceparent': traceparent})
+    assert r.status_code == 200
+    assert r.headers['X-Trace-Id'] == '4bf92f3577b34da6a3ce929d0e0e4736'
+    assert 'X-Trace-Id' not in client.get('/health').headers
+
+
+def test_predict_batch_trace_covers_the_streamed_images(client, monkeypatch):
+    from backend.app import asgi, main, services
+    from backend.app.tracing import Tracer, span
+    from backend.test.test_tracing import ListExporter
+
+    exporter = ListExporter()
+    tracer = Tracer(exporter, sample_rate=1.0, flush_interval=0.01)
+    monkeypatch.setattr(main, 'tracer', tracer)
+    monkeypatch.setattr(asgi, 'tracer', tracer)
+    with services.registry.use() as stack:
+        analyze = stack.bulk_inference.analyze_bytes
+
+        def traced(data):
+            with span("analyze"):
+                return analyze(data)
+        monkeypatch.setattr(stack.bulk_inference, 'analyze_bytes', traced)
+    data = {'files': [(io.BytesIO(_png_bytes((7, 77, i))), f'{i}.png') for i in range(2)]}
+    r = client.post('/api/predict/batch', data=data, content_type='multipart/form-data')
+    assert _ndjson(r)[-1]['summary']['succeeded'] == 2
+    r.close()
+    tracer.close()
+
+    assert tracer.stats()['exported'] == 1
+    root = next(s for s in exporter.spans if s['kind'] == 2)
+    assert root['traceId'] == r.headers['X-Trace-Id']
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root['attributes']
+    # Spans from the bulk workers, recorded while the body was streamed
+    assert sum(s['name'] == 'analyze' for s in exporter.spans) == 2
@@ -0,0 +1,113 @@
+import io
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+import numpy as np
+import pytest
+from PIL import Image
+from backend.app.batching import BatchScheduler
+from backend.app.ml_service import MLService
+from backend.test.test_ml_service import MockInterpreter
+
+
+class BatchMockInterpreter(MockInterpreter):
+    """Supports resize_tensor_input; logits depend on each image's red channel."""
+    invoked_batches = []
+
+    def resize_tensor_input(self, index, shape):
+        self._input = dict(self._input, shape=list(shape))
+
+    def invoke(self):
+        BatchMockInterpreter.invoked_batches.append(self._tensor.shape[0])
+
+    def get_tensor(self, index):
+        red = self._tensor[..., 0].mean(axis=(1, 2))
+        return np.stack([1.0 - red, red], axis=1).astype(np.float32) * 4.0
+
+
+def _png(color):
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_postprocess_batch_vectorized():
+    svc = MLService(interpreter_cls=MockInterpreter, pool_size=1)
+    output = np.array([[0.1, 0.9], [3.0, -1.0], [0.4, 0.6]], dtype=np.float32)
+    probs, idx, confidence, risk = svc.postprocess_batch(output, 3)
+    assert idx.tolist() == [1, 0, 1]
+    assert np.allclose(probs.sum(axis=1), 1.0)
+    assert risk.tolist() == ["high", "high", "medium"]
+
+
+def test_scheduler_batches_and_splits_results():
+    BatchMockInterpreter.invoked_batches = []
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    scheduler = BatchScheduler(svc, max_batch_size=8, max_wait_ms=100)
+    red, blue = _png((255, 0, 0)), _png((0, 0, 255))
+    results = {}
+
+    def call(i):
+        results[i] = scheduler.analyze_bytes(red if i % 2 else blue)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    scheduler.close()
+
+    for i, res in results.items():
+        assert res["diagnosis"]["label"] == ("anemia" if i % 2 else "normal")
+    stats = scheduler.stats()
+    assert stats["items"] == 8
+    assert stats["batches"] < 8
+    assert max(BatchMockInterpreter.invoked_batches) > 1
+
+
+def test_single_request_after_batch_resizes_back():
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    arr = svc.preprocess(_png((255, 0, 0)))
+    svc.run_batch(np.stack([arr, arr, arr]))
+    res = svc.analyze_bytes(_png((255, 0, 0)))
+    assert res["diagnosis"]["label"] == "anemia"
+    assert svc.pool.interpreters[0]._input["shape"][0] == 1
+
+
+def test_batches_are_padded_to_fixed_buckets():
+    BatchMockInterpreter.invoked_batches = []
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    scheduler = BatchScheduler(svc, max_batch_size=6, max_wait_ms=100)
+    assert scheduler.buckets == (1, 2, 4, 6)
+    red, blue = _png((255, 0, 0)), _png((0, 0, 255))
+    futures = [scheduler.submit(svc.preprocess(c)) for c in (red, blue, red)]
+    results = [f.result(timeout=5) for f in futures]
+    scheduler.close()
+
+    assert BatchMockInterpreter.invoked_batches == [4]
+    assert [int(idx) for _, idx, _, _ in results] == [1, 0, 1]
+    assert scheduler.stats()["padded_slots"] == 1
+
+
+class GatedInterpreter(BatchMockInterpreter):
+    gate = threading.Event()
+
+    def invoke(self):
+        GatedInterpreter.gate.wait(5)
+        super().invoke()
+
+
+def test_timed_out_requests_are_not_invoked():
+    BatchMockInterpreter.invoked_batches = []
+    GatedInterpreter.gate.clear()
+    svc = MLService(interpreter_cls=GatedInterpreter, pool_size=1)
+    scheduler = BatchScheduler(svc, max_batch_size=1, max_wait_ms=1, timeout=0.05)
+    arr = svc.decode(_png((255, 0, 0)))
+    busy = scheduler.submit(svc.normalize(arr))  # holds the only dispatcher
+    with pytest.raises(FutureTimeout):
+        scheduler.analyze_array(arr)
+    GatedInterpreter.gate.set()
+    busy.result(timeout=5)
+    scheduler.close()
+
+    assert BatchMockInterpreter.invoked_batches == [1]
+    assert scheduler.stats()["cancelled"] == 1
@@ -0,0 +1,86 @@
+import threading
+import time
+import pytest
+from backend.app.cache import CachedPredictor, LRUCache, content_key
+
+
+class SlowService:
+    def __init__(self):
+        self.calls = 0
+
+    def analyze_bytes(self, image_bytes):
+        self.calls += 1
+        time.sleep(0.05)
+        if image_bytes == b"bad":
+            raise ValueError("Invalid image file")
+        return {"diagnosis": {"label": "anemia", "confidence": 0.9}}
+
+
+def test_lru_eviction_and_ttl():
+    lru = LRUCache(max_entries=2, ttl_seconds=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.evictions == 1
+
+    short = LRUCache(max_entries=2, ttl_seconds=0)
+    short.set("a", 1)
+    assert short.get("a") is None
+    assert short.expirations == 1
+
+
+def test_key_depends_on_model_version():
+    assert content_key(b"img", "v1") != content_key(b"img", "v2")
+
+
+def test_hit_after_miss():
+    svc = SlowService()
+    cached = CachedPredictor(svc, model_version="v1")
+    first = cached.analyze_bytes(b"img")
+    second = cached.analyze_bytes(b"img")
+    assert svc.calls == 1
+    assert "cached" not in first["diagnosis"]
+    assert second["diagnosis"]["cached"] is True
+    assert cached.stats()["hits"] == 1 and cached.stats()["misses"] == 1
+
+
+def test_cache_outcomes_are_exported():
+    prometheus_client = pytest.importorskip("prometheus_client")
+
+    def count(outcome):
+        return prometheus_client.REGISTRY.get_sample_value("healthguard_cache_total", {"outcome": outcome}) or 0
+
+    before = {o: count(o) for o in ("hit", "miss", "eviction")}
+    cached = CachedPredictor(SlowService(), model_version="metrics", max_entries=1)
+    cached.analyze_bytes(b"a")
+    cached.analyze_bytes(b"a")
+    cached.analyze_bytes(b"b")
+    assert count("hit") - before["hit"] == 1
+    assert count("miss") - before["miss"] == 2
+    assert count("eviction") - before["eviction"] == 1
+
+
+def test_concurrent_identical_uploads_are_coalesced():
+    svc = SlowService()
+    cached = CachedPredictor(svc, model_version="v1")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cached.analyze_bytes(b"same"))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert svc.calls == 1
+    assert len(results) == 6
+    assert all(r["diagnosis"]["label"] == "anemia" for r in results)
+
+
+def test_errors_are_not_cached():
+    svc = SlowService()
+    cached = CachedPredictor(svc, model_version="v1")
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cached.analyze_bytes(b"bad")
+    assert svc.calls == 2
@@ -0,0 +1,71 @@
+import io
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import convert_to_tflite
+
+SPEC = SimpleNamespace(name="anemia", labels=["normal", "anemia"],
+                       recommendations={"normal": "", "anemia": ""})
+
+
+def sigmoid_interpreter(p):
+    """Interpréteur factice à une seule sortie sigmoïde, de valeur ``p``."""
+
+    class SigmoidInterpreter:
+        def __init__(self, model_path=None, **kwargs):
+            pass
+
+        def allocate_tensors(self):
+            pass
+
+        def get_input_details(self):
+            return [{"index": 0, "shape": [1, 8, 8, 3], "dtype": np.float32, "quantization": (0.0, 0)}]
+
+        def get_output_details(self):
+            return [{"index": 1, "shape": [1, 1], "dtype": np.float32}]
+
+        def set_tensor(self, index, data):
+            self._n = len(data)
+
+        def invoke(self):
+            pass
+
+        def get_tensor(self, index):
+            return np.full((self._n, 1), p, dtype=np.float32)
+
+    return SigmoidInterpreter
+
+
+def _variants(tmp_path, outputs):
+    held_out = []
+    for i in range(3):
+        path = tmp_path / f"a{i}.png"
+        buf = io.BytesIO()
+        Image.new('RGB', (8, 8), (200, 10 * i, 10)).save(buf, format='PNG')
+        path.write_bytes(buf.getvalue())
+        held_out.append((str(path), "anemia"))
+    results = {}
+    for size, (variant, p) in zip((4000, 1000), outputs.items()):
+        model = tmp_path / f"model.{variant}.tflite"
+        model.write_bytes(b"\0" * size)
+        results[variant] = convert_to_tflite.evaluate(str(model), held_out, SPEC, interpreter_cls=sigmoid_interpreter(p))
+    return results
+
+
+def test_int8_variant_that_flips_predictions_is_not_recommended(tmp_path):
+    results = _variants(tmp_path, {"float32": 0.6, "int8": 0.4})
+    assert results["float32"]["predictions"] == ["anemia"] * 3
+    assert results["int8"]["predictions"] == ["normal"] * 3
+    convert_to_tflite.compare(results)
+    assert results["int8"]["accuracy_delta"] == -1.0 and results["int8"]["agreement"] == 0.0
+    assert convert_to_tflite.recommend(results, tolerance=0.01) == "float32"
+
+
+def test_score_drift_blocks_a_variant_with_the_same_labels(tmp_path):
+    results = _variants(tmp_path, {"float32": 0.9, "int8": 0.6})
+    convert_to_tflite.compare(results)
+    assert results["int8"]["agreement"] == 1.0 and results["int8"]["max_output_diff"] == 0.3
+    assert convert_to_tflite.recommend(results, tolerance=0.01) == "float32"
+    assert convert_to_tflite.recommend(results, tolerance=0.01, max_output_diff=0.5) == "int8"
@@ -0,0 +1,96 @@
+import io
+import struct
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+from backend.app import decoding
+from backend.app.decoding import ImageTooLarge, cv2, decode_image, reduction_factor, resolve_decoder, sniff_format
+
+
+def _encode(size, fmt):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def test_sniff_format():
+    assert sniff_format(_encode((8, 8), 'JPEG')) == 'JPEG'
+    assert sniff_format(_encode((8, 8), 'PNG')) == 'PNG'
+    assert sniff_format(b'notanimage') == 'OTHER'
+
+
+def test_reduction_factor_keeps_target_size():
+    assert reduction_factor(4000, 3000, (224, 224)) == 8
+    assert reduction_factor(1000, 800, (224, 224)) == 2
+    assert reduction_factor(300, 300, (224, 224)) == 1
+
+
+def test_backend_per_format():
+    assert resolve_decoder('auto', 'PNG') == 'pil'
+    assert resolve_decoder('pil-draft', 'PNG') == 'pil'
+    assert resolve_decoder('auto', 'JPEG') == ('opencv' if cv2 is not None else 'pil-draft')
+    with pytest.raises(ValueError):
+        resolve_decoder('turbo', 'JPEG')
+
+
+@pytest.mark.parametrize('decoder', ['pil', 'pil-draft', 'opencv', 'auto'])
+@pytest.mark.parametrize('fmt', ['JPEG', 'PNG'])
+def test_decode_to_model_size(decoder, fmt):
+    arr = decode_image(_encode((1600, 1200), fmt), (224, 224), decoder=decoder)
+    assert arr.shape == (224, 224, 3)
+    assert arr.dtype == np.uint8
+    # Color survives (RGB order, not BGR)
+    assert arr[..., 0].mean() > 150 and arr[..., 2].mean() < 80
+
+
+def test_decode_invalid_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_image(b'\xff\xd8\xff' + b'\x00' * 50, (224, 224))
+
+
+def _png_header(width, height):
+    """PNG with a valid IHDR but no pixel data: only the header can be read."""
+    def chunk(kind, payload):
+        return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload))
+
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', b'') + chunk(b'IEND', b'')
+
+
+@pytest.mark.parametrize('decoder', ['pil', 'opencv'])
+def test_pixel_budget_checked_before_decoding(decoder, monkeypatch):
+    monkeypatch.setattr(decoding, '_decode_pil', lambda *a, **k: pytest.fail('decoded'))
+    monkeypatch.setattr(decoding, '_decode_opencv', lambda *a, **k: pytest.fail('decoded'))
+    with pytest.raises(ImageTooLarge):
+        decode_image(_png_header(8000, 8000), (224, 224), decoder=decoder, max_pixels=50_000_000)
+
+
+def test_pixel_budget_allows_images_within_budget():
+    arr = decode_image(_encode((400, 300), 'PNG'), (224, 224), max_pixels=400 * 300)
+    assert arr.shape == (224, 224, 3)
+    with pytest.raises(ImageTooLarge):
+        decode_image(_encode((400, 300), 'PNG'), (224, 224), max_pixels=400 * 300 - 1)
+
+
+def _exif_rotated_jpeg(size=(1000, 800)):
+    """Left half red, right half blue, with an EXIF 'rotate 90° CW' orientation tag."""
+    w, h = size
+    img = Image.new('RGB', size, (220, 20, 20))
+    img.paste((20, 20, 220), (w // 2, 0, w, h))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=95, exif=exif)
+    return buf.getvalue()
+
+
+@pytest.mark.skipif(cv2 is None, reason="opencv not installed")
+def test_backends_agree_on_exif_rotated_jpeg():
+    data = _exif_rotated_jpeg()
+    reference = decode_image(data, (224, 224), decoder='pil')
+    for decoder in ('pil-draft', 'opencv', 'auto'):
+        arr = decode_image(data, (224, 224), decoder=decoder)
+        # EXIF orientation ignored everywhere: red stays on the left
+        assert arr[:, :100, 0].mean() > 150 and arr[:, 124:, 2].mean() > 150
+        assert np.abs(arr.astype(np.int16) - reference).mean() < 2.0
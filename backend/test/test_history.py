@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import datetime
+import pytest
+from bson import ObjectId
+from pymongo.errors import ServerSelectionTimeoutError
+from backend.app.history import HistoryUnavailable, MongoHistoryWriter, ResultHistory
+
+
+class FakeCollection:
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def insert_many(self, docs, ordered=True):
+        self.gate.wait()
+        time.sleep(self.delay)
+        self.batches.append(list(docs))
+
+
+def _result(i):
+    return {"diagnosis": {"condition": "anemia", "risk_level": "high", "confidence": i / 100}}
+
+
+def test_ring_buffer_is_bounded():
+    history = ResultHistory(max_entries=5)
+    for i in range(20):
+        history.record(_result(i))
+    assert len(history) == 5
+    page = history.page(limit=50)
+    assert [e["result"]["diagnosis"]["confidence"] for e in page["results"]] == [0.19, 0.18, 0.17, 0.16, 0.15]
+
+
+def test_cursor_pagination():
+    history = ResultHistory(max_entries=100)
+    for i in range(7):
+        history.record(_result(i))
+    seen, cursor = [], None
+    while True:
+        page = history.page(limit=3, cursor=cursor)
+        seen += [e["id"] for e in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+
+def test_writer_bulk_inserts_in_batches():
+    coll = FakeCollection()
+    writer = MongoHistoryWriter(coll, batch_size=10, flush_interval=0.05)
+    history = ResultHistory(max_entries=5, writer=writer)
+    for i in range(25):
+        history.record(_result(i), image_bytes=b"img%d" % i)
+    writer.close()
+
+    docs = [d for batch in coll.batches for d in batch]
+    assert len(docs) == 25
+    assert max(len(b) for b in coll.batches) <= 10
+    assert len(coll.batches) < 25
+    assert docs[0]["condition"] == "anemia" and len(docs[0]["image_hash"]) == 64
+    assert writer.stats()["written"] == 25
+
+
+def test_writer_never_blocks_the_request():
+    coll = FakeCollection()
+    coll.gate.clear()  # MongoDB stalled
+    writer = MongoHistoryWriter(coll, batch_size=1, flush_interval=0.01, max_queue=3)
+    history = ResultHistory(writer=writer)
+
+    start = time.perf_counter()
+    for i in range(50):
+        history.record(_result(i))
+    assert time.perf_counter() - start < 0.5
+    assert writer.stats()["dropped"] > 0
+
+    coll.gate.set()
+    writer.close()
+
+
+class FakeCursor(list):
+    def sort(self, keys):
+        self.sorted_by = keys
+        return self
+
+    def limit(self, n):
+        return FakeCursor(self[:n])
+
+
+class FakeReadCollection(FakeCollection):
+    def __init__(self, docs=(), error=None):
+        super().__init__()
+        self.docs = list(docs)
+        self.error = error
+        self.queries = []
+
+    def find(self, query):
+        if self.error is not None:
+            raise self.error
+        self.queries.append(query)
+        return FakeCursor(self.docs)
+
+
+def test_mongo_pages_on_the_timestamp_index():
+    ids = [ObjectId() for _ in range(3)]
+    ts = datetime(2026, 1, 28, 10, 30, 0, 123000)
+    coll = FakeReadCollection([{"_id": i, "timestamp": ts, "result": _result(1)} for i in ids])
+    writer = MongoHistoryWriter(coll, flush_interval=0.01)
+    try:
+        history = ResultHistory(writer=writer)
+        page = history.page(limit=2)
+        assert [r["id"] for r in page["results"]] == [str(i) for i in ids[:2]]
+        history.page(limit=2, cursor=page["next_cursor"])
+        query = coll.queries[-1]["$or"]
+        assert query[0]["timestamp"]["$lt"] == query[1]["timestamp"]
+        assert query[1]["timestamp"].replace(tzinfo=None) == ts and query[1]["_id"]["$lt"] == ids[1]
+    finally:
+        writer.close()
+
+
+def test_mongo_outage_is_reported_as_unavailable():
+    writer = MongoHistoryWriter(FakeReadCollection(error=ServerSelectionTimeoutError("down")), flush_interval=0.01)
+    try:
+        with pytest.raises(HistoryUnavailable):
+            ResultHistory(writer=writer).page()
+        with pytest.raises(ValueError):
+            ResultHistory(writer=writer).page(cursor="not-a-cursor")
+    finally:
+        writer.close()
@@ -0,0 +1,78 @@
+import threading
+import time
+import numpy as np
+import pytest
+from backend.app.interpreter_pool import InterpreterPool, InterpreterPoolTimeout, default_pool_config
+from backend.app.ml_service import MLService
+from backend.test.test_ml_service import MockInterpreter
+
+
+class CountingInterpreter(MockInterpreter):
+    """Records how many interpreters run invoke() at the same time."""
+    active = 0
+    peak = 0
+    guard = threading.Lock()
+
+    def invoke(self):
+        cls = CountingInterpreter
+        with cls.guard:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        time.sleep(0.02)
+        with cls.guard:
+            cls.active -= 1
+
+
+def _png():
+    from PIL import Image
+    import io
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), (10, 20, 30)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_default_pool_config_does_not_oversubscribe():
+    for cpus in (1, 2, 4, 8, 16, 64):
+        for workers in (1, 4):
+            size, threads = default_pool_config(workers=workers, cpus=cpus)
+            assert size >= 1 and threads >= 1
+            assert size * threads <= max(1, cpus // workers)
+
+
+def test_checkout_timeout_raises():
+    pool = InterpreterPool(lambda: object(), size=1)
+    held = pool.acquire()
+    with pytest.raises(InterpreterPoolTimeout):
+        pool.acquire(timeout=0.01)
+    pool.release(held)
+    with pool.checkout(timeout=0.01) as interp:
+        assert interp is held
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_pool_runs_requests_concurrently():
+    CountingInterpreter.peak = 0
+    svc = MLService(interpreter_cls=CountingInterpreter, pool_size=4, num_threads=1)
+    assert len(svc.pool.interpreters) == 4
+    img = _png()
+
+    threads = [threading.Thread(target=svc.analyze_bytes, args=(img,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert 1 < CountingInterpreter.peak <= 4
+    assert svc.pool.available == 4
+
+
+def test_num_threads_passed_when_supported():
+    seen = []
+
+    class ThreadedInterpreter(MockInterpreter):
+        def __init__(self, model_path=None, num_threads=None):
+            super().__init__(model_path)
+            seen.append(num_threads)
+
+    MLService(interpreter_cls=ThreadedInterpreter, pool_size=2, num_threads=3)
+    assert seen == [3, 3]
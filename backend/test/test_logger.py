@@ -0,0 +1,43 @@
+import logging
+import queue
+import pytest
+from backend.app.logger import DroppingQueueHandler, setup_logging, shutdown_logging
+
+
+@pytest.fixture
+def app_logging(tmp_path):
+    # setup_logging configures process-wide levels: restore them for the other tests
+    names = ("", "flask.app", "werkzeug")
+    levels = {name: logging.getLogger(name).level for name in names}
+    yield tmp_path
+    shutdown_logging()
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+    for _ in range(5):
+        handler.handle(record)
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_records_are_written_by_the_listener(app_logging):
+    setup_logging(log_dir=app_logging)
+    assert sum(isinstance(h, DroppingQueueHandler) for h in logging.getLogger().handlers) == 1
+    logging.getLogger("healthguard.test").error("written in the background")
+    shutdown_logging()
+
+    assert "written in the background" in (app_logging / "app.log").read_text()
+    assert "written in the background" in (app_logging / "error.log").read_text()
+    assert not any(isinstance(h, DroppingQueueHandler) for h in logging.getLogger().handlers)
+
+
+def test_shutdown_with_a_full_queue(app_logging):
+    setup_logging(log_dir=app_logging, queue_size=1)
+    for i in range(200):
+        logging.getLogger("healthguard.test").warning("burst %d", i)
+    shutdown_logging()
+    assert "burst 0" in (app_logging / "app.log").read_text()
@@ -0,0 +1,56 @@
+import io
+import os
+import subprocess
+import sys
+from PIL import Image
+from backend.app.main import app
+from backend.app.metrics import render_metrics
+from backend.app.ml_service import MLService
+from backend.test.test_ml_service import MockInterpreter
+
+
+def _png():
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 64), (10, 200, 10)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_stage_histograms_recorded():
+    MLService(interpreter_cls=MockInterpreter, pool_size=1).analyze_bytes(_png())
+    body = render_metrics()[0].decode()
+    for stage in ("decode", "resize", "quantize", "invoke", "postprocess"):
+        assert f'healthguard_inference_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'healthguard_queue_wait_seconds_count{queue="interpreter"}' in body
+
+
+def test_metrics_endpoint_counts_requests_and_errors():
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        client.post('/api/predict', data={'file': (io.BytesIO(b'x'), 'a.txt')}, content_type='multipart/form-data')
+        r = client.get('/metrics')
+    assert r.status_code == 200
+    body = r.get_data(as_text=True)
+    assert 'healthguard_errors_total{type="invalid_upload"}' in body
+    assert 'healthguard_api_requests_total{endpoint="/api/predict",method="POST",status="400"}' in body
+
+
+def test_multiprocess_mode_aggregates_workers(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    worker = "from backend.app.metrics import record_error; record_error('busy')"
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', worker], env=env, cwd=root, check=True)
+    out = subprocess.run(
+        [sys.executable, '-c', "from backend.app.metrics import render_metrics; print(render_metrics()[0].decode())"],
+        env=env, cwd=root, check=True, capture_output=True, text=True,
+    ).stdout
+    assert 'healthguard_errors_total{type="busy"} 2.0' in out
+
+
+def test_missing_multiprocess_dir_is_created(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    path = tmp_path / "prometheus_multiproc"
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(path))
+    worker = "from backend.app.metrics import record_error; record_error('busy')"
+    subprocess.run([sys.executable, '-c', worker], env=env, cwd=root, check=True)
+    assert path.is_dir() and any(path.iterdir())
@@ -72,6 +72,37 @@ def test_analyze_bytes_quantized_model():
     assert isinstance(diag["raw_output"], list)
 
 
+class MockInt8Interpreter(MockInterpreter):
+    """Full-int8 model: quantized input and output tensors."""
+
+    def __init__(self, model_path=None):
+        super().__init__(model_path)
+        self._input = {"index": 0, "shape": [1, 8, 8, 3], "dtype": np.int8, "quantization": (1 / 255, -128)}
+        self._output = {"index": 0, "shape": [1, 2], "dtype": np.int8, "quantization": (1 / 256, -128)}
+
+    def get_tensor(self, index):
+        return np.array([[-103, 102]], dtype=np.int8)
+
+
+def test_int8_output_is_dequantized():
+    svc = MLService(interpreter_cls=MockInt8Interpreter)
+    from PIL import Image
+    import io
+    buf = io.BytesIO()
+    Image.new('RGB', (8, 8), (255, 0, 0)).save(buf, format='PNG')
+    diag = svc.analyze_bytes(buf.getvalue())["diagnosis"]
+    assert np.allclose(diag["raw_output"], [25 / 256, 230 / 256])
+    assert diag["label"] == "anemia" and diag["confidence"] == 0.9
+
+
+def test_single_sigmoid_output_is_thresholded():
+    svc = MLService(interpreter_cls=MockInterpreter)
+    probs, idx, confidence, risk = svc.postprocess_batch(np.array([[0.2], [0.7], [3.0]], dtype=np.float32), 3)
+    assert idx.tolist() == [0, 1, 1]
+    assert np.allclose(confidence, [0.8, 0.7, 1 / (1 + np.exp(-3.0))])
+    assert [svc.labels[i] for i in idx] == ["normal", "anemia", "anemia"]
+
+
 def test_invalid_image_raises():
     svc = MLService(interpreter_cls=MockInterpreter)
     with pytest.raises(ValueError):
@@ -98,3 +129,133 @@ def test_thread_safety_multiple_calls():
 
     # if no exception, consider passed
     assert True
+
+
+class TensorViewInterpreter(MockInterpreter):
+    """Exposes interpreter.tensor() like TFLite: a view over its own input buffer."""
+
+    def __init__(self, model_path=None):
+        super().__init__(model_path)
+        self._input = {"index": 0, "shape": [1, 224, 224, 3], "dtype": np.float32, "quantization": (0.0, 0)}
+
+    def allocate_tensors(self):
+        self._buffer = np.zeros(self._input["shape"], dtype=np.float32)
+
+    def tensor(self, index):
+        return lambda: self._buffer
+
+    def invoke(self):
+        pass
+
+
+def _legacy_normalize(arr, dtype, scale, zero_point):
+    if np.issubdtype(dtype, np.floating):
+        return arr.astype(np.float32) / 255.0
+    arr = (arr.astype(np.float32) / 255.0) / scale + zero_point
+    return np.clip(np.round(arr).astype(np.int32), 0, 255).astype(np.uint8)
+
+
+def test_inplace_normalization_matches_legacy_path():
+    pixels = np.random.default_rng(0).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+
+    svc = MLService(interpreter_cls=MockQuantInterpreter, pool_size=1)
+    out = np.empty((8, 8, 3), dtype=np.uint8)
+    svc.normalize(pixels, out=out, scratch=np.empty((8, 8, 3), dtype=np.float32))
+    assert np.array_equal(out, _legacy_normalize(pixels, np.uint8, 0.1, 128))
+
+    svc = MLService(interpreter_cls=TensorViewInterpreter, pool_size=1)
+    pixels = np.random.default_rng(1).integers(0, 256, (224, 224, 3), dtype=np.uint8)
+    svc.run_inplace(pixels)
+    written = svc.pool.interpreters[0]._buffer[0]
+    assert np.array_equal(written, _legacy_normalize(pixels, np.float32, 0.0, 0))
+
+
+def test_zero_copy_hot_loop_does_not_allocate():
+    import tracemalloc
+    svc = MLService(interpreter_cls=TensorViewInterpreter, pool_size=1)
+    interpreter = svc.pool.interpreters[0]
+    pixels = np.full((224, 224, 3), 128, dtype=np.uint8)
+    input_bytes = pixels.size * 4
+
+    svc.run_inplace(pixels)
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(50):
+            svc._write_input(interpreter, pixels)
+        current, peak = tracemalloc.get_traced_memory()
+
+        tracemalloc.reset_peak()
+        svc.normalize(pixels)
+        _, legacy_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # No full-size intermediate per request, and nothing retained across requests
+    assert peak - baseline < input_bytes // 4
+    assert current - baseline < 4096
+    assert legacy_peak - baseline >= input_bytes
+
+
+def test_memory_flat_across_requests():
+    import io
+    import tracemalloc
+    from PIL import Image
+    svc = MLService(interpreter_cls=TensorViewInterpreter, pool_size=1)
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (90, 10, 10)).save(buf, format='JPEG')
+    img = buf.getvalue()
+
+    for _ in range(5):
+        svc.analyze_bytes(img)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(50):
+            svc.analyze_bytes(img)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert after - before < 64 * 1024
+
+
+def test_inference_log_is_sampled(caplog):
+    import io
+    import logging
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 64), (90, 10, 10)).save(buf, format='JPEG')
+    img = buf.getvalue()
+
+    with caplog.at_level(logging.INFO, logger="backend.app.ml_service"):
+        MLService(interpreter_cls=MockInterpreter, log_sample_rate=0.0).analyze_bytes(img)
+        assert "Inference done" not in caplog.text
+        # Slow inferences are always logged (MockInterpreter.invoke sleeps 10 ms)
+        MLService(interpreter_cls=MockInterpreter, log_sample_rate=0.0, slow_log_ms=5).analyze_bytes(img)
+        assert "Inference done" in caplog.text
+
+
+class ThreadedInterpreter(MockInterpreter):
+    def __init__(self, model_path=None, num_threads=None):
+        if num_threads == 0:
+            raise TypeError("num_threads must be >= 1")  # a genuine constructor error
+        super().__init__(model_path)
+        self.num_threads = num_threads
+
+
+def test_interpreter_options_follow_the_constructor_signature(caplog):
+    svc = MLService(interpreter_cls=ThreadedInterpreter, pool_size=1, num_threads=3)
+    assert svc.pool.interpreters[0].num_threads == 3 and svc.num_threads == 3
+
+    with caplog.at_level("WARNING", logger="backend.app.ml_service"):
+        svc = MLService(interpreter_cls=MockInterpreter, pool_size=1, num_threads=3)
+    assert svc.num_threads == 1
+    assert any("num_threads" in r.getMessage() for r in caplog.records)
+
+
+def test_interpreter_type_errors_are_not_swallowed(monkeypatch):
+    from backend.app import ml_service
+    monkeypatch.setattr(ml_service, "default_pool_config", lambda workers=1: (1, 0))
+    with pytest.raises(TypeError):
+        MLService(interpreter_cls=ThreadedInterpreter, pool_size=1, num_threads=0)
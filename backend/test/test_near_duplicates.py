@@ -0,0 +1,89 @@
+import io
+import numpy as np
+from PIL import Image
+from backend.app.decoding import decode_image
+from backend.app.near_duplicates import NearDuplicatePredictor, PerceptualIndex, dhash, hamming
+
+
+def _photo(seed, size=(640, 480)):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    return np.asarray(Image.fromarray(small).resize(size, Image.BICUBIC))
+
+
+def _jpeg(arr, quality=90, size=None):
+    img = Image.fromarray(arr)
+    if size:
+        img = img.resize(size)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def _decode(data):
+    return decode_image(data, (64, 64))
+
+
+class CountingPredictor:
+    def __init__(self, label="anemia"):
+        self.calls = 0
+        self.label = label
+
+    def analyze_array(self, arr, start=None):
+        self.calls += 1
+        return {"diagnosis": {"label": self.label, "confidence": 0.9}}
+
+
+def test_dhash_tolerates_resize_and_recompression():
+    photo = _photo(0)
+    original = dhash(_decode(_jpeg(photo)))
+    resaved = dhash(_decode(_jpeg(photo, quality=40, size=(320, 240))))
+    other = dhash(_decode(_jpeg(_photo(1))))
+    hashes = np.array([resaved, other], dtype=np.uint64)
+    near, far = hamming(hashes, original)
+    assert near <= 4
+    assert far > 10
+
+
+def test_index_is_bounded_and_expires():
+    index = PerceptualIndex(max_entries=2, ttl_seconds=60)
+    index.add(0b0001, {"n": 1})
+    index.add(0b1111_0000, {"n": 2})
+    index.add(0xFFFF_0000_0000, {"n": 3})
+    assert len(index) == 2 and index.evictions == 1
+    assert index.lookup(0b0001, 0) is None  # overwritten
+    assert index.lookup(0b1111_0001, 1) == ({"n": 2}, 1)
+
+    expired = PerceptualIndex(max_entries=2, ttl_seconds=0)
+    expired.add(7, {"n": 1})
+    assert expired.lookup(7, 0) is None
+
+
+def test_near_duplicate_skips_inference():
+    predictor = CountingPredictor()
+    near = NearDuplicatePredictor(predictor, decode=_decode, audit_rate=0)
+    photo = _photo(0)
+    first = near.analyze_bytes(_jpeg(photo))
+    second = near.analyze_bytes(_jpeg(photo, quality=40, size=(320, 240)))
+    near.analyze_bytes(_jpeg(_photo(1)))
+
+    assert predictor.calls == 2
+    assert "cached" not in first["diagnosis"]
+    assert second["diagnosis"]["cached"] is True
+    assert second["diagnosis"]["near_duplicate_distance"] <= 4
+    stats = near.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["entries"] == 2
+
+
+def test_audit_counts_disagreements():
+    predictor = CountingPredictor()
+    near = NearDuplicatePredictor(predictor, decode=_decode, audit_rate=1.0)
+    data = _jpeg(_photo(0))
+    near.analyze_bytes(data)
+    predictor.label = "normal"
+    result = near.analyze_bytes(data)
+
+    # Audited hits are served from the fresh inference
+    assert predictor.calls == 2
+    assert result["diagnosis"]["label"] == "normal"
+    assert near.stats()["audits"] == 1 and near.stats()["disagreements"] == 1
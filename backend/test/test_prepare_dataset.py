@@ -0,0 +1,72 @@
+import io
+import json
+import numpy as np
+import pytest
+from PIL import Image
+import prepare_dataset
+
+
+def _write(path, color):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    buf = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buf, format='PNG')
+    path.write_bytes(buf.getvalue())
+
+
+def test_prepare_decodes_once_and_updates_incrementally(tmp_path, monkeypatch):
+    dataset, cache = tmp_path / "dataset", tmp_path / "cache"
+    for i in range(3):
+        _write(dataset / "anemia" / f"a{i}.png", (200, 10 * i, 10))
+        _write(dataset / "normal" / f"n{i}.png", (10, 10 * i, 200))
+
+    stats = prepare_dataset.prepare(dataset, cache, size=(16, 16), shard_size=4)
+    assert stats == {"added": 6, "removed": 0, "skipped": 0, "total": 6, "shards": 2, "dead_rows": 0,
+                     "compacted": False}
+
+    # Unchanged images are not decoded again
+    monkeypatch.setattr(prepare_dataset, 'decode_image', lambda *a, **k: pytest.fail("decoded an unchanged image"))
+    assert prepare_dataset.prepare(dataset, cache, size=(16, 16))["added"] == 0
+    monkeypatch.undo()
+
+    _write(dataset / "normal" / "n3.png", (0, 0, 255))
+    (dataset / "anemia" / "a0.png").unlink()
+    stats = prepare_dataset.prepare(dataset, cache, size=(16, 16), shard_size=4)
+    assert (stats["added"], stats["removed"], stats["total"], stats["shards"]) == (1, 1, 6, 3)
+    # The removed image is still a dead row in its shard, below the compaction threshold
+    assert stats["dead_rows"] == 1 and not stats["compacted"]
+
+    rows, labels = [], []
+    for subset in ("training", "validation"):
+        shards, subset_rows, subset_labels, class_names, _ = prepare_dataset.load_split(cache, subset)
+        rows += [shards[s][r] for s, r in subset_rows]
+        labels += subset_labels.tolist()
+    assert class_names == ["anemia", "normal"]
+    assert len(rows) == 6 and all(r.shape == (16, 16, 3) and r.dtype == np.uint8 for r in rows)
+    # Same class indices as image_dataset_from_directory (sorted folder names)
+    assert sorted(labels) == [0, 0, 1, 1, 1, 1]
+
+    stats = prepare_dataset.prepare(dataset, cache, size=(16, 16), shard_size=4, compact=True)
+    assert stats["shards"] == 2
+    files = {s["file"] for s in json.loads((cache / "manifest.json").read_text())["shards"]}
+    assert {p.name for p in cache.glob("shard-*.npy")} == files
+
+
+def test_prepare_compacts_past_the_dead_row_ratio(tmp_path):
+    dataset, cache = tmp_path / "dataset", tmp_path / "cache"
+    for i in range(4):
+        _write(dataset / "anemia" / f"a{i}.png", (200, 10 * i, 10))
+        _write(dataset / "normal" / f"n{i}.png", (10, 10 * i, 200))
+    prepare_dataset.prepare(dataset, cache, size=(16, 16), shard_size=4)
+
+    # Re-encoded images: 2 dead rows out of 10 stored, then 5 out of 13
+    for i in range(2):
+        _write(dataset / "anemia" / f"a{i}.png", (100, 10 * i, 10))
+    stats = prepare_dataset.prepare(dataset, cache, size=(16, 16), shard_size=4)
+    assert (stats["dead_rows"], stats["compacted"]) == (2, False)
+
+    for i in range(3):
+        _write(dataset / "normal" / f"n{i}.png", (10, 10 * i, 100))
+    stats = prepare_dataset.prepare(dataset, cache, size=(16, 16), shard_size=4)
+    assert (stats["dead_rows"], stats["compacted"], stats["total"], stats["shards"]) == (0, True, 8, 2)
+    files = {s["file"] for s in json.loads((cache / "manifest.json").read_text())["shards"]}
+    assert {p.name for p in cache.glob("shard-*.npy")} == files
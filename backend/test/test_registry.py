@@ -0,0 +1,181 @@
+import json
+import threading
+import pytest
+from backend.app.ml_service import MLService
+from backend.app.registry import RELOAD_MARKER, ModelRegistry, ModelSpec, ModelWatcher, UnknownModel, discover_models
+from backend.test.test_ml_service import MockInterpreter
+
+MB = 1024 * 1024
+
+
+class FakeModel:
+    def __init__(self, spec, memory_mb=100):
+        self.name = spec.name
+        self.memory_bytes = memory_mb * MB
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _write_config(root, name, **config):
+    (root / name).mkdir()
+    (root / name / "config.json").write_text(json.dumps({"name": name, **config}))
+
+
+def _registry(tmp_path, names=("a", "b", "c"), budget_mb=250, loader=FakeModel):
+    for name in names:
+        _write_config(tmp_path, name, labels=["normal", name])
+    loaded = []
+
+    def load(spec):
+        loaded.append(spec.name)
+        return loader(spec)
+
+    return ModelRegistry(discover_models(tmp_path), load, memory_budget_bytes=budget_mb * MB, default="a"), loaded
+
+
+def test_discovery_reads_config_and_skips_invalid(tmp_path):
+    _write_config(tmp_path, "anemia", labels=["normal", "anemia"], recommendations={"anemia": "Blood test"})
+    (tmp_path / "broken").mkdir()
+    (tmp_path / "broken" / "config.json").write_text("")
+    (tmp_path / "no_config").mkdir()
+
+    specs = discover_models(tmp_path)
+    assert list(specs) == ["anemia"]
+    spec = specs["anemia"]
+    assert spec.labels == ["normal", "anemia"]
+    assert spec.model_path == str(tmp_path / "anemia" / "model.tflite")
+
+
+def test_models_are_loaded_lazily_once(tmp_path):
+    registry, loaded = _registry(tmp_path)
+    assert loaded == []
+    with registry.use() as model:
+        assert model.name == "a"
+    with registry.use("a"):
+        pass
+    assert loaded == ["a"]
+    with pytest.raises(UnknownModel):
+        with registry.use("missing"):
+            pass
+    assert "b" in registry and "missing" not in registry
+
+
+def test_lru_eviction_under_memory_budget(tmp_path):
+    registry, loaded = _registry(tmp_path)
+    with registry.use("a") as a:
+        pass
+    with registry.use("b"):
+        pass
+    with registry.use("a"):
+        pass  # a is now more recent than b
+    with registry.use("c"):
+        pass
+    stats = registry.stats()
+    assert sorted(stats["loaded"]) == ["a", "c"]
+    assert stats["evictions"] == 1 and stats["memory_used_bytes"] <= 250 * MB
+    assert not a.closed
+
+    with registry.use("b"):
+        pass
+    assert loaded == ["a", "b", "c", "b"]
+    assert a.closed
+
+
+def test_evicted_model_in_use_is_closed_after_release(tmp_path):
+    registry, _ = _registry(tmp_path, budget_mb=150)
+    with registry.use("a") as a:
+        with registry.use("b"):
+            assert "a" not in registry.stats()["loaded"]
+            assert not a.closed  # still serving the outer request
+    assert a.closed
+
+
+def test_concurrent_first_use_loads_once(tmp_path):
+    registry, loaded = _registry(tmp_path)
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        with registry.use("b"):
+            pass
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert loaded == ["b"]
+
+
+def test_service_uses_model_config(tmp_path):
+    _write_config(tmp_path, "diabetes", labels=["normal", "retinopathy"],
+                  recommendations={"retinopathy": "Eye exam"}, description="Diabetes screening")
+    spec = discover_models(tmp_path)["diabetes"]
+    svc = MLService(model_path=spec.model_path, interpreter_cls=MockInterpreter, name=spec.name,
+                    labels=spec.labels, recommendations=spec.recommendations, description=spec.description)
+    result = svc.format_result(*[x[0] for x in svc.postprocess_batch(MockInterpreter().get_tensor(0), 1)], 0)
+    assert result["diagnosis"]["model"] == "diabetes"
+    assert result["diagnosis"]["condition"] == "retinopathy"
+    assert result["diagnosis"]["recommendation"] == "Eye exam"
+    assert result["description"] == "Diabetes screening"
+    assert svc.estimated_memory_bytes() > 0
+
+
+class VersionedModel(FakeModel):
+    def __init__(self, spec, memory_mb=100):
+        super().__init__(spec, memory_mb)
+        self.model_version = (spec.directory / "model.tflite").read_text()
+        self.load_error = None if self.model_version != "broken" else "invalid model"
+
+
+def _versioned_registry(tmp_path, warmed=None):
+    _write_config(tmp_path, "anemia")
+    (tmp_path / "anemia" / "model.tflite").write_text("v1")
+    warm = (lambda model: warmed.append(model.model_version)) if warmed is not None else None
+    return ModelRegistry(discover_models(tmp_path), VersionedModel, default="anemia", warm=warm)
+
+
+def test_reload_swaps_atomically_and_drains_old_version(tmp_path):
+    warmed = []
+    registry = _versioned_registry(tmp_path, warmed)
+    with registry.use() as old:
+        (tmp_path / "anemia" / "model.tflite").write_text("v2")
+        assert registry.reload("anemia")
+        assert warmed == ["v2"]  # warmed before being swapped in
+        with registry.use() as new:
+            assert new.model_version == "v2"
+        assert old.model_version == "v1" and not old.closed  # in-flight request keeps v1
+    assert old.closed and not new.closed
+    assert registry.stats()["loaded"]["anemia"]["version"] == "v2"
+
+
+def test_failed_reload_keeps_serving_old_version(tmp_path):
+    registry = _versioned_registry(tmp_path)
+    with registry.use():
+        pass
+    (tmp_path / "anemia" / "model.tflite").write_text("broken")
+    assert not registry.reload("anemia")
+    with registry.use() as model:
+        assert model.model_version == "v1" and not model.closed
+
+
+def test_watcher_reloads_once_file_is_stable(tmp_path):
+    registry = _versioned_registry(tmp_path)
+    watcher = ModelWatcher(registry, interval=60)
+    with registry.use():
+        pass
+    assert watcher.poll() == []
+
+    model_file = tmp_path / "anemia" / "model.tflite"
+    model_file.write_text("v2-longer")
+    assert watcher.poll() == []  # first sighting: wait for the copy to finish
+    assert watcher.poll() == ["anemia"]
+    assert watcher.poll() == []
+    with registry.use() as model:
+        assert model.model_version == "v2-longer"
+
+    (tmp_path / "anemia" / RELOAD_MARKER).touch()
+    watcher.acknowledge("anemia")  # change already handled by the admin trigger
+    assert watcher.poll() == [] and watcher.poll() == []
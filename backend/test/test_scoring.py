@@ -0,0 +1,94 @@
+import io
+import json
+import pytest
+from collections import Counter
+from PIL import Image
+from backend.app import scoring
+from backend.test.test_batching import BatchMockInterpreter
+
+SERVICE = dict(model_path="mock.tflite", interpreter_cls=BatchMockInterpreter, pool_size=1,
+               labels=["normal", "anemia"])
+
+
+def _png(color):
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / "dataset"
+    for label, color, count in (("anemia", (255, 0, 0), 5), ("normal", (0, 0, 255), 4)):
+        (root / label).mkdir(parents=True)
+        for i in range(count):
+            (root / label / f"{i}.png").write_bytes(_png(color))
+    (root / "normal" / "broken.jpg").write_bytes(b"not an image")
+    (root / "normal" / "notes.txt").write_text("ignored")
+    return root
+
+
+def test_iter_images_streams_sorted_images(dataset):
+    paths = list(scoring.iter_images([str(dataset)]))
+    assert len(paths) == 10
+    assert paths[0].endswith("anemia/0.png") and not any(p.endswith(".txt") for p in paths)
+
+
+@pytest.mark.parametrize("ext", ["jsonl", "csv"])
+def test_score_writes_results_and_confusion(dataset, tmp_path, ext):
+    output = tmp_path / f"scores.{ext}"
+    report = scoring.score([str(dataset)], str(output), SERVICE, workers=2, batch_size=3)
+
+    assert report["images"] == 10 and report["errors"] == 1 and report["skipped"] == 0
+    assert report["images_per_sec"] > 0
+    assert set(report["stages"]) == set(scoring.STAGES)
+    assert report["confusion"] == {"labels": ["normal", "anemia"], "matrix": [[4, 0], [0, 5]], "accuracy": 1.0}
+
+    writer = scoring.ResultWriter(str(output), resume=True)
+    writer.close()
+    # The unreadable image is not marked as done: it is retried on --resume
+    assert len(writer.done) == 9 and not any(p.endswith("broken.jpg") for p in writer.done)
+
+
+def test_score_resumes_after_interruption(dataset, tmp_path):
+    output = tmp_path / "scores.jsonl"
+    scoring.score([str(dataset)], str(output), SERVICE, workers=1, batch_size=4)
+    lines = output.read_text().splitlines()
+    # Simulate a crash: three results lost and a half-written last line
+    output.write_text("\n".join(lines[:7]) + "\n" + lines[7][:10])
+
+    report = scoring.score([str(dataset)], str(output), SERVICE, workers=1, batch_size=4, resume=True)
+
+    assert report["skipped"] == 7 and report["images"] == 3
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(r["path"] for r in rows) == sorted(scoring.iter_images([str(dataset)]))
+    # The confusion matrix covers the resumed results too
+    assert report["confusion"]["matrix"] == [[4, 0], [0, 5]]
+
+
+def test_resume_retries_errored_images(dataset, tmp_path):
+    output = tmp_path / "scores.jsonl"
+    scoring.score([str(dataset)], str(output), SERVICE, workers=1, batch_size=4)
+    (dataset / "normal" / "broken.jpg").write_bytes(_png((0, 0, 255)))
+
+    report = scoring.score([str(dataset)], str(output), SERVICE, workers=1, batch_size=4, resume=True)
+
+    assert report["skipped"] == 9 and report["images"] == 1 and report["errors"] == 0
+    assert report["confusion"]["matrix"] == [[5, 0], [0, 5]]
+
+
+def test_confusion_matrix_ignores_unlabelled_images():
+    counts = Counter({("anemia", "normal"): 1, (None, "anemia"): 1, ("normal", "normal"): 1})
+    confusion = scoring.confusion_matrix(counts, ["normal", "anemia"])
+    assert confusion["matrix"] == [[1, 0], [1, 0]] and confusion["accuracy"] == 0.5
+    assert scoring.confusion_matrix(Counter({(None, "anemia"): 3}), ["normal", "anemia"]) is None
+
+
+def test_reservoir_keeps_a_bounded_sample_and_exact_mean():
+    reservoir = scoring.Reservoir(size=100)
+    for i in range(10000):
+        reservoir.add(float(i))
+    assert len(reservoir.values) == 100 and reservoir.count == 10000
+    assert reservoir.total / reservoir.count == 4999.5
+    # Uniform sample: the kept values span the whole series, not just its start
+    assert max(reservoir.values) > 5000
@@ -0,0 +1,68 @@
+import io
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from backend.app import decoding, screening
+from backend.app.batching import BatchScheduler
+from backend.app.decoding import decode_images
+from backend.app.ml_service import MLService
+from backend.test.test_ml_service import MockInterpreter, MockQuantInterpreter
+
+
+def _jpeg(size=(640, 480)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def test_decode_images_shares_one_decode(monkeypatch):
+    calls = []
+    real = decoding.decode_image
+
+    def counting(*args, **kwargs):
+        calls.append(args[1])
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(decoding, 'decode_image', counting)
+    arrays = decode_images(_jpeg(), {(32, 32), (8, 8)})
+    assert len(calls) == 1
+    assert arrays[(32, 32)].shape == (32, 32, 3) and arrays[(8, 8)].shape == (8, 8, 3)
+
+
+def test_screen_decodes_once_and_runs_every_model(monkeypatch):
+    anemia = MLService(interpreter_cls=MockInterpreter, name="anemia")
+    diabetes = MLService(interpreter_cls=MockQuantInterpreter, name="diabetes",
+                         labels=["normal", "retinopathy"], recommendations={})
+    scheduler = BatchScheduler(MLService(interpreter_cls=MockInterpreter, name="deficiency",
+                                         labels=["normal", "deficiency"]), max_wait_ms=1)
+    for svc in (anemia, diabetes, scheduler.service):
+        monkeypatch.setattr(svc, "decode", lambda data: pytest.fail("per-model decode"))
+
+    with ThreadPoolExecutor(4) as executor:
+        report = screening.screen(_jpeg(), {"anemia": anemia, "diabetes": diabetes, "deficiency": scheduler},
+                                  executor)
+    scheduler.close()
+
+    assert set(report["models"]) == {"anemia", "diabetes", "deficiency"}
+    assert all(entry["success"] and entry["latency_ms"] >= 0 for entry in report["models"].values())
+    assert report["models"]["diabetes"]["result"]["diagnosis"]["model"] == "diabetes"
+    # Mock outputs favour class 1 for every model
+    assert sorted(report["summary"]["conditions"]) == ["anemia", "deficiency", "retinopathy"]
+    assert report["summary"]["risk_level"] == "high"
+    assert report["wall_ms"] >= report["decode_ms"]
+
+
+def test_screen_reports_model_failures_and_invalid_images():
+    class Broken:
+        def analyze_bytes(self, data):
+            raise RuntimeError("boom")
+
+    anemia = MLService(interpreter_cls=MockInterpreter)
+    with ThreadPoolExecutor(2) as executor:
+        report = screening.screen(_jpeg(), {"anemia": anemia, "broken": Broken()}, executor)
+        assert report["models"]["anemia"]["success"] is True
+        assert report["models"]["broken"] == {"success": False, "error": "Inference error", "status": 500}
+        assert report["summary"]["conditions"] == ["anemia"]
+
+        with pytest.raises(ValueError):
+            screening.screen(b"notanimage", {"anemia": anemia}, executor)
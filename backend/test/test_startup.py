@@ -0,0 +1,54 @@
+import threading
+import time
+from backend.app.ml_service import MLService, load_tflite
+from backend.app.startup import Startup, process_start_time
+from backend.test.test_batching import BatchMockInterpreter
+
+
+class RecordingInterpreter(BatchMockInterpreter):
+    def __init__(self, model_path=None):
+        super().__init__(model_path)
+        self.invoked_sizes = []
+
+    def invoke(self):
+        self.invoked_sizes.append(self._tensor.shape[0])
+        super().invoke()
+
+
+def test_warmup_runs_every_batch_size_on_every_interpreter():
+    svc = MLService(interpreter_cls=RecordingInterpreter, pool_size=2)
+    seconds = svc.warmup(batch_sizes=range(1, 5))
+    assert seconds > 0
+    for interpreter in svc.pool.interpreters:
+        assert set(interpreter.invoked_sizes) == {1, 2, 3, 4}
+        assert interpreter._input["shape"][0] == 1  # back to single-image shape
+    assert svc.pool.stats()["available"] == 2
+
+
+def test_ready_only_after_warmup_and_errors_do_not_block():
+    startup = Startup()
+    release = threading.Event()
+
+    def warm(name):
+        release.wait(5)
+        if name == "broken":
+            raise RuntimeError("no model")
+        return 0.01
+
+    startup.mark_imported()
+    startup.start_warmup(warm, ["broken", "anemia"])
+    assert not startup.ready and startup.status()["status"] == "starting"
+    release.set()
+    assert startup.wait(5)
+    status = startup.status()
+    assert status["status"] == "ready" and status["warmup_seconds"] == {"anemia": 0.01}
+    assert "broken" in status["warmup_errors"]
+    assert 0 <= status["import_seconds"] <= status["ready_seconds"]
+
+
+def test_process_start_time_is_in_the_past():
+    assert process_start_time() <= time.time()
+
+
+def test_backend_is_resolved_once():
+    assert load_tflite() is load_tflite()
@@ -0,0 +1,102 @@
+import io
+import json
+import threading
+from PIL import Image
+from backend.app import tracing
+from backend.app.batching import BatchScheduler
+from backend.app.ml_service import MLService
+from backend.app.tracing import FileExporter, Tracer, parse_traceparent
+from backend.test.test_batching import BatchMockInterpreter
+
+TRACEPARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+class ListExporter:
+    def __init__(self):
+        self.payloads = []
+
+    def export(self, payload):
+        self.payloads.append(payload)
+
+    @property
+    def spans(self):
+        return [span for payload in self.payloads
+                for resource in payload["resourceSpans"]
+                for scope in resource["scopeSpans"]
+                for span in scope["spans"]]
+
+
+def _png(color):
+    buf = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(TRACEPARENT) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    assert parse_traceparent(TRACEPARENT[:-1] + "0")[2] is False
+    assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert parse_traceparent("garbage") is None
+
+
+def test_unsampled_requests_get_an_id_and_no_spans():
+    exporter = ListExporter()
+    tracer = Tracer(exporter, sample_rate=0.0)
+    request_trace = tracer.begin("POST /api/predict")
+    assert len(request_trace.trace_id) == 32 and not request_trace.sampled
+    assert tracing.current_traces() == ()
+    tracer.finish(request_trace)
+    tracer.close()
+    assert exporter.payloads == []
+
+    # The caller's trace id is kept even when not sampled here
+    assert tracer.begin("POST /api/predict", TRACEPARENT).trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+def test_stage_spans_cross_the_batching_thread():
+    exporter = ListExporter()
+    tracer = Tracer(exporter, sample_rate=1.0, flush_interval=0.01)
+    svc = MLService(interpreter_cls=BatchMockInterpreter, pool_size=1)
+    scheduler = BatchScheduler(svc, max_batch_size=4, max_wait_ms=50)
+
+    def request(color, traceparent=None):
+        request_trace = tracer.begin("POST /api/predict", traceparent)
+        scheduler.analyze_bytes(_png(color))
+        tracer.finish(request_trace, **{"http.status_code": 200})
+
+    try:
+        threads = [threading.Thread(target=request, args=((i * 60, 0, 0),)) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        request((255, 0, 0), TRACEPARENT)
+    finally:
+        scheduler.close()
+        tracer.close()
+
+    by_trace = {}
+    for span in exporter.spans:
+        by_trace.setdefault(span["traceId"], []).append(span)
+    assert len(by_trace) == 4 and tracer.stats()["exported"] == 4
+    for spans in by_trace.values():
+        root = next(s for s in spans if s["kind"] == 2)
+        names = {s["name"] for s in spans if s is not root}
+        assert {"decode", "quantize", "queue_wait", "invoke", "postprocess"} <= names
+        assert all(s["parentSpanId"] == root["spanId"] for s in spans if s is not root)
+    root = next(s for s in by_trace["4bf92f3577b34da6a3ce929d0e0e4736"] if s["kind"] == 2)
+    assert root["parentSpanId"] == "00f067aa0ba902b7"
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root["attributes"]
+
+
+def test_file_exporter_writes_otlp_json_lines(tmp_path):
+    tracer = Tracer(FileExporter(tmp_path / "traces.jsonl"), sample_rate=1.0, flush_interval=0.01)
+    request_trace = tracer.begin("POST /api/predict")
+    with tracing.span("upload_read"):
+        pass
+    tracer.finish(request_trace)
+    tracer.close()
+
+    lines = (tmp_path / "traces.jsonl").read_text().splitlines()
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["POST /api/predict", "upload_read"]
@@ -0,0 +1,46 @@
+import json
+from backend.app.tuning import TUNING_FILE, RuntimeConfig, load_tuning, machine_key, save_tuning
+
+
+def test_tuning_round_trip_per_machine_profile(tmp_path):
+    small = RuntimeConfig(num_threads=1, pool_size=2, batch_size=4)
+    large = RuntimeConfig(num_threads=2, pool_size=4, batch_size=8, xnnpack=False)
+    save_tuning(tmp_path, workers=2, config=small, cpus=4, details={"throughput_rps": 120.0})
+    save_tuning(tmp_path, workers=4, config=large, cpus=32)
+
+    assert load_tuning(tmp_path, workers=2, cpus=4) == small
+    assert load_tuning(tmp_path, workers=4, cpus=32) == large
+    profiles = json.loads((tmp_path / TUNING_FILE).read_text())["profiles"]
+    assert set(profiles) == {machine_key(2, 4), machine_key(4, 32)}
+    assert profiles[machine_key(2, 4)]["throughput_rps"] == 120.0
+
+
+def test_tuning_from_another_machine_is_not_applied(tmp_path):
+    save_tuning(tmp_path, workers=4, config=RuntimeConfig(num_threads=2, pool_size=4, batch_size=8), cpus=32)
+    assert load_tuning(tmp_path, workers=4, cpus=8) is None
+    assert load_tuning(tmp_path, workers=2, cpus=32) is None
+
+
+def test_missing_or_invalid_tuning_is_ignored(tmp_path):
+    assert load_tuning(tmp_path, workers=1) is None
+    (tmp_path / TUNING_FILE).write_text("{not json")
+    assert load_tuning(tmp_path, workers=1) is None
+    (tmp_path / TUNING_FILE).write_text(json.dumps({"profiles": {machine_key(1, 2): {"config": {"threads": 1}}}}))
+    assert load_tuning(tmp_path, workers=1, cpus=2) is None
+
+
+def test_batch_size_resolution_explicit_then_tuned_then_default(tmp_path, monkeypatch):
+    from backend.app.batching import DEFAULT_MAX_BATCH_SIZE
+    from backend.app.config import settings
+    from backend.app.registry import ModelSpec
+    from backend.app.services import ModelStack
+
+    spec = ModelSpec(name="anemia", directory=tmp_path)
+    monkeypatch.setattr(settings, 'RUNTIME_TUNING', True)
+    monkeypatch.setattr(settings, 'BATCH_MAX_SIZE', 0)
+    assert ModelStack(spec).batch_size == DEFAULT_MAX_BATCH_SIZE
+
+    save_tuning(tmp_path, workers=settings.WEB_CONCURRENCY, config=RuntimeConfig(num_threads=1, pool_size=1, batch_size=4))
+    assert ModelStack(spec).batch_size == 4
+    monkeypatch.setattr(settings, 'BATCH_MAX_SIZE', 16)
+    assert ModelStack(spec).batch_size == 16
@@ -0,0 +1,169 @@
+"""
+Autotuner du runtime d'inférence : threads, XNNPACK, taille de lot et interpréteurs par worker.
+
+Pour un modèle donné, le script balaie les combinaisons sur la machine courante,
+restreint à la part de CPU d'un worker (``cpus // --workers`` coeurs, via
+l'affinité du processus) : chaque worker gunicorn n'a que cette part en
+production. Chaque combinaison est mesurée en boucle fermée, avec
+``interpréteurs x lot`` clients concurrents sur des images pré-décodées
+(MLService, et BatchScheduler dès que le lot dépasse 1). On obtient le débit
+(images/s) et les latences p50/p95/p99.
+
+La combinaison au meilleur débit (dont le p95 respecte ``--max-p95-ms``) est
+écrite dans ``ml/<modèle>/tuning.json`` sous le profil de la machine
+(``cpus=N,workers=W``). Chaque type de nœud de production garde ainsi son propre
+réglage, et l'API l'applique au démarrage (``RUNTIME_TUNING``).
+
+Usage (depuis la racine du dépôt, sur la machine cible) :
+    python -m benchmarks.autotune --model anemia --workers 4
+    python -m benchmarks.autotune --model anemia --workers 4 --max-p95-ms 80 --batch-sizes 1,4,8
+    python -m benchmarks.autotune --mock mock-float --workers 4 --dry-run   # sans TFLite
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict
+from pathlib import Path
+
+from backend.app.batching import BatchScheduler, batch_buckets
+from backend.app.decoding import decode_image
+from backend.app.interpreter_pool import available_cpus
+from backend.app.ml_service import MLService
+from backend.app.registry import discover_models
+from backend.app.tuning import RuntimeConfig, machine_key, save_tuning
+from benchmarks.common import collect_images, machine_info, percentiles
+from benchmarks.mock_interpreters import MOCKS
+
+
+@contextmanager
+def pinned_cpus(count: int):
+    """Restreint le processus (et ses threads TFLite) à ``count`` coeurs pendant la mesure."""
+    try:
+        original = os.sched_getaffinity(0)
+    except AttributeError:
+        yield count  # not Linux: measure on every core
+        return
+    os.sched_setaffinity(0, sorted(original)[:count])
+    try:
+        yield count
+    finally:
+        os.sched_setaffinity(0, original)
+
+
+def candidates(cores: int, batch_sizes, xnnpack_options):
+    """Combinaisons sans sursouscription : interpréteurs x threads <= coeurs."""
+    threads = sorted({t for t in (1, 2, 4, 8, 16) if t <= cores} | {cores})
+    for num_threads in threads:
+        pools = sorted({p for p in (1, 2, 4, 8, 16) if p * num_threads <= cores} | {max(1, cores // num_threads)})
+        for pool_size in pools:
+            for batch_size in batch_sizes:
+                for xnnpack in xnnpack_options:
+                    yield RuntimeConfig(num_threads=num_threads, pool_size=pool_size,
+                                        batch_size=batch_size, xnnpack=xnnpack)
+
+
+def measure(config: RuntimeConfig, model_path: str, interpreter_cls, arrays, requests: int,
+            max_wait_ms: float) -> dict:
+    service = MLService(model_path=model_path, interpreter_cls=interpreter_cls, pool_size=config.pool_size,
+                        num_threads=config.num_threads, xnnpack=config.xnnpack)
+    service.warmup(batch_sizes=batch_buckets(config.batch_size))
+    predictor = service if config.batch_size == 1 else \
+        BatchScheduler(service, max_batch_size=config.batch_size, max_wait_ms=max_wait_ms)
+
+    def timed(arr):
+        t0 = time.perf_counter()
+        predictor.analyze_array(arr)
+        return (time.perf_counter() - t0) * 1000
+
+    # Enough clients to keep every interpreter busy with full batches
+    concurrency = config.pool_size * config.batch_size
+    work = [arrays[i % len(arrays)] for i in range(max(requests, 4 * concurrency))]
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, work[:concurrency]))
+            start = time.perf_counter()
+            samples = list(pool.map(timed, work))
+            elapsed = time.perf_counter() - start
+    finally:
+        if predictor is not service:
+            predictor.close()
+    return {**asdict(config), "concurrency": concurrency, "throughput_rps": round(len(work) / elapsed, 2),
+            **percentiles(samples)}
+
+
+def best(results, max_p95_ms: float = None) -> dict:
+    """Meilleur débit parmi les mesures qui respectent le p95 ; à défaut, le plus petit p95."""
+    eligible = [r for r in results if max_p95_ms is None or r["p95_ms"] <= max_p95_ms]
+    if not eligible:
+        return min(results, key=lambda r: r["p95_ms"])
+    return max(eligible, key=lambda r: (r["throughput_rps"], -r["p99_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help='Modèle (sous-répertoire de --models-path)')
+    parser.add_argument('--models-path', default='ml')
+    parser.add_argument('--mock', choices=sorted(MOCKS), help='Interpréteur factice au lieu d\'un vrai modèle')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', 4)),
+                        help='Workers gunicorn en production (part de CPU par worker)')
+    parser.add_argument('--batch-sizes', default='1,2,4,8')
+    parser.add_argument('--requests', type=int, default=200, help='Requêtes par combinaison')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help='Attente du micro-batching')
+    parser.add_argument('--max-p95-ms', type=float, help='Latence p95 maximale admise')
+    parser.add_argument('--dataset', default='dataset')
+    parser.add_argument('--dry-run', action='store_true', help='Ne pas écrire tuning.json')
+    parser.add_argument('--output', help='Résultats complets en JSON')
+    args = parser.parse_args()
+
+    if bool(args.model) == bool(args.mock):
+        parser.error("Indiquer --model ou --mock")
+    if args.mock:
+        model_path, interpreter_cls, directory, size = f"{args.mock}.tflite", MOCKS[args.mock], None, (224, 224)
+        xnnpack_options = (True,)  # no delegate to toggle on a mock
+    else:
+        spec = discover_models(args.models_path)[args.model]
+        model_path, interpreter_cls, directory = spec.model_path, None, spec.directory
+        size = MLService(model_path=model_path, pool_size=1, num_threads=1).input_size or (224, 224)
+        xnnpack_options = (True, False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images = collect_images(Path(args.dataset), Path(tmp))
+        arrays = [decode_image(path.read_bytes(), size) for _, path in images]
+
+    cpus = available_cpus()
+    cores = max(1, cpus // max(1, args.workers))
+    batch_sizes = sorted({int(b) for b in args.batch_sizes.split(',')})
+    configs = list(candidates(cores, batch_sizes, xnnpack_options))
+    print(f"{cpus} CPU, {args.workers} worker(s) : {cores} coeur(s) par worker, {len(configs)} combinaisons")
+
+    results = []
+    with pinned_cpus(cores):
+        for config in configs:
+            result = measure(config, model_path, interpreter_cls, arrays, args.requests, args.max_wait_ms)
+            results.append(result)
+            print(f"threads={config.num_threads:<2} pool={config.pool_size:<2} batch={config.batch_size:<2} "
+                  f"xnnpack={'on ' if config.xnnpack else 'off'}  {result['throughput_rps']:>8.2f} img/s  "
+                  f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms")
+
+    chosen = best(results, args.max_p95_ms)
+    config = RuntimeConfig(num_threads=chosen["num_threads"], pool_size=chosen["pool_size"],
+                           batch_size=chosen["batch_size"], xnnpack=chosen["xnnpack"])
+    print(f"\nRecommandé pour {machine_key(args.workers, cpus)} : {asdict(config)} "
+          f"({chosen['throughput_rps']} img/s, p95 {chosen['p95_ms']} ms)")
+
+    details = {"throughput_rps": chosen["throughput_rps"], "p95_ms": chosen["p95_ms"],
+               "max_p95_ms": args.max_p95_ms, "machine": machine_info(),
+               "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if directory is not None and not args.dry_run:
+        print(f"Écrit dans {save_tuning(directory, args.workers, config, details, cpus=cpus)}")
+    if args.output:
+        Path(args.output).write_text(json.dumps({"recommended": asdict(config), **details, "results": results},
+                                                indent=2) + "\n")
+
+
+if __name__ == '__main__':
+    main()
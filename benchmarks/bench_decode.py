@@ -0,0 +1,99 @@
+"""
+Benchmark décodage + redimensionnement : chemin actuel vs décodage réduit.
+
+Compare pour chaque backend de ``backend.app.decoding`` la latence
+(médiane / p95) et le pic mémoire (RSS max) sur les images de ``dataset/``
+et sur des JPEG/PNG synthétiques de taille téléphone.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_decode --repeat 20
+"""
+import argparse
+import io
+import json
+import multiprocessing as mp
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from backend.app.decoding import DECODERS, cv2, decode_image
+from benchmarks.common import collect_images
+
+
+def baseline_decode(data: bytes, size):
+    """Chemin historique de MLService : décodage complet puis resize."""
+    img = Image.open(io.BytesIO(data)).convert("RGB")
+    return np.asarray(img.resize(size))
+
+
+def _run_backend(backend, paths, size, repeat, queue):
+    # Runs in a fresh process so ru_maxrss reflects this backend only
+    images = [(name, Path(path).read_bytes()) for name, path in paths]
+    decode = (lambda d: baseline_decode(d, size)) if backend == "baseline" else \
+        (lambda d: decode_image(d, size, decoder=backend))
+    decode(images[0][1])
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    per_image = {}
+    for name, data in images:
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            decode(data)
+            timings.append((time.perf_counter() - t0) * 1000)
+        per_image[name] = timings
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    all_ms = np.concatenate([np.asarray(t) for t in per_image.values()])
+    queue.put({
+        "backend": backend,
+        "median_ms": round(float(np.median(all_ms)), 3),
+        "p95_ms": round(float(np.percentile(all_ms, 95)), 3),
+        "peak_rss_delta_kb": int(rss_after - rss_before),
+        "per_image_median_ms": {k: round(float(np.median(v)), 3) for k, v in per_image.items()},
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='dataset')
+    parser.add_argument('--size', type=int, default=224, help='Taille d\'entrée du modèle (carrée)')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--no-synthetic', action='store_true', help='Ignorer les images synthétiques 12 MP')
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    images = collect_images(Path(args.dataset), None if args.no_synthetic else Path(tmp.name))
+    if not images:
+        raise SystemExit(f"Aucune image trouvée dans {args.dataset}")
+
+    backends = ["baseline"] + [d for d in DECODERS if d != "auto" and (d != "opencv" or cv2 is not None)] + ["auto"]
+    size = (args.size, args.size)
+    ctx = mp.get_context("spawn")
+    results = []
+    for backend in backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_backend, args=(backend, images, size, args.repeat, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+    tmp.cleanup()
+
+    base = results[0]["median_ms"]
+    print(f"{len(images)} images, repeat={args.repeat}, target={size}")
+    print(f"{'backend':<10} {'median ms':>10} {'p95 ms':>10} {'speedup':>8} {'peak RSS +KB':>13}")
+    for r in results:
+        speedup = base / r["median_ms"] if r["median_ms"] else float('inf')
+        print(f"{r['backend']:<10} {r['median_ms']:>10.3f} {r['p95_ms']:>10.3f} {speedup:>7.2f}x {r['peak_rss_delta_kb']:>13}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"images": len(images), "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
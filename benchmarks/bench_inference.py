@@ -0,0 +1,179 @@
+"""
+Benchmark d'inférence de bout en bout (décodage, prétraitement, invoke, post-traitement).
+
+Mesure ``MLService.analyze_bytes`` (sans cache) à plusieurs niveaux de
+concurrence : débit (images/s) et latences p50/p95/p99, pour chaque
+interpréteur. Par défaut, des interpréteurs factices (float32 et uint8
+quantifié, ``benchmarks/mock_interpreters.py``) rendent la mesure
+reproductible sans modèle ni TFLite ; ``--model`` ajoute un vrai .tflite.
+
+Les résultats (avec les métadonnées machine) sont écrits en JSON et comparés
+à une référence : le script sort en erreur (code 1) si le débit baisse ou si
+le p95 augmente au-delà de ``--max-regression``. La comparaison n'est qu'indicative
+(avertissement, code 0) si le nombre de CPU ou les versions de numpy, Pillow et
+OpenCV diffèrent de la référence, enregistrée avec ``backend/requirements.txt``.
+``--runs N`` répète la mesure et garde la médiane de chaque valeur (référence :
+au moins 5 exécutions, sur une machine au repos).
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_inference --baseline benchmarks/baselines/mock.json
+    python -m benchmarks.bench_inference --runs 5 --save-baseline benchmarks/baselines/mock.json
+    python -m benchmarks.bench_inference --model ml/anemia/model.tflite --concurrency 1,4,8
+
+``--trace-sample-rate`` enveloppe chaque requête dans une trace (``backend.app.tracing``,
+export vers /dev/null) : comparer 0 à une mesure sans l'option donne le coût du
+traçage désactivé, 1 le coût d'une trace complète.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from backend.app.ml_service import MLService
+from backend.app.tracing import FileExporter, Tracer
+from benchmarks.common import collect_images, machine_info, percentiles
+from benchmarks.mock_interpreters import MOCKS
+
+
+def _run_level(service, payloads, concurrency: int, requests: int, tracer: Tracer = None) -> dict:
+    def timed(data):
+        t0 = time.perf_counter()
+        request_trace = tracer.begin("POST /api/predict") if tracer is not None else None
+        service.analyze_bytes(data)
+        if tracer is not None:
+            tracer.finish(request_trace)
+        return (time.perf_counter() - t0) * 1000
+
+    work = [payloads[i % len(payloads)] for i in range(requests)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, work[:concurrency]))  # warm-up: interpreters, buffers, decoder
+        start = time.perf_counter()
+        samples = list(pool.map(timed, work))
+        elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "requests": requests,
+            "throughput_rps": round(requests / elapsed, 2), **percentiles(samples)}
+
+
+def run(interpreters, images, levels, requests: int, decoder: str, tracer: Tracer = None) -> dict:
+    payloads = [path.read_bytes() for _, path in images]
+    results = {}
+    for name, (model_path, interpreter_cls) in interpreters.items():
+        service = MLService(model_path=model_path, interpreter_cls=interpreter_cls,
+                            pool_size=max(levels), num_threads=1, decoder=decoder)
+        for level in levels:
+            results[f"{name}/c{level}"] = _run_level(service, payloads, level, requests, tracer)
+    return results
+
+
+def median_results(runs: list) -> dict:
+    """Médiane, valeur par valeur, de plusieurs exécutions de ``run``."""
+    merged = {}
+    for key, first in runs[0].items():
+        merged[key] = dict(first)
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            merged[key][metric] = round(float(np.median([r[key][metric] for r in runs])), 3)
+    return merged
+
+
+# Machine keys that change the numbers enough to void the regression gate
+ENVIRONMENT_KEYS = ("cpus", "numpy", "pillow", "opencv")
+
+
+def environment_mismatch(baseline_machine: dict, machine: dict) -> list:
+    """Clés de ``ENVIRONMENT_KEYS`` dont la valeur diffère entre la référence et cette machine."""
+    return [f"{key}={baseline_machine.get(key)} (référence) / {machine.get(key)}"
+            for key in ENVIRONMENT_KEYS if baseline_machine.get(key) != machine.get(key)]
+
+
+def compare(results: dict, baseline: dict, max_regression: float):
+    """Retourne la liste des régressions (débit plus bas ou p95 plus haut que la tolérance)."""
+    failures = []
+    for key, ref in baseline.get("results", {}).items():
+        cur = results.get(key)
+        if cur is None:
+            continue
+        if cur["throughput_rps"] < ref["throughput_rps"] * (1 - max_regression):
+            failures.append(f"{key}: throughput {cur['throughput_rps']} < {ref['throughput_rps']} rps")
+        if cur["p95_ms"] > ref["p95_ms"] * (1 + max_regression):
+            failures.append(f"{key}: p95 {cur['p95_ms']} > {ref['p95_ms']} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='dataset')
+    parser.add_argument('--model', help='Modèle .tflite réel à mesurer en plus des interpréteurs factices')
+    parser.add_argument('--no-mock', action='store_true', help='Ne pas mesurer les interpréteurs factices')
+    parser.add_argument('--concurrency', default='1,4', help='Niveaux de concurrence, séparés par des virgules')
+    parser.add_argument('--requests', type=int, default=200, help='Requêtes par niveau de concurrence')
+    parser.add_argument('--runs', type=int, default=1, help='Exécutions complètes ; la médiane est retenue')
+    parser.add_argument('--decoder', default='auto')
+    parser.add_argument('--no-synthetic', action='store_true', help='Ignorer les images synthétiques 12 MP')
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    parser.add_argument('--baseline', help='Référence JSON à comparer')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='Tolérance relative (0.2 = 20 %%)')
+    parser.add_argument('--save-baseline', help='Écrire les résultats comme nouvelle référence')
+    parser.add_argument('--trace-sample-rate', type=float, help='Tracer les requêtes (0 = traçage désactivé)')
+    args = parser.parse_args()
+
+    interpreters = {} if args.no_mock else {name: (f"{name}.tflite", cls) for name, cls in MOCKS.items()}
+    if args.model:
+        interpreters[Path(args.model).stem] = (args.model, None)
+    if not interpreters:
+        raise SystemExit("Rien à mesurer (--no-mock sans --model)")
+    levels = sorted({int(c) for c in args.concurrency.split(',')})
+
+    tmp = tempfile.TemporaryDirectory()
+    images = collect_images(Path(args.dataset), None if args.no_synthetic else Path(tmp.name))
+    if not images:
+        raise SystemExit(f"Aucune image trouvée dans {args.dataset}")
+    tracer = None
+    if args.trace_sample_rate is not None:
+        tracer = Tracer(FileExporter(os.devnull), sample_rate=args.trace_sample_rate)
+    results = median_results([run(interpreters, images, levels, args.requests, args.decoder, tracer)
+                              for _ in range(max(1, args.runs))])
+    tmp.cleanup()
+    if tracer is not None:
+        tracer.close()
+
+    report = {"machine": machine_info(), "images": len(images), "requests": args.requests,
+              "runs": max(1, args.runs), "decoder": args.decoder, "trace_sample_rate": args.trace_sample_rate,
+              "results": results}
+    print(f"{len(images)} images, {args.requests} requêtes par niveau, {report['runs']} exécution(s), "
+          f"decoder={args.decoder}")
+    print(f"{'run':<18} {'img/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for key, r in results.items():
+        print(f"{key:<18} {r['throughput_rps']:>8.2f} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            Path(path).write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        failures = compare(results, baseline, args.max_regression)
+        mismatch = environment_mismatch(baseline.get("machine", {}), report["machine"])
+        if baseline.get("machine") != report["machine"]:
+            print("Attention : la référence a été mesurée sur une autre machine", file=sys.stderr)
+        if any(baseline.get(k) != report[k] for k in ("images", "requests", "decoder")):
+            print("Attention : la référence a été mesurée avec d'autres images ou paramètres", file=sys.stderr)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        if mismatch:
+            print(f"Environnement différent de la référence ({', '.join(mismatch)}) : comparaison indicative, "
+                  f"pas d'échec", file=sys.stderr)
+            return
+        if failures:
+            sys.exit(1)
+        print(f"Aucune régression au-delà de {args.max_regression:.0%} par rapport à {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
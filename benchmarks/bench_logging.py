@@ -0,0 +1,118 @@
+"""
+Benchmark du logging sur le chemin d'inférence : coût par requête côté appelant.
+
+Chaque mode tourne dans un processus neuf, avec les handlers de
+``backend.app.logger`` (console JSON, app.log, error.log) :
+
+- ``sync``  : handlers attachés directement au logger racine (ancienne configuration) ;
+- ``queue`` : ``setup_logging`` (QueueHandler borné + thread d'écoute) ;
+- ``queue+sampling`` : idem, avec l'échantillonnage du log « Inference done »
+  de MLService (``--sample-rate``).
+
+On mesure la durée de chaque appel dans le thread appelant (p50/p95/p99/max,
+en µs), le nombre d'enregistrements abandonnés et le temps de vidage de la file
+à l'arrêt. ``--max-bytes`` réduit la taille de rotation pour faire apparaître
+les pauses de rotation. La sortie console est redirigée vers /dev/null.
+
+Usage (depuis la racine du dépôt) :
+    python -m benchmarks.bench_logging --records 20000
+    python -m benchmarks.bench_logging --max-bytes 1000000 --sample-rate 0.01 --output logging.json
+"""
+import argparse
+import json
+import logging
+import logging.config
+import multiprocessing as mp
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.common import machine_info
+
+MODES = ("sync", "queue", "queue+sampling")
+
+
+def _configure(mode, log_dir: Path, max_bytes: int, queue_size: int):
+    from backend.app import logger as app_logger
+
+    if mode == "sync":
+        logging.config.dictConfig(app_logger.logging_config(log_dir, max_bytes))
+        return None
+    # Same handlers, behind the queue
+    app_logger.setup_logging(log_dir=log_dir, queue_size=queue_size, max_bytes=max_bytes)
+    return app_logger
+
+
+def _run_mode(mode, records, max_bytes, queue_size, sample_rate, result_queue):
+    sys.stdout = open(os.devnull, "w")  # console handler: measure formatting, not the terminal
+    with tempfile.TemporaryDirectory() as tmp:
+        app_logger = _configure(mode, Path(tmp), max_bytes, queue_size)
+        log = logging.getLogger("backend.app.ml_service")
+        rate = sample_rate if mode == "queue+sampling" else 1.0
+
+        samples = np.empty(records)
+        for i in range(records):
+            t0 = time.perf_counter()
+            # Same decision and message as MLService.format_result
+            if rate >= 1 or random.random() < rate:
+                log.info("Inference done | label=%s confidence=%.2f latency=%dms", "anemia", 0.87, 42)
+            samples[i] = (time.perf_counter() - t0) * 1e6
+
+        dropped, drain_ms = 0, 0.0
+        if app_logger is not None:
+            dropped = app_logger.dropped_records()
+            t0 = time.perf_counter()
+            app_logger.shutdown_logging()
+            drain_ms = (time.perf_counter() - t0) * 1000
+        else:
+            logging.shutdown()
+
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    result_queue.put({
+        "mode": mode,
+        "records": records,
+        "mean_us": round(float(samples.mean()), 2),
+        "p50_us": round(float(p50), 2),
+        "p95_us": round(float(p95), 2),
+        "p99_us": round(float(p99), 2),
+        "max_us": round(float(samples.max()), 2),
+        "dropped": dropped,
+        "drain_ms": round(drain_ms, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000, help='Appels de log par mode')
+    parser.add_argument('--max-bytes', type=int, default=10485760, help='Taille de rotation de app.log / error.log')
+    parser.add_argument('--queue-size', type=int, default=10000)
+    parser.add_argument('--sample-rate', type=float, default=0.01)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--output', help='Résultats en JSON')
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    results = []
+    for mode in args.modes.split(','):
+        result_queue = ctx.Queue()
+        proc = ctx.Process(target=_run_mode, args=(mode, args.records, args.max_bytes, args.queue_size,
+                                                   args.sample_rate, result_queue))
+        proc.start()
+        result = result_queue.get()
+        proc.join()
+        results.append(result)
+        print(f"{mode:<15} mean {result['mean_us']:>8.2f} µs  p50 {result['p50_us']:>8.2f}  "
+              f"p95 {result['p95_us']:>8.2f}  p99 {result['p99_us']:>8.2f}  max {result['max_us']:>10.2f}  "
+              f"abandonnés {result['dropped']:>6}  vidage {result['drain_ms']:>8.1f} ms")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"machine": machine_info(), "results": results}, indent=2) + "\n")
+
+
+if __name__ == '__main__':
+    main()
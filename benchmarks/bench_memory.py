@@ -0,0 +1,211 @@
+"""
+Mémoire par worker gunicorn : RSS, PSS et USS (unique set size).
+
+La RSS compte les pages partagées dans chaque worker ; l'USS (pages privées)
+est ce que chaque worker coûte réellement, et la PSS répartit les pages
+partagées entre les processus. Le script lance gunicorn deux fois avec la même
+charge (requêtes ``/api/predict``, modèle par défaut) : d'abord le code du commit
+de référence (``--baseline-ref``, par défaut le premier commit : un interpréteur
+créé à l'import de ``main.py``), extrait dans un worktree git, puis l'arbre de
+travail. Il lit ensuite ``/proc/<pid>/smaps_rollup`` de chaque worker et, pour
+l'arbre de travail, les modèles et interpréteurs réellement chargés par chaque
+worker (``GET /api/models``).
+
+Les deux versions ouvrent ``model.tflite`` par son chemin (mmap en lecture
+seule) : les pages du fichier sont partagées par le cache de pages, et l'USS
+mesure ce qui reste privé à chaque worker (tenseurs, poids réorganisés par
+XNNPACK, pool d'interpréteurs).
+
+Nécessite git, gunicorn, tflite-runtime et des ``model.tflite`` sous ``ml/*/``
+(sinon l'API répond avec le service factice et la mesure n'a pas de sens).
+
+Usage (depuis la racine du dépôt, Linux) :
+    python -m benchmarks.bench_memory --workers 4 --requests 64
+    python -m benchmarks.bench_memory --baseline-ref <commit>
+    python -m benchmarks.bench_memory --master <pid>   # gunicorn déjà lancé
+"""
+import argparse
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+
+from PIL import Image
+
+from benchmarks.common import machine_info
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def process_memory(pid: int) -> dict:
+    """RSS / PSS / USS d'un processus en KB, depuis smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "pid": pid,
+        "rss_kb": fields.get("Rss", 0),
+        "pss_kb": fields.get("Pss", 0),
+        "uss_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared_kb": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+def child_pids(master: int):
+    pids = []
+    for task in Path(f"/proc/{master}/task").iterdir():
+        pids += [int(p) for p in (task / "children").read_text().split()]
+    return sorted(pids)
+
+
+def report(master: int) -> dict:
+    workers = [process_memory(pid) for pid in child_pids(master)]
+    return {
+        "master": process_memory(master),
+        "workers": workers,
+        "total_pss_kb": sum(w["pss_kb"] for w in workers),
+        "total_uss_kb": sum(w["uss_kb"] for w in workers),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _multipart(image: bytes):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + image + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("gunicorn n'a pas démarré à temps")
+
+
+def _git(*args) -> str:
+    return subprocess.run(["git", *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def _layout(tree: Path, directory: Path) -> Path:
+    """Arborescence de l'image Docker (``app/`` et ``ml/`` côte à côte) pour le code de ``tree``.
+
+    Les fichiers de modèles ne sont pas versionnés : ``ml/`` pointe toujours vers celui du dépôt.
+    """
+    directory.mkdir(parents=True)
+    (directory / "app").symlink_to(tree / "backend" / "app")
+    (directory / "ml").symlink_to(ROOT / "ml")
+    return directory
+
+
+def _loaded_models(url: str, workers: int) -> dict:
+    """Modèles chargés (nombre d'interpréteurs) par pid de worker, d'après ``/api/models``."""
+    loaded = {}
+    for _ in range(8 * workers):  # each request lands on one worker
+        try:
+            with urllib.request.urlopen(f"{url}/api/models", timeout=10) as r:
+                stats = json.load(r)
+        except OSError:
+            return {}  # baseline: no /api/models
+        loaded[stats["worker"]] = {
+            name: model.get("stats", {}).get("interpreters", {}).get("size", 0)
+            for name, model in stats["loaded"].items()
+        }
+    return loaded
+
+
+def run_gunicorn(layout: Path, workers: int, requests: int) -> dict:
+    port = _free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), MODELS_PATH=str(layout / "ml"), CACHE_ENABLED="False")
+    conf = ["-c", "python:app.gunicorn_conf"] if (layout / "app" / "gunicorn_conf.py").exists() else []
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", *conf, "--chdir", str(layout),
+         "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "app.main:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(url)
+        buf = io.BytesIO()
+        Image.new("RGB", (1024, 768), (180, 60, 60)).save(buf, format="JPEG")
+        body, content_type = _multipart(buf.getvalue())
+        for _ in range(requests):
+            req = urllib.request.Request(f"{url}/api/predict", data=body, headers={"Content-Type": content_type})
+            with urllib.request.urlopen(req, timeout=60) as r:
+                r.read()
+        result = report(proc.pid)
+        loaded = _loaded_models(url, workers)
+        for worker in result["workers"]:
+            worker["loaded"] = loaded.get(worker["pid"])
+        return result
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(30)
+
+
+def compare_with_baseline(ref: str, workers: int, requests: int) -> dict:
+    """Mesure le commit ``ref`` (worktree temporaire) puis l'arbre de travail, avec la même charge."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        _git("worktree", "add", "--detach", str(tmp / "baseline"), ref)
+        try:
+            before = run_gunicorn(_layout(tmp / "baseline", tmp / "before"), workers, requests)
+        finally:
+            _git("worktree", "remove", "--force", str(tmp / "baseline"))
+        after = run_gunicorn(_layout(ROOT, tmp / "after"), workers, requests)
+    return {f"baseline ({ref[:12]})": before, "working tree": after}
+
+
+def _print(name: str, result: dict) -> None:
+    print(f"\n{name}: total PSS {result['total_pss_kb'] / 1024:.1f} MB, total USS {result['total_uss_kb'] / 1024:.1f} MB")
+    print(f"{'pid':>8} {'RSS MB':>9} {'PSS MB':>9} {'USS MB':>9} {'shared MB':>10}  modèles (interpréteurs)")
+    for w in result["workers"]:
+        loaded = w.get("loaded")
+        models = "?" if loaded is None else ", ".join(f"{n}×{k}" for n, k in loaded.items()) or "aucun"
+        print(f"{w['pid']:>8} {w['rss_kb'] / 1024:>9.1f} {w['pss_kb'] / 1024:>9.1f} "
+              f"{w['uss_kb'] / 1024:>9.1f} {w['shared_kb'] / 1024:>10.1f}  {models}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--master', type=int, help='PID du master gunicorn à inspecter (sans relancer gunicorn)')
+    parser.add_argument('--baseline-ref', help='Commit de référence (défaut : le premier commit du dépôt)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=64, help='Requêtes /api/predict avant la mesure')
+    parser.add_argument('--output', help='Fichier JSON de résultats')
+    args = parser.parse_args()
+
+    if args.master:
+        results = {"live": report(args.master)}
+    else:
+        ref = args.baseline_ref or _git("rev-list", "--max-parents=0", "HEAD").splitlines()[0]
+        results = compare_with_baseline(_git("rev-parse", ref), args.workers, args.requests)
+    for name, result in results.items():
+        _print(name, result)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"machine": machine_info(), "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Utilitaires partagés par les benchmarks (jeux d'images, percentiles, métadonnées machine)."""
+import os
+import platform
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
+
+def write_synthetic_images(directory: Path, width: int = 4000, height: int = 3000):
+    """Écrit un JPEG et un PNG synthétiques (taille photo de téléphone) ; retourne [(nom, chemin)]."""
+    rng = np.random.default_rng(0)
+    # Smooth gradient + noise compresses like a photo rather than pure noise
+    x = np.linspace(0, 127, width).astype(np.uint8)
+    y = np.linspace(0, 127, height).astype(np.uint8)
+    pixels = (x[None, :, None] + y[:, None, None]).repeat(3, axis=2)
+    pixels += rng.integers(0, 16, pixels.shape, dtype=np.uint8)
+    mp = round(width * height / 1e6)
+    images = []
+    for fmt, ext in (("JPEG", "jpg"), ("PNG", "png")):
+        path = directory / f"synthetic_{mp}mp.{ext}"
+        Image.fromarray(pixels).save(path, format=fmt, quality=90)
+        images.append((path.name, path))
+    return images
+
+
+def collect_images(dataset: Path, synthetic_dir: Path = None):
+    """Liste (nom, chemin) ; les images synthétiques sont écrites dans ``synthetic_dir``."""
+    images = [(str(p.relative_to(dataset)), p) for p in sorted(dataset.rglob('*'))
+              if p.suffix.lower() in IMAGE_EXTS]
+    if synthetic_dir is not None:
+        images += write_synthetic_images(synthetic_dir)
+    return images
+
+
+def percentiles(samples_ms):
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def _version(module: str):
+    try:
+        return __import__(module).__version__
+    except ImportError:
+        return None
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": _version("PIL"),
+        "opencv": _version("cv2"),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
@@ -0,0 +1,62 @@
+"""
+Interpréteurs factices pour benchmarker MLService hors ligne (sans modèle .tflite).
+
+Ils reproduisent l'interface de ``tflite.Interpreter`` utilisée par MLService,
+y compris ``tensor()`` et ``resize_tensor_input()``. ``invoke()`` dort un temps
+fixe par image, en relâchant le GIL comme le ferait TFLite, pour que les
+résultats dépendent du code Python autour de l'inférence et non du modèle.
+La sortie a la forme de celle du modèle livré : (N, 1), une probabilité sigmoïde.
+"""
+import time
+
+import numpy as np
+
+INVOKE_MS = 5.0
+
+
+class MockFloatInterpreter:
+    input_dtype = np.float32
+    quantization = (0.0, 0)
+
+    def __init__(self, model_path=None, num_threads=None):
+        self._input = {"index": 0, "shape": [1, 224, 224, 3], "dtype": self.input_dtype,
+                       "quantization": self.quantization}
+        self._output = {"index": 1, "shape": [1, 1], "dtype": np.float32}
+
+    def allocate_tensors(self):
+        self._buffer = np.zeros(self._input["shape"], dtype=self.input_dtype)
+
+    def get_input_details(self):
+        return [self._input]
+
+    def get_output_details(self):
+        return [self._output]
+
+    def resize_tensor_input(self, index, shape):
+        self._input = dict(self._input, shape=list(shape))
+
+    def tensor(self, index):
+        return lambda: self._buffer
+
+    def set_tensor(self, index, data):
+        np.copyto(self._buffer, data)
+
+    def invoke(self):
+        # Sublinear batch cost, as with a real CNN on CPU
+        n = self._buffer.shape[0]
+        time.sleep(INVOKE_MS * (1 + 0.25 * (n - 1)) / 1000.0)
+
+    def get_tensor(self, index):
+        n = self._buffer.shape[0]
+        return np.full((n, 1), 0.7, dtype=np.float32)
+
+
+class MockQuantInterpreter(MockFloatInterpreter):
+    input_dtype = np.uint8
+    quantization = (1.0 / 255.0, 0)
+
+
+MOCKS = {
+    "mock-float": MockFloatInterpreter,
+    "mock-quant": MockQuantInterpreter,
+}
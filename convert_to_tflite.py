@@ -1,15 +1,241 @@
-import tensorflow as tf
+"""
+Conversion de best_model.h5 en variantes TFLite float32, float16 et int8.
 
+Chaque variante est écrite à côté du modèle servi (``ml/anemia/model.<variante>.tflite``).
+La variante int8 est entièrement quantifiée (entrée et sortie int8) et calibrée
+sur des images tirées de ``dataset/``. Les images sont prétraitées comme au
+service (décodage à la taille d'entrée puis pixels / 255).
 
-# Charger le meilleur modèle Keras
-model = tf.keras.models.load_model('best_model.h5')
+Le jeu de données est séparé de façon déterministe (par classe, ``--seed``) en
+une partie de calibration et une partie réservée (``--holdout``). Chaque
+variante est évaluée sur la partie réservée avec MLService, c'est-à-dire par le
+chemin de production : taille, temps de chargement, latence par image
+(normalisation + invoke + post-traitement, p50/p95), exactitude et écart avec
+float32. La variante recommandée est la plus petite (puis la plus rapide) dont
+l'exactitude et l'accord des prédictions restent à ``--tolerance`` de float32,
+et dont les scores ne s'en écartent pas de plus de ``--max-output-diff``.
+Avec ``--install``, elle remplace ``model.tflite`` de façon atomique, et les
+workers la rechargent à chaud.
 
-# Convertir en TFLite
-converter = tf.lite.TFLiteConverter.from_keras_model(model)
-tflite_model = converter.convert()
+Usage (depuis la racine du dépôt) :
+    python convert_to_tflite.py --install auto
+    python convert_to_tflite.py --variants float32,int8 --calibration-samples 200
+    python convert_to_tflite.py --report-only   # réévalue les variantes déjà converties
+"""
+import os
+import json
+import time
+import random
+import shutil
+import argparse
 
-# Sauvegarder le modèle TFLite
-with open('ml/anemia/model.tflite', 'wb') as f:
-    f.write(tflite_model)
+import numpy as np
 
-print("Conversion terminée !")
+from backend.app.decoding import decode_image
+from backend.app.ml_service import MLService
+from backend.app.registry import discover_models
+from backend.app.scoring import folder_label, iter_images
+
+VARIANTS = ("float32", "float16", "int8")
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    # Temporary file then atomic rename: watching workers never read a half-written model
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def split_dataset(dataset: str, labels, holdout: float, seed: int):
+    """Sépare les images labellisées par classe : (calibration, réservées) ; listes de (chemin, label)."""
+    by_label = {}
+    for path in iter_images([dataset]):
+        label = folder_label(path, labels)
+        if label is not None:
+            by_label.setdefault(label, []).append(path)
+    rng = random.Random(seed)
+    calibration, held_out = [], []
+    for label, paths in sorted(by_label.items()):
+        rng.shuffle(paths)
+        n_holdout = int(round(len(paths) * holdout))
+        held_out += [(p, label) for p in paths[:n_holdout]]
+        calibration += [(p, label) for p in paths[n_holdout:]]
+    return calibration, held_out
+
+
+def load_pixels(path: str, size) -> np.ndarray:
+    with open(path, 'rb') as f:
+        return decode_image(f.read(), size)
+
+
+def convert(model, variant: str, calibration_images=None) -> bytes:
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if not calibration_images:
+            raise ValueError("La variante int8 nécessite des images de calibration")
+
+        def representative_dataset():
+            # Same preprocessing as the float path of MLService.normalize
+            for arr in calibration_images:
+                yield [arr[None].astype(np.float32) / 255.0]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def evaluate(path: str, held_out, spec, threads: int = 1, interpreter_cls=None) -> dict:
+    """Taille, chargement, latence par image et exactitude d'une variante sur les images réservées."""
+    start = time.perf_counter()
+    service = MLService(model_path=path, interpreter_cls=interpreter_cls, pool_size=1, num_threads=threads,
+                        name=spec.name, labels=spec.labels, recommendations=spec.recommendations)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    latencies, predictions, outputs = [], [], []
+    for image_path, _ in held_out:
+        arr = load_pixels(image_path, service.input_size)
+        start = time.perf_counter()
+        output = service.run_batch(service.normalize(arr)[None])
+        probs, idx, _, _ = service.postprocess_batch(output, 1)
+        latencies.append((time.perf_counter() - start) * 1000)
+        predictions.append(service.labels[int(idx[0])])
+        outputs.append(probs[0])
+
+    correct = sum(pred == label for pred, (_, label) in zip(predictions, held_out))
+    p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (None, None)
+    return {
+        "size_bytes": os.path.getsize(path),
+        "load_ms": round(load_ms, 2),
+        "latency_p50_ms": round(float(p50), 3) if p50 is not None else None,
+        "latency_p95_ms": round(float(p95), 3) if p95 is not None else None,
+        "accuracy": round(correct / len(held_out), 4) if held_out else None,
+        "predictions": predictions,
+        "outputs": outputs,
+    }
+
+
+def compare(results: dict, reference: str = "float32") -> None:
+    """Ajoute à chaque variante l'écart d'exactitude et l'accord avec la référence."""
+    ref = results.get(reference)
+    for result in results.values():
+        if ref is None or not result["predictions"]:
+            continue
+        if result["accuracy"] is not None and ref["accuracy"] is not None:
+            result["accuracy_delta"] = round(result["accuracy"] - ref["accuracy"], 4)
+        pairs = list(zip(result["predictions"], ref["predictions"]))
+        result["agreement"] = round(sum(a == b for a, b in pairs) / len(pairs), 4)
+        result["max_output_diff"] = round(float(max(
+            np.abs(a - b).max() for a, b in zip(result["outputs"], ref["outputs"]))), 4)
+    for result in results.values():
+        del result["predictions"], result["outputs"]
+
+
+def recommend(results: dict, tolerance: float, reference: str = "float32", max_output_diff: float = 0.05) -> str:
+    """Plus petite variante (puis la plus rapide) fidèle à la référence : exactitude et accord
+    des prédictions à ``tolerance`` près, scores à ``max_output_diff`` près.
+
+    Sans images labellisées, seuls l'accord et l'écart des scores sont vérifiés.
+    """
+    def within(name):
+        result = results[name]
+        if name == reference or reference not in results:
+            return True
+        if result.get("accuracy_delta") is not None and result["accuracy_delta"] < -tolerance:
+            return False
+        if result.get("max_output_diff") is not None and result["max_output_diff"] > max_output_diff:
+            return False
+        return result.get("agreement", 0.0) >= 1.0 - tolerance
+
+    candidates = [name for name in results if within(name)]
+    return min(candidates, key=lambda name: (results[name]["size_bytes"], results[name]["latency_p50_ms"] or 0))
+
+
+def _fmt(value, spec: str) -> str:
+    return format(value, spec) if value is not None else "-"
+
+
+def print_report(results: dict, recommended: str, n_held_out: int) -> None:
+    print(f"\nÉvaluation sur {n_held_out} image(s) réservée(s) :")
+    print(f"{'variante':<10} {'taille MB':>10} {'chargement ms':>14} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'exactitude':>11} {'écart':>8} {'accord':>8} {'Δ score':>8}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['size_bytes'] / 1e6:>10.2f} {r['load_ms']:>14.1f} {_fmt(r['latency_p50_ms'], '>9.2f')} "
+              f"{_fmt(r['latency_p95_ms'], '>9.2f')} {_fmt(r['accuracy'], '>11.2%')} "
+              f"{_fmt(r.get('accuracy_delta'), '>+8.2%')} {_fmt(r.get('agreement'), '>8.2%')} "
+              f"{_fmt(r.get('max_output_diff'), '>8.3f')}")
+    print(f"\nVariante recommandée : {recommended}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keras-model', default='best_model.h5')
+    parser.add_argument('--model', default='anemia', help='Modèle cible (sous-répertoire de --models-path)')
+    parser.add_argument('--models-path', default='ml')
+    parser.add_argument('--dataset', default='dataset', help='Dossiers par label (dataset/anemia, dataset/normal)')
+    parser.add_argument('--variants', default=','.join(VARIANTS))
+    parser.add_argument('--calibration-samples', type=int, default=100)
+    parser.add_argument('--holdout', type=float, default=0.2, help='Part des images réservée à l\'évaluation')
+    parser.add_argument('--seed', type=int, default=123)
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Perte d\'exactitude admise face à float32')
+    parser.add_argument('--max-output-diff', type=float, default=0.05,
+                        help='Écart maximal des scores face à float32 (probabilités)')
+    parser.add_argument('--threads', type=int, default=1, help='Threads TFLite pendant la mesure')
+    parser.add_argument('--install', default='auto',
+                        help='Variante copiée vers model.tflite : auto (recommandée), none, ou un nom de variante')
+    parser.add_argument('--report-only', action='store_true', help='Évaluer les variantes existantes sans convertir')
+    parser.add_argument('--report', help='Rapport JSON (défaut : <modèle>/variants.json)')
+    args = parser.parse_args()
+
+    variants = [v for v in args.variants.split(',') if v]
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        parser.error(f"Variantes inconnues : {', '.join(sorted(unknown))}")
+    spec = discover_models(args.models_path)[args.model]
+    paths = {v: os.path.join(spec.directory, f"model.{v}.tflite") for v in variants}
+    calibration, held_out = split_dataset(args.dataset, spec.labels, args.holdout, args.seed)
+    print(f"{len(calibration)} image(s) de calibration, {len(held_out)} réservée(s) à l'évaluation")
+
+    if not args.report_only:
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(args.keras_model)
+        size = tuple(model.input_shape[2:0:-1])  # (w, h)
+        samples = [load_pixels(p, size) for p, _ in calibration[:args.calibration_samples]] \
+            if "int8" in variants else None
+        for variant in variants:
+            start = time.perf_counter()
+            atomic_write(paths[variant], convert(model, variant, samples))
+            print(f"{variant}: {paths[variant]} ({time.perf_counter() - start:.1f}s)")
+
+    results = {v: evaluate(paths[v], held_out, spec, threads=args.threads) for v in variants}
+    compare(results)
+    recommended = recommend(results, args.tolerance, max_output_diff=args.max_output_diff)
+    print_report(results, recommended, len(held_out))
+
+    report_path = args.report or os.path.join(spec.directory, "variants.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({"recommended": recommended, "tolerance": args.tolerance,
+                   "max_output_diff": args.max_output_diff, "held_out": len(held_out),
+                   "calibration": len(calibration), "variants": results}, f, indent=2)
+
+    install = recommended if args.install == 'auto' else args.install
+    if install != 'none':
+        if install not in paths:
+            parser.error(f"Variante non disponible : {install}")
+        tmp_path = f"{spec.model_path}.tmp"
+        shutil.copyfile(paths[install], tmp_path)
+        os.replace(tmp_path, spec.model_path)
+        print(f"{install} installé sous {spec.model_path}")
+
+
+if __name__ == '__main__':
+    main()
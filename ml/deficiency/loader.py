@@ -1,83 +0,0 @@
-"""
-Loader pour le modèle de détection de carences nutritionnelles
-"""
-import json
-from pathlib import Path
-import numpy as np
-from typing import Dict, Any
-
-
-class DeficiencyModelLoader:
-    """Charge et gère le modèle ML de détection de carences"""
-    
-    def __init__(self, model_dir: Path = None):
-        """
-        Initialise le loader
-        
-        Args:
-            model_dir: Répertoire contenant le modèle et sa config
-        """
-        if model_dir is None:
-            model_dir = Path(__file__).parent
-        
-        self.model_dir = model_dir
-        self.config = self._load_config()
-        self.model = None  # À implémenter avec TensorFlow
-    
-    def _load_config(self) -> Dict[str, Any]:
-        """Charge la configuration du modèle"""
-        config_path = self.model_dir / 'config.json'
-        
-        if not config_path.exists():
-            raise FileNotFoundError(f"Config file not found: {config_path}")
-        
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    
-    def load_model(self):
-        """Charge le modèle TensorFlow"""
-        # TODO: Implémenter le chargement TensorFlow
-        # import tensorflow as tf
-        # model_path = self.model_dir / 'model.pkl'
-        # self.model = tf.keras.models.load_model(model_path)
-        pass
-    
-    def predict(self, image_data: np.ndarray) -> Dict[str, Any]:
-        """
-        Effectue une prédiction
-        
-        Args:
-            image_data: Image prétraitée (numpy array)
-        
-        Returns:
-            Dict avec probabilité et confiance
-        """
-        if self.model is None:
-            # TODO: Implémenter prédiction réelle
-            return {
-                'probability': 0.022,
-                'confidence': 0.72,
-                'severity': 'low'
-            }
-        
-        # Prédiction réelle avec le modèle
-        # prediction = self.model.predict(image_data)
-        # return self._format_prediction(prediction)
-        pass
-    
-    def _format_prediction(self, prediction) -> Dict[str, Any]:
-        """Formate la sortie du modèle"""
-        return {
-            'probability': float(prediction[0]),
-            'confidence': 0.72,
-            'severity': self._classify_severity(float(prediction[0]))
-        }
-    
-    def _classify_severity(self, probability: float) -> str:
-        """Classifie la sévérité basée sur la probabilité"""
-        if probability < 0.3:
-            return 'low'
-        elif probability < 0.6:
-            return 'medium'
-        else:
-            return 'high'
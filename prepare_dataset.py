@@ -0,0 +1,191 @@
+"""
+Prétraitement du jeu d'entraînement : décodage et redimensionnement une seule fois.
+
+Les images de ``dataset/<classe>/`` sont décodées à la taille d'entrée du modèle
+(même décodeur que l'API, ``backend/app/decoding.py``) et écrites en shards
+``.npy`` uint8 (N, H, W, 3) lus en mémoire projetée (mmap) par
+``train_model.py`` : une époque ne décode plus aucune image.
+
+``manifest.json`` associe chaque image à son shard et à sa ligne, avec sa
+taille, sa date de modification et son SHA-256. Une nouvelle exécution ne
+traite que les images ajoutées ou modifiées (écrites dans un nouveau shard) et
+retire les images supprimées. Les anciennes lignes de ces images restent
+dans leurs shards (lignes mortes, comptées à chaque exécution) : dès qu'elles
+dépassent ``--compact-ratio`` des lignes stockées, ou avec ``--compact``, les
+shards sont réécrits sans elles. Le découpage entraînement / validation est déduit du SHA-256 :
+il reste stable quand des images sont ajoutées.
+
+Usage (depuis la racine du dépôt) :
+    python prepare_dataset.py                      # dataset/ -> dataset_cache/
+    python prepare_dataset.py --size 224 --shard-size 512 --compact
+"""
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from backend.app.decoding import decode_image
+from backend.app.scoring import iter_images
+
+MANIFEST = "manifest.json"
+VALIDATION_PERCENT = 20
+# Share of dead rows (removed or re-encoded images) that triggers a compaction
+COMPACT_RATIO = 0.25
+
+
+def _file_stamp(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def is_validation(sha256: str, percent: int = VALIDATION_PERCENT) -> bool:
+    """Affectation stable à la validation, d'après le contenu de l'image."""
+    return int(sha256[:8], 16) % 100 < percent
+
+
+def load_manifest(cache_dir) -> dict:
+    path = Path(cache_dir) / MANIFEST
+    if not path.exists():
+        return {"image_size": None, "class_names": [], "shards": [], "next_shard": 0, "entries": {}}
+    return json.loads(path.read_text())
+
+
+def _save_manifest(cache_dir: Path, manifest: dict) -> None:
+    tmp_path = cache_dir / f"{MANIFEST}.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp_path, cache_dir / MANIFEST)
+
+
+def _write_shard(cache_dir: Path, name: str, arrays: List[np.ndarray]) -> None:
+    tmp_path = cache_dir / f"{name}.tmp"
+    shard = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(len(arrays),) + arrays[0].shape)
+    for row, arr in enumerate(arrays):
+        shard[row] = arr
+    shard.flush()
+    del shard
+    os.replace(tmp_path, cache_dir / name)
+
+
+def prepare(dataset, cache_dir, size=(224, 224), shard_size: int = 1024, compact: bool = False,
+            compact_ratio: float = COMPACT_RATIO) -> dict:
+    """Met les shards de ``cache_dir`` à jour avec ``dataset`` ; retourne des compteurs.
+
+    Compacte automatiquement quand les lignes mortes dépasseraient ``compact_ratio``
+    des lignes stockées après cette exécution.
+    """
+    dataset, cache_dir = Path(dataset), Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(cache_dir)
+    if manifest["image_size"] not in (None, list(size)):
+        # Another input size: every shard is stale
+        compact, manifest = True, {**manifest, "entries": {}}
+    manifest["image_size"] = list(size)
+    manifest["class_names"] = sorted(p.name for p in dataset.iterdir() if p.is_dir())
+
+    entries: Dict[str, dict] = manifest["entries"]
+    seen, pending = set(), []
+    for path in map(Path, iter_images([str(dataset)])):
+        rel = path.relative_to(dataset).as_posix()
+        if path.parent.parent != dataset:
+            continue  # only dataset/<class>/<image>
+        seen.add(rel)
+        stamp = list(_file_stamp(path))
+        entry = entries.get(rel)
+        if entry is not None and entry["stamp"] == stamp and not compact:
+            continue
+        pending.append((rel, stamp))
+
+    removed = [rel for rel in entries if rel not in seen]
+    for rel in removed:
+        del entries[rel]
+
+    if not compact and manifest["shards"]:
+        # Rows still referenced once this run is done: untouched entries plus the pending ones
+        stored = sum(shard["count"] for shard in manifest["shards"]) + len(pending)
+        untouched = len(entries) - sum(1 for rel, _ in pending if rel in entries)
+        dead = stored - untouched - len(pending)
+        compact = dead > compact_ratio * stored
+
+    added = skipped = 0
+    if compact:
+        # Rewrite everything still in the dataset into fresh shards
+        pending = [(rel, list(_file_stamp(dataset / rel))) for rel in sorted(seen)]
+        old_shards, manifest["shards"] = manifest["shards"], []
+    else:
+        old_shards = []
+
+    for start in range(0, len(pending), shard_size):
+        arrays, rows = [], []
+        for rel, stamp in pending[start:start + shard_size]:
+            data = (dataset / rel).read_bytes()
+            try:
+                arrays.append(decode_image(data, size))
+            except ValueError:
+                skipped += 1
+                entries.pop(rel, None)
+                continue
+            rows.append({"rel": rel, "stamp": stamp, "sha256": hashlib.sha256(data).hexdigest()})
+        if not rows:
+            continue
+        # Shards are never rewritten in place: a new file per run (names are never reused)
+        name = f"shard-{manifest.setdefault('next_shard', 0):05d}.npy"
+        manifest["next_shard"] += 1
+        _write_shard(cache_dir, name, arrays)
+        index = len(manifest["shards"])
+        manifest["shards"].append({"file": name, "count": len(rows)})
+        for row, item in enumerate(rows):
+            entries[item["rel"]] = {"shard": index, "row": row, "stamp": item["stamp"], "sha256": item["sha256"],
+                                    "label": item["rel"].split("/", 1)[0]}
+        added += len(rows)
+
+    _save_manifest(cache_dir, manifest)
+    live = {shard["file"] for shard in manifest["shards"]}
+    for shard in old_shards:
+        if shard["file"] not in live:
+            (cache_dir / shard["file"]).unlink(missing_ok=True)
+    dead_rows = sum(shard["count"] for shard in manifest["shards"]) - len(entries)
+    return {"added": added, "removed": len(removed), "skipped": skipped, "total": len(entries),
+            "shards": len(manifest["shards"]), "dead_rows": dead_rows, "compacted": bool(old_shards)}
+
+
+def load_split(cache_dir, subset: str, validation_percent: int = VALIDATION_PERCENT):
+    """Lignes d'un sous-ensemble : (shards mmap, [(shard, ligne)], labels int, noms de classes, sha256)."""
+    cache_dir = Path(cache_dir)
+    manifest = load_manifest(cache_dir)
+    class_index = {name: i for i, name in enumerate(manifest["class_names"])}
+    shards = [np.load(cache_dir / shard["file"], mmap_mode='r') for shard in manifest["shards"]]
+    rows, labels, hashes = [], [], []
+    for rel in sorted(manifest["entries"]):
+        entry = manifest["entries"][rel]
+        if is_validation(entry["sha256"], validation_percent) != (subset == "validation"):
+            continue
+        rows.append((entry["shard"], entry["row"]))
+        labels.append(class_index[entry["label"]])
+        hashes.append(entry["sha256"])
+    return shards, rows, np.asarray(labels, dtype=np.float32), manifest["class_names"], hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='dataset')
+    parser.add_argument('--cache-dir', default='dataset_cache')
+    parser.add_argument('--size', type=int, default=224, help='Côté des images du modèle')
+    parser.add_argument('--shard-size', type=int, default=1024, help='Images par shard')
+    parser.add_argument('--compact', action='store_true', help='Réécrire les shards sans les lignes mortes')
+    parser.add_argument('--compact-ratio', type=float, default=COMPACT_RATIO,
+                        help='Part de lignes mortes qui déclenche la compaction automatique')
+    args = parser.parse_args()
+
+    stats = prepare(args.dataset, args.cache_dir, (args.size, args.size), args.shard_size, args.compact,
+                    args.compact_ratio)
+    print(f"{stats['added']} image(s) ajoutée(s), {stats['removed']} retirée(s), {stats['skipped']} illisible(s) ; "
+          f"{stats['total']} image(s) dans {stats['shards']} shard(s), {stats['dead_rows']} ligne(s) morte(s)"
+          f"{' (shards compactés)' if stats['compacted'] else ''} ({args.cache_dir})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""
+Scoring hors ligne d'un dossier d'images (parallèle, avec reprise).
+
+Voir backend/app/scoring.py ; exemple :
+    python score_images.py dataset --output scores.csv --workers 4
+"""
+from backend.app.scoring import main
+
+if __name__ == '__main__':
+    main()
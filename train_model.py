@@ -1,11 +1,52 @@
+"""
+Entraînement du classifieur MobileNetV2 (best_model.h5).
 
+Deux modes :
+- ``images`` (défaut) : entraînement de bout en bout sur les images (shards de
+  prepare_dataset.py), les 20 dernières couches du backbone étant dégelées ;
+- ``features`` : la partie gelée du backbone n'est exécutée qu'une fois par
+  image. Ses activations sont mises en cache sur disque, indexées par le
+  SHA-256 de l'image, et seules les couches dégelées et la tête Dense sont
+  entraînées sur ce cache. C'est le mode adapté aux balayages d'hyperparamètres
+  sur CPU. ``--fine-tune-epochs`` enchaîne un passage de bout en bout sur les images.
+
+Usage (depuis la racine du dépôt) :
+    python train_model.py
+    python train_model.py --mode features --epochs 30 --learning-rate 3e-4
+    python train_model.py --mode features --feature-views 4 --fine-tune-epochs 5
+"""
+import os
+import time
+import argparse
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers, models
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
 
+from prepare_dataset import load_split, prepare
+
 img_size = (224, 224)
 batch_size = 16
+TRAINABLE_LAYERS = 20
+CACHE_DIR = "dataset_cache"
+# Decoded uint8 images stay in RAM (tf.data cache) below this size; above it the mmap shards are re-read
+CACHE_MEMORY_BYTES = 2 * 1024 ** 3
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--mode', choices=('images', 'features'), default='images')
+parser.add_argument('--epochs', type=int, default=50)
+parser.add_argument('--learning-rate', type=float, default=1e-3)
+parser.add_argument('--feature-views', type=int, default=1,
+                    help='Vues par image dans le cache (la vue 0 sans augmentation, les suivantes augmentées)')
+parser.add_argument('--fine-tune-epochs', type=int, default=0, help='Mode features : passage final sur les images')
+parser.add_argument('--fine-tune-learning-rate', type=float, default=1e-5)
+args = parser.parse_args()
+
+# Décodage + redimensionnement une seule fois, mis à jour de façon incrémentale (voir prepare_dataset.py)
+stats = prepare("dataset", CACHE_DIR, img_size)
+print(f"Shards : {stats['total']} images ({stats['added']} nouvelle(s), {stats['removed']} retirée(s), "
+      f"{stats['dead_rows']} ligne(s) morte(s))")
 
 # Prétraitement et augmentation de données
 data_augmentation = tf.keras.Sequential([
@@ -15,67 +56,155 @@ data_augmentation = tf.keras.Sequential([
     layers.RandomContrast(0.2),
 ])
 
-train_ds = tf.keras.utils.image_dataset_from_directory(
-    "dataset",
-    labels="inferred",
-    label_mode="binary",
-    image_size=img_size,
-    batch_size=batch_size,
-    shuffle=True,
-    validation_split=0.2,
-    subset="training",
-    seed=123
-)
-val_ds = tf.keras.utils.image_dataset_from_directory(
-    "dataset",
-    labels="inferred",
-    label_mode="binary",
-    image_size=img_size,
-    batch_size=batch_size,
-    shuffle=True,
-    validation_split=0.2,
-    subset="validation",
-    seed=123
-)
-
 # Prétraitement MobileNetV2
 preprocess_input = tf.keras.applications.mobilenet_v2.preprocess_input
 
 AUTOTUNE = tf.data.AUTOTUNE
-train_ds = train_ds.map(lambda x, y: (preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
-val_ds = val_ds.map(lambda x, y: (preprocess_input(x), y), num_parallel_calls=AUTOTUNE)
+
+
+def shard_dataset(subset, training):
+    """Flux tf.data depuis les shards : cache des pixels, augmentation parallèle et prefetch."""
+    shards, rows, labels, class_names, _ = load_split(CACHE_DIR, subset)
+    shard_index = [s for s, _ in rows]
+    row_index = [r for _, r in rows]
+
+    def load(s, r):
+        return shards[s][r]
+
+    ds = tf.data.Dataset.from_tensor_slices((shard_index, row_index, labels))
+    ds = ds.map(lambda s, r, y: (tf.ensure_shape(tf.numpy_function(load, [s, r], tf.uint8), img_size[::-1] + (3,)), y),
+                num_parallel_calls=AUTOTUNE)
+    if len(rows) * img_size[0] * img_size[1] * 3 <= CACHE_MEMORY_BYTES:
+        ds = ds.cache()
+    if training:
+        ds = ds.shuffle(len(rows), seed=123, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    if training:
+        # Random augmentation must stay after the cache: new transforms every epoch
+        ds = ds.map(lambda x, y: (data_augmentation(tf.cast(x, tf.float32), training=True), y),
+                    num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda x, y: (preprocess_input(tf.cast(x, tf.float32)), tf.expand_dims(y, -1)),
+                num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE), len(rows), class_names
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Durée et débit de chaque époque (le décodage des images n'en fait plus partie)."""
+
+    def __init__(self, images):
+        super().__init__()
+        self.images = images
+        self.seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._start
+        self.seconds.append(seconds)
+        print(f"Epoch {epoch+1}: {seconds:.1f}s ({self.images / seconds:.1f} images/s)")
+
+
+class BestModelSaver(tf.keras.callbacks.Callback):
+    """Sauvegarde ``target`` (le modèle complet, dont le modèle entraîné partage les couches)
+    à chaque amélioration de ``monitor`` ; ``best_weights`` garde les poids correspondants."""
+
+    def __init__(self, target, path, monitor="val_accuracy"):
+        super().__init__()
+        self.target = target
+        self.path = path
+        self.monitor = monitor
+        self.best = -np.inf
+        self.best_weights = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        value = (logs or {}).get(self.monitor)
+        if value is None or value <= self.best:
+            return
+        print(f"Epoch {epoch+1}: {self.monitor} {self.best:.4f} -> {value:.4f}, modèle complet sauvegardé sous {self.path}")
+        self.best = value
+        self.best_weights = self.target.get_weights()
+        self.target.save(self.path)
+
+
+def split_backbone(backbone, trainable_layers):
+    """Sépare le backbone en (partie gelée, partie entraînable) au tenseur d'entrée des
+    ``trainable_layers`` dernières couches. La partie entraînable réutilise les mêmes
+    couches (mêmes poids) que ``backbone``."""
+    cut = backbone.layers[-trainable_layers - 1]
+    frozen = models.Model(backbone.input, cut.output, name="frozen_backbone")
+    features = layers.Input(shape=cut.output.shape[1:], name="bottleneck")
+    tensors = {id(cut.output): features}
+    for layer in backbone.layers[-trainable_layers:]:
+        inbound = layer.input
+        # MobileNetV2 residual blocks (Add) take a list of tensors
+        outputs = layer([tensors[id(t)] for t in inbound] if isinstance(inbound, list) else tensors[id(inbound)])
+        tensors[id(layer.output)] = outputs
+    return frozen, models.Model(features, outputs, name="trainable_backbone"), cut.name
+
+
+def feature_dataset(frozen, cut_name, subset, views, training):
+    """Activations de la partie gelée, calculées une fois par (image, vue) et mises en cache sur disque."""
+    shards, rows, labels, _, hashes = load_split(CACHE_DIR, subset)
+    cache_dir = os.path.join(CACHE_DIR, "features", f"mobilenetv2-imagenet-{cut_name}-{img_size[0]}x{img_size[1]}")
+    os.makedirs(cache_dir, exist_ok=True)
+    views = views if training else 1  # validation: the unaugmented view only
+
+    paths, targets, missing = [], [], []
+    for (s, r), label, sha256 in zip(rows, labels, hashes):
+        for view in range(views):
+            path = os.path.join(cache_dir, f"{sha256}.{view}.npy")
+            paths.append(path)
+            targets.append(label)
+            if not os.path.exists(path):
+                missing.append((path, shards[s][r], view))
+
+    start = time.perf_counter()
+    for i in range(0, len(missing), batch_size):
+        chunk = missing[i:i + batch_size]
+        pixels = tf.cast(np.stack([arr for _, arr, _ in chunk]), tf.float32)
+        augmented = data_augmentation(pixels, training=True)
+        # View 0 is the image itself; the others are fixed random augmentations
+        pixels = tf.where(tf.reshape([view > 0 for _, _, view in chunk], (-1, 1, 1, 1)), augmented, pixels)
+        activations = frozen(preprocess_input(pixels), training=False).numpy().astype(np.float16)
+        for (path, _, _), activation in zip(chunk, activations):
+            np.save(f"{path}.tmp.npy", activation)
+            os.replace(f"{path}.tmp.npy", path)
+    if missing:
+        print(f"{subset} : {len(missing)} activation(s) calculée(s) en {time.perf_counter() - start:.1f}s "
+              f"({len(paths) - len(missing)} en cache)")
+
+    shape = frozen.output.shape[1:]
+    ds = tf.data.Dataset.from_tensor_slices((paths, np.asarray(targets, dtype=np.float32)))
+    ds = ds.map(lambda p, y: (tf.ensure_shape(tf.numpy_function(lambda f: np.load(f.decode()), [p], tf.float16), shape), y),
+                num_parallel_calls=AUTOTUNE).cache()
+    if training:
+        ds = ds.shuffle(len(paths), seed=123, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(lambda x, y: (tf.cast(x, tf.float32), tf.expand_dims(y, -1)),
+                                  num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE), len(paths)
+
 
 # Base MobileNetV2
 
 base_model = MobileNetV2(input_shape=(224, 224, 3), include_top=False, weights="imagenet")
 # Fine-tuning : on débloque les 20 dernières couches
-for layer in base_model.layers[:-20]:
+for layer in base_model.layers[:-TRAINABLE_LAYERS]:
     layer.trainable = False
-for layer in base_model.layers[-20:]:
+for layer in base_model.layers[-TRAINABLE_LAYERS:]:
     layer.trainable = True
 
-model = models.Sequential([
-    data_augmentation,
-    base_model,
+# The head layers are shared by the full model and the bottleneck model (same weights)
+head = [
     layers.GlobalAveragePooling2D(),
     layers.Dense(64, activation="relu"),
     layers.Dropout(0.2),
-    layers.Dense(1, activation="sigmoid")
-])
+    layers.Dense(1, activation="sigmoid"),
+]
 
-model.compile(
-    optimizer="adam",
-    loss="binary_crossentropy",
-    metrics=["accuracy"]
-)
+# The augmentation runs in the input pipeline (parallel map), not in the model
+model = models.Sequential([base_model] + head)
 
-checkpoint = ModelCheckpoint(
-    "best_model.h5",
-    monitor="val_accuracy",
-    save_best_only=True,
-    mode="max",
-    verbose=1
-)
 early_stop = EarlyStopping(
     monitor="val_accuracy",
     patience=5,
@@ -84,13 +213,69 @@ early_stop = EarlyStopping(
     verbose=1
 )
 
-history = model.fit(
-    train_ds,
-    validation_data=val_ds,
-    epochs=50,
-    callbacks=[checkpoint, early_stop]
-)
-print("Historique d'entraînement :")
-for i, (acc, val_acc) in enumerate(zip(history.history['accuracy'], history.history['val_accuracy'])):
-    print(f"Epoch {i+1}: accuracy={acc:.2f}, val_accuracy={val_acc:.2f}")
+if args.mode == "features":
+    frozen, trainable_backbone, cut_name = split_backbone(base_model, TRAINABLE_LAYERS)
+    train_ds, n_train = feature_dataset(frozen, cut_name, "training", args.feature_views, training=True)
+    val_ds, n_val = feature_dataset(frozen, cut_name, "validation", 1, training=False)
+    print(f"Mode features (coupe après {cut_name}) : {n_train} exemples d'entraînement, {n_val} de validation")
+
+    features_model = models.Sequential([trainable_backbone] + head)
+    features_model.compile(
+        optimizer=tf.keras.optimizers.Adam(args.learning_rate),
+        loss="binary_crossentropy",
+        metrics=["accuracy"]
+    )
+    timer = EpochTimer(n_train)
+    # Weights are shared: saving the full model on each improvement writes the best epoch,
+    # whether or not EarlyStopping triggers
+    saver = BestModelSaver(model, "best_model.h5")
+    history = features_model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.epochs,
+        callbacks=[saver, early_stop, timer]
+    )
+    best_val_accuracy = None
+    if saver.best_weights is not None:
+        model.set_weights(saver.best_weights)  # the fine-tune pass starts from the best epoch
+        best_val_accuracy = saver.best
+    print("Historique d'entraînement (features) :")
+    for i, (acc, val_acc, seconds) in enumerate(zip(history.history['accuracy'], history.history['val_accuracy'], timer.seconds)):
+        print(f"Epoch {i+1}: accuracy={acc:.2f}, val_accuracy={val_acc:.2f}, {seconds:.1f}s")
+    epochs, learning_rate = args.fine_tune_epochs, args.fine_tune_learning_rate
+else:
+    epochs, learning_rate = args.epochs, args.learning_rate
+    best_val_accuracy = None
+
+if epochs > 0:
+    train_ds, n_train, class_names = shard_dataset("training", training=True)
+    val_ds, n_val, _ = shard_dataset("validation", training=False)
+    print(f"Classes : {class_names} ; {n_train} images d'entraînement, {n_val} de validation")
+
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate),
+        loss="binary_crossentropy",
+        metrics=["accuracy"]
+    )
+
+    checkpoint = ModelCheckpoint(
+        "best_model.h5",
+        monitor="val_accuracy",
+        save_best_only=True,
+        mode="max",
+        # Fine-tune pass: best_model.h5 is only replaced if it beats the features-mode best
+        initial_value_threshold=best_val_accuracy,
+        verbose=1
+    )
+    timer = EpochTimer(n_train)
+
+    history = model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=epochs,
+        callbacks=[checkpoint, early_stop, timer]
+    )
+    print("Historique d'entraînement :")
+    for i, (acc, val_acc, seconds) in enumerate(zip(history.history['accuracy'], history.history['val_accuracy'], timer.seconds)):
+        print(f"Epoch {i+1}: accuracy={acc:.2f}, val_accuracy={val_acc:.2f}, {seconds:.1f}s")
 print("Meilleur modèle MobileNetV2 sauvegardé sous 'best_model.h5' !")